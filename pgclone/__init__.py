@@ -1,7 +1,8 @@
+from pgclone.clone_cmd import clone
 from pgclone.copy_cmd import copy
-from pgclone.dump_cmd import dump
+from pgclone.dump_cmd import dump, dump_schemas
 from pgclone.ls_cmd import ls
-from pgclone.restore_cmd import restore
+from pgclone.restore_cmd import restore, restore_many
 from pgclone.version import __version__
 
-__all__ = ["copy", "dump", "ls", "restore", "__version__"]
+__all__ = ["clone", "copy", "dump", "dump_schemas", "ls", "restore", "restore_many", "__version__"]
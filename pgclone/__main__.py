@@ -0,0 +1,4 @@
+from pgclone import cli
+
+if __name__ == "__main__":  # pragma: no cover
+    cli.main()
@@ -0,0 +1,382 @@
+"""
+Progressive restores.
+
+Progressive restores defer the data of large tables, such as append-only event
+logs, until after the restored database is swapped in. Foreign keys of or to the
+deferred tables are re-created once every table is backfilled. The archive is
+spooled under `settings.PGCLONE_SPOOL_DIR` along with a state file that records
+which tables are backfilled so that interrupted backfills can be resumed.
+"""
+
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Union
+
+from django.apps import apps
+from django.db import connections
+
+from pgclone import (
+    db,
+    download,
+    exceptions,
+    hooks,
+    jobs,
+    logging,
+    options,
+    provenance,
+    run,
+    settings,
+    spans,
+    tenants,
+)
+
+# "<id>; <oid> <oid> <DESC> <rest>" lines of `pg_restore -l` for table data and
+# foreign keys. Names in the rest of the line are not quoted
+_TOC_LINE_RE = re.compile(r"^\d+; \d+ \d+ (?P<desc>TABLE DATA|FK CONSTRAINT) (?P<rest>.*)$")
+# An identifier of SQL, which is double-quoted when needed
+_IDENT = r'(?:"(?:[^"]|"")*"|[^\s".(]+)'
+# Foreign keys as written by `pg_restore -f -`, e.g.
+# "ALTER TABLE ONLY public.orders ADD CONSTRAINT orders_fk FOREIGN KEY (event_id)
+# REFERENCES public.events(id);"
+_FK_SQL_RE = re.compile(
+    rf"ALTER TABLE (?:ONLY )?(?P<table>{_IDENT}\.{_IDENT})\s+ADD CONSTRAINT {_IDENT}"
+    rf' FOREIGN KEY \((?:"(?:[^"]|"")*"|[^)"])*\) REFERENCES (?P<references>{_IDENT}\.{_IDENT})\('
+)
+
+
+def _state_dir(restore_db):
+    spool_dir = settings.spool_dir() or tempfile.gettempdir()
+    return os.path.join(spool_dir, f"pgclone-backfill-{restore_db['NAME']}")
+
+
+def _state_path(restore_db):
+    return os.path.join(_state_dir(restore_db), "state.json")
+
+
+def _table_name(target):
+    """Return the table name of a model label or table name"""
+    try:
+        return apps.get_model(target)._meta.db_table
+    except (LookupError, ValueError):
+        return target
+
+
+def _parse_name(name):
+    """
+    Split a table name that is optionally schema-qualified and double-quoted into
+    its schema, or None if it's unqualified, and table
+    """
+    match = re.fullmatch(rf"(?:(?P<schema>{_IDENT})\.)?(?P<table>{_IDENT})", name)
+    if not match:
+        return None, name
+
+    schema, table = (
+        part[1:-1].replace('""', '"') if part and part.startswith('"') else part
+        for part in match.group("schema", "table")
+    )
+    return schema, table
+
+
+def _deferred_table(toc_line, tables):
+    """
+    Return the schema and table of a line of `pg_restore -l` if it's the data of a
+    deferred table. Lines are formatted as "<id>; <oid> <oid> TABLE DATA <schema>
+    <table> <owner>" without quoting, so names may contain spaces and every split
+    of the line is tried against the deferred tables
+    """
+    match = _TOC_LINE_RE.match(toc_line)
+    if not match or match.group("desc") != "TABLE DATA":
+        return None
+
+    rest = match.group("rest") + " "
+    for schema, table in tables:
+        if schema is not None:
+            if rest.startswith(f"{schema} {table} "):
+                return schema, table
+        else:
+            for split in re.finditer(" ", rest):
+                if rest[split.end() :].startswith(f"{table} "):
+                    return rest[: split.start()], table
+
+    return None
+
+
+def _deferred_constraints(toc, *, deferred, archive_path, state_dir):
+    """
+    Return the foreign key lines of `pg_restore -l` that reference or belong to a
+    deferred table. Their definitions are read from the archive with
+    `pg_restore -f -`, which writes the entries of a list in order
+    """
+    fk_lines = [
+        line
+        for line in toc
+        if _TOC_LINE_RE.match(line) and _TOC_LINE_RE.match(line).group("desc") == "FK CONSTRAINT"
+    ]
+    if not fk_lines or not deferred:
+        return []
+
+    fk_list_path = os.path.join(state_dir, "fk.list")
+    with open(fk_list_path, "w") as f:
+        f.write("\n".join(fk_lines) + "\n")
+
+    sql = subprocess.run(
+        ["pg_restore", "-f", "-", "-L", fk_list_path, archive_path],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    os.remove(fk_list_path)
+
+    definitions = re.split(r"^-- Name: .*; Type: FK CONSTRAINT; .*$", sql, flags=re.MULTILINE)[1:]
+    constraints = []
+    for line, definition in zip(fk_lines, definitions):
+        match = _FK_SQL_RE.search(definition)
+        if match and (
+            _parse_name(match.group("table")) in deferred
+            or _parse_name(match.group("references")) in deferred
+        ):
+            constraints.append(line)
+
+    return constraints
+
+
+def _write_state(restore_db, state):
+    # Write atomically so that an interrupted backfill never corrupts the state
+    tmp_path = _state_path(restore_db) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, _state_path(restore_db))
+
+
+def clear(restore_db):
+    """Remove the backfill state of a database"""
+    shutil.rmtree(_state_dir(restore_db), ignore_errors=True)
+
+
+def prepare(
+    dump_key,
+    *,
+    file_path,
+    storage_client,
+    tables,
+    restore_db,
+    pre_swap_hooks=(),
+    schemas=(),
+    exclude_schemas=(),
+):
+    """
+    Spool the archive and write TOC lists for restoring everything but the
+    deferred table data and their foreign keys, for backfilling every deferred
+    table and for re-creating the foreign keys afterwards. Only the matching
+    schemas are restored and backfilled. The pre-swap hooks run again after
+    every table is backfilled.
+
+    Returns:
+        The paths of the spooled archive and the TOC list of the initial restore.
+    """
+    clear(restore_db)
+    state_dir = _state_dir(restore_db)
+    os.makedirs(state_dir)
+
+    archive_path = os.path.join(state_dir, "archive.dump")
+    logging.success_msg(f'Spooling "{dump_key}" for a progressive restore')
+    with spans.span("download", dump_key=dump_key) as download_span:
+        if settings.download_chunk_size():
+            with open(archive_path, "wb") as archive_f:
+                download.stream(storage_client, file_path, archive_f)
+        else:
+            run.shell(
+                f"{storage_client.pg_restore(file_path)} cat > {shlex.quote(archive_path)}",
+                env=storage_client.env,
+            )
+
+        download_span.set(bytes=storage_client.size(file_path))
+
+    toc = subprocess.run(
+        ["pg_restore", "-l", archive_path], capture_output=True, text=True, check=True
+    ).stdout.splitlines()
+    toc = tenants.filter_toc(toc, schemas=schemas, exclude_schemas=exclude_schemas)
+    tables = [_parse_name(_table_name(table)) for table in tables]
+
+    backfill = []
+    deferred = set()
+    deferred_lines = []
+    for line in toc:
+        schema_table = _deferred_table(line, tables)
+        if schema_table:
+            list_path = os.path.join(state_dir, f"backfill-{len(backfill)}.list")
+            with open(list_path, "w") as f:
+                f.write(line + "\n")
+
+            backfill.append({"table": ".".join(schema_table), "list": list_path})
+            deferred.add(schema_table)
+            deferred_lines.append(line)
+
+    constraints = _deferred_constraints(
+        toc, deferred=deferred, archive_path=archive_path, state_dir=state_dir
+    )
+    constraints_list_path = None
+    if constraints:
+        constraints_list_path = os.path.join(state_dir, "constraints.list")
+        with open(constraints_list_path, "w") as f:
+            f.write("\n".join(constraints) + "\n")
+
+    skipped = set(deferred_lines) | set(constraints)
+    restore_list_path = os.path.join(state_dir, "restore.list")
+    with open(restore_list_path, "w") as f:
+        f.write("\n".join(line for line in toc if line not in skipped) + "\n")
+
+    _write_state(
+        restore_db,
+        {
+            "dump_key": dump_key,
+            "archive": archive_path,
+            "pending": backfill,
+            "done": [],
+            "constraints": constraints_list_path,
+            "pre_swap_hooks": list(pre_swap_hooks),
+        },
+    )
+
+    return archive_path, restore_list_path
+
+
+def _read_state(restore_db):
+    if not os.path.exists(_state_path(restore_db)):
+        return None
+
+    with open(_state_path(restore_db)) as f:
+        return json.load(f)
+
+
+def is_pending(restore_db, *, dump_key):
+    """True if the restored database has an unfinished backfill of a dump"""
+    state = _read_state(restore_db)
+    return bool(state) and state["dump_key"] == dump_key
+
+
+def _run(restore_db, *, using):
+    """
+    Backfill the pending tables of the restored database. The lock of the
+    database is taken for every table, so a new restore can take over between
+    tables and discard the rest of the backfill
+    """
+    while True:
+        jobs.checkpoint("backfilling")
+        with db.lock(restore_db, using=using):
+            state = _read_state(restore_db)
+            if state is None:
+                return None
+            elif not state["pending"]:
+                if state.get("constraints"):
+                    logging.success_msg("Re-creating the foreign keys of the backfilled tables")
+                    run.shell(
+                        "pg_restore --single-transaction --no-acl --no-owner"
+                        f" -L {shlex.quote(state['constraints'])} -d {db.url(restore_db)}"
+                        f" {shlex.quote(state['archive'])}"
+                    )
+
+                provenance.record_backfill(restore_db, dump_key=state["dump_key"], using=using)
+                clear(restore_db)
+                return state["dump_key"]
+
+            entry = state["pending"][0]
+            num_tables = len(state["pending"]) + len(state["done"])
+            logging.success_msg(
+                f'Backfilling "{entry["table"]}"'
+                f" ({len(state['done']) + 1} of {num_tables} deferred tables)"
+            )
+
+            # Every table is restored in a single transaction so that an interrupted
+            # backfill leaves no partial data behind and can be safely resumed
+            with spans.span("backfill", table=entry["table"]) as backfill_span:
+                run.shell(
+                    "pg_restore --data-only --single-transaction --no-acl --no-owner"
+                    f" -L {shlex.quote(entry['list'])} -d {db.url(restore_db)}"
+                    f" {shlex.quote(state['archive'])}"
+                )
+            logging.success_msg(
+                f'Backfilled "{entry["table"]}" in {backfill_span.duration:.1f} seconds'
+            )
+
+            # Hooks that scrub data ran before the swap, so they run again to see
+            # the rows of the backfilled table
+            pre_swap_hooks = state.get("pre_swap_hooks", [])
+            with spans.span("hooks", count=len(pre_swap_hooks)):
+                hooks.execute(pre_swap_hooks, kind="pre_swap", database=restore_db, using=using)
+
+            state["done"].append(state["pending"].pop(0))
+            _write_state(restore_db, state)
+
+
+def _run_in_background(restore_db, *, using, logger):
+    try:
+        with logging.set_logger(logger):
+            _run(restore_db, using=using)
+    except Exception:
+        logger.exception('Backfill failed. Resume it with "pgclone backfill"')
+    finally:
+        connections.close_all()
+
+
+def start(restore_db, *, using):
+    """
+    Backfill the pending tables of the restored database in a background thread.
+    The thread isn't a daemon, so the process exits once the backfill finishes.
+
+    Returns:
+        The started thread.
+    """
+    thread = threading.Thread(
+        target=_run_in_background,
+        args=(restore_db,),
+        kwargs={"using": using, "logger": logging.get_logger()},
+        name="pgclone-backfill",
+    )
+    thread.start()
+    return thread
+
+
+def status(*, database: Union[str, None] = None) -> Union[dict, None]:
+    """
+    Get the status of the backfill of a progressive restore.
+
+    Args:
+        database: The restored database.
+
+    Returns:
+        None if there is no backfill. Otherwise the "dump_key" being restored
+        and the "pending" and "done" tables.
+    """
+    state = _read_state(db.conf(using=options.get(database=database).database))
+    if state is None:
+        return None
+
+    return {
+        "dump_key": state["dump_key"],
+        "pending": [entry["table"] for entry in state["pending"]],
+        "done": [entry["table"] for entry in state["done"]],
+    }
+
+
+def resume(*, database: Union[str, None] = None) -> Union[str, None]:
+    """
+    Resume the interrupted backfill of a progressive restore.
+
+    Args:
+        database: The restored database.
+
+    Returns:
+        The dump key that was backfilled or None if there was nothing to backfill.
+    """
+    if not settings.allow_restore():  # pragma: no cover
+        raise exceptions.RuntimeError("Restore not allowed.")
+
+    database = options.get(database=database).database
+    return _run(db.conf(using=database), using=database)
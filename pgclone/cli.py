@@ -0,0 +1,136 @@
+"""
+A lightweight command line interface for listing and dumping databases.
+
+`python -m pgclone` doesn't set up the apps of a Django project, so it starts
+much faster than `manage.py pgclone` in cron jobs and shell loops. Settings come
+from the `--settings` module, the `DJANGO_SETTINGS_MODULE` environment variable,
+or the `DATABASE_URL` and `PGCLONE_*` environment variables. Django apps are only
+set up when dumps run management command hooks or exclude models.
+"""
+
+import argparse
+import json
+import os
+import sys
+import urllib.parse
+
+import django
+from django.conf import settings as django_settings
+
+from pgclone import exclusions, hooks, options
+from pgclone.management.commands import pgclone as commands
+
+_SUBCOMMANDS = {"ls": commands.LsCommand, "dump": commands.DumpCommand}
+
+
+def _database_url_conf(url):
+    """Convert a postgres:// URL to a database configuration"""
+    parsed = urllib.parse.urlsplit(url)
+    return {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": urllib.parse.unquote(parsed.path[1:]),
+        "USER": urllib.parse.unquote(parsed.username or ""),
+        "PASSWORD": urllib.parse.unquote(parsed.password or ""),
+        "HOST": parsed.hostname or "",
+        "PORT": parsed.port or "",
+    }
+
+
+def _env_settings(environ):
+    """
+    Build minimal settings from the environment. `DATABASE_URL` configures the default
+    database and `DATABASE_URL_<ALIAS>` configures other databases. `PGCLONE_*`
+    variables are parsed as JSON when possible and used as strings otherwise
+    """
+    env_settings = {"DATABASES": {}}
+    for key, value in environ.items():
+        if key == "DATABASE_URL":
+            env_settings["DATABASES"]["default"] = _database_url_conf(value)
+        elif key.startswith("DATABASE_URL_"):
+            env_settings["DATABASES"][key[13:].lower()] = _database_url_conf(value)
+        elif key.startswith("PGCLONE_"):
+            try:
+                env_settings[key] = json.loads(value)
+            except ValueError:
+                env_settings[key] = value
+
+    return env_settings
+
+
+def _configure(settings_module):
+    """Configure settings without setting up Django apps"""
+    if settings_module:
+        os.environ["DJANGO_SETTINGS_MODULE"] = settings_module
+
+    if not django_settings.configured and not os.environ.get("DJANGO_SETTINGS_MODULE"):
+        django_settings.configure(**_env_settings(os.environ))
+
+
+def _has_model_labels(targets):
+    """
+    True if tables of rules may be model labels. Labels and schema-qualified tables
+    both have a dot, but there are no models to label without INSTALLED_APPS
+    """
+    return bool(django_settings.INSTALLED_APPS) and any("." in target for target in targets)
+
+
+def _needs_apps(subcommand, args):
+    """
+    Management command hooks, model and app excludes and partition and scrub rules
+    of models need the Django apps
+    """
+    if subcommand != "dump":
+        return False
+
+    opts = options.get(
+        exclude=args["exclude"],
+        keep_partitions=args["keep_partitions"],
+        pre_dump_hooks=args["pre_dump_hooks"],
+        config=args["config"],
+    )
+    return (
+        any(not exclusions.is_pattern(rule) for rule in opts.exclude)
+        or any(not hook["hook"].startswith("sql:") for hook in hooks._parse(opts.pre_dump_hooks))
+        or (isinstance(opts.keep_partitions, dict) and _has_model_labels(opts.keep_partitions))
+        or _has_model_labels(opts.scrub)
+    )
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog="pgclone", description="List and dump databases without setting up Django apps."
+    )
+    parser.add_argument(
+        "--settings",
+        help=(
+            "The settings module, such as a minimal one with DATABASES and PGCLONE_* settings."
+            " Defaults to DJANGO_SETTINGS_MODULE or the DATABASE_URL and PGCLONE_*"
+            " environment variables."
+        ),
+    )
+    subparsers = parser.add_subparsers(dest="subcommand", title="subcommands")
+    subparsers.required = True
+    for name, command_class in _SUBCOMMANDS.items():
+        command_class().add_arguments(subparsers.add_parser(name))
+
+    return parser
+
+
+def main(argv=None):
+    """Run the lightweight command line interface"""
+    args = vars(_parser().parse_args(argv))
+    subcommand = args.pop("subcommand")
+    _configure(args.pop("settings"))
+
+    if _needs_apps(subcommand, args):
+        if not django_settings.INSTALLED_APPS:
+            sys.stderr.write(
+                "Hooks that are management commands and excluded models require"
+                " a settings module with INSTALLED_APPS.\n"
+            )
+            sys.exit(1)
+
+        django.setup()
+
+    # Subcommands handle pgclone errors by exiting with an error message
+    return _SUBCOMMANDS[subcommand]().handle(**args)
@@ -0,0 +1,130 @@
+import shlex
+from typing import List, Union
+
+from django.apps import apps
+from django.conf import settings as django_settings
+
+from pgclone import db, exceptions, logging, options, restore_cmd, settings, spans
+
+
+def _source_url(source, *, database):
+    """Return the database URL of a source database alias or URL"""
+    if source in django_settings.DATABASES:
+        source_db = db.conf(using=source)
+        if source_db == db.conf(using=database):
+            raise exceptions.RuntimeError("Clone source cannot be the same as the database.")
+
+        return db.url(source_db)
+    elif source.startswith(("postgres://", "postgresql://")):
+        return shlex.quote(source)
+    else:
+        raise exceptions.ValueError(
+            f'Clone source "{source}" must be a database from settings.DATABASES'
+            " or a postgres:// URL."
+        )
+
+
+def _clone(*, source, exclude, pre_swap_hooks, config, reversible, database, jobs, analyze=False):
+    """
+    Clone implementation
+    """
+    if not settings.allow_restore():  # pragma: no cover
+        raise exceptions.RuntimeError("Restore not allowed.")
+
+    if not source:
+        raise exceptions.ValueError("Must provide a source database to clone.")
+
+    source_url = _source_url(source, database=database)
+    restore_cmd._validate(restore_cmd.CLONE_DUMP_KEY, database=database)
+    restore_db, temp_db, _, _, _ = restore_cmd._restore_dbs(database)
+    exclude_tables = [apps.get_model(model)._meta.db_table for model in exclude]
+
+    with db.lock(restore_db, using=database):
+        # Stream the source directly into the temp database instead of
+        # round-tripping through a storage location
+        restore_cmd._create_temp_db(temp_db, dump_key=restore_cmd.CLONE_DUMP_KEY, using=database)
+        with spans.span("transfer") as transfer_span:
+            db.transfer(
+                source_url,
+                temp_db,
+                jobs=jobs,
+                pg_dump_args=" ".join(f"--exclude-table-data={table}" for table in exclude_tables),
+            )
+            transfer_span.set(bytes=db.size(temp_db, using=database), rows=db.rows(temp_db))
+
+        restore_cmd._mark(
+            temp_db, dump_key=restore_cmd.CLONE_DUMP_KEY, phase="restored", using=database
+        )
+        restore_cmd._swap(
+            dump_key=restore_cmd.CLONE_DUMP_KEY,
+            pre_swap_hooks=pre_swap_hooks,
+            reversible=reversible,
+            is_local_restore=False,
+            database=database,
+            analyze=analyze,
+            num_jobs=jobs,
+        )
+
+    logging.success_msg(f'Successfully cloned into database "{database}"')
+
+    return source
+
+
+def clone(
+    source: Union[str, None] = None,
+    *,
+    exclude: Union[List[str], None] = None,
+    pre_swap_hooks: Union[List[str], None] = None,
+    reversible: Union[bool, None] = None,
+    database: Union[str, None] = None,
+    jobs: Union[int, None] = None,
+    analyze: Union[bool, None] = None,
+    config: Union[str, None] = None,
+) -> spans.Result:
+    """
+    Clones another database directly into a database without using a storage location.
+
+    The clone goes through the same restore process as `restore`, running pre-swap
+    hooks on a temporary database before swapping it in.
+
+    Args:
+        source: The database alias from `settings.DATABASES` or the postgres:// URL
+            of the database to clone.
+        exclude: The models to exclude when cloning.
+        pre_swap_hooks: The list of pre-swap hooks to run before swapping the temp restore
+            database with the main database. The strings are management command names.
+        reversible: True if the clone can be reversed.
+        database: The database to restore the clone to.
+        jobs: The number of parallel jobs to use. When greater than one, the clone is
+            spooled locally in directory format. Also used when analyzing.
+        analyze: Rebuild planner statistics before swapping in the cloned database.
+        config: The configuration name from `settings.PGCLONE_CONFIGS`.
+
+    Returns:
+        The source that was cloned. The result is a string that also has the
+        `timings` and `spans` of every phase of the clone.
+    """
+    opts = options.get(
+        source=source,
+        exclude=exclude,
+        pre_swap_hooks=pre_swap_hooks,
+        config=config,
+        reversible=reversible,
+        database=database,
+        jobs=jobs,
+        analyze=analyze,
+    )
+
+    with spans.operation("clone", database=opts.database) as operation:
+        source = _clone(
+            source=opts.source,
+            exclude=opts.exclude,
+            pre_swap_hooks=opts.pre_swap_hooks,
+            config=opts.config,
+            reversible=opts.reversible,
+            database=opts.database,
+            jobs=opts.jobs,
+            analyze=opts.analyze,
+        )
+
+    return spans.Result(source, operation)
@@ -1,15 +1,117 @@
+import re
 from typing import Union
 
-from pgclone import db, exceptions, logging, options, settings
+from django import db as django_db
 
+from pgclone import db, exceptions, logging, options, restore_cmd, settings, spans
 
-def _copy(*, dump_key, database):
+STRATEGIES = ("auto", "template", "wal_log", "file_copy", "clone", "dump")
+
+# Errors of servers and file systems that can't clone files. Other errors, such as
+# running out of disk space, aren't fixed by another strategy and are raised
+_CLONE_UNSUPPORTED_RE = re.compile(
+    r"not supported on this platform"
+    r"|could not clone file .*: (Operation not supported|Invalid cross-device link)"
+)
+
+
+def _auto_strategy(source_db, *, using):
+    """
+    Pick a copy strategy based on the server version and the database size.
+
+    Small databases are copied with a template, which only blocks clients for
+    a short time. Larger databases are cloned when the server can clone files
+    and are otherwise dumped and restored in parallel so that connections to the
+    source database are never terminated.
+    """
+    server_version = db.server_version(using=using)
+    if db.size(source_db, using=using) > settings.copy_template_max_size():
+        return "clone" if server_version >= 180000 else "dump"
+    elif server_version >= 150000:
+        return "wal_log"
+    else:
+        return "template"
+
+
+def _template_sql(source_db, target_db, *, strategy, using):
+    """Returns the CREATE DATABASE ... TEMPLATE statement of a template strategy"""
+    copy_db_sql = f'CREATE DATABASE "{target_db["NAME"]}" WITH TEMPLATE "{source_db["NAME"]}"'
+
+    if strategy in ("wal_log", "file_copy", "clone"):
+        if db.server_version(using=using) < 150000:  # pragma: no cover
+            raise exceptions.RuntimeError(f'The "{strategy}" strategy requires Postgres 15+.')
+
+        copy_db_sql += " STRATEGY WAL_LOG" if strategy == "wal_log" else " STRATEGY FILE_COPY"
+
+    return copy_db_sql
+
+
+def _template_copy(source_db, target_db, *, strategy, using):
+    """Copies a database with CREATE DATABASE ... TEMPLATE"""
+    copy_db_sql = _template_sql(source_db, target_db, strategy=strategy, using=using)
+    db.psql(copy_db_sql, using=using, kill_connections=source_db)
+
+
+def _clone_copy(source_db, target_db, *, using):
+    """
+    Copies a database by cloning its files with `file_copy_method = clone`.
+    Returns False if the file system doesn't support cloning files
+    """
+    if db.server_version(using=using) < 180000:
+        raise exceptions.RuntimeError('The "clone" strategy requires Postgres 18+.')
+
+    copy_db_sql = _template_sql(source_db, target_db, strategy="clone", using=using)
+
+    # The statement runs over a connection so that its error can be inspected
+    conn_db = db.conn(using=using)
+    conn_db["OPTIONS"]["options"] = " ".join(
+        [conn_db["OPTIONS"].get("options", ""), "-c file_copy_method=clone"]
+        + [
+            f"-c {name}={value}"
+            for name, value in [
+                ("statement_timeout", settings.statement_timeout()),
+                ("lock_timeout", settings.lock_timeout()),
+            ]
+            if value is not None
+        ]
+    ).strip()
+
+    db.psql("SELECT 1", using=using, kill_connections=source_db)
+    try:
+        db.execute(copy_db_sql, database=conn_db)
+    except django_db.DatabaseError as exc:
+        if not _CLONE_UNSUPPORTED_RE.search(str(exc)):
+            raise
+
+        db.drop(target_db, using=using)
+        return False
+
+    return True
+
+
+def _dump_copy(source_db, target_db, *, jobs, using):
+    """
+    Copies a database with pg_dump and pg_restore. pg_dump uses a consistent snapshot,
+    so connections to the source database don't need to be terminated
+    """
+    create_db_sql = f'CREATE DATABASE "{target_db["NAME"]}"'
+    db.psql(create_db_sql, using=using)
+    restore_cmd._set_search_path(target_db, using=using)
+    db.transfer(db.url(source_db), target_db, jobs=jobs)
+
+
+def _copy(*, dump_key, database, strategy="template", jobs=1):
     """
     Copy implementation
     """
     if not settings.allow_copy():  # pragma: no cover
         raise exceptions.RuntimeError("Copy not allowed.")
 
+    if strategy not in STRATEGIES:
+        raise exceptions.ValueError(
+            f'"{strategy}" is not a valid copy strategy. Use one of {", ".join(STRATEGIES)}.'
+        )
+
     source_db = db.conf(using=database)
 
     if not dump_key.startswith(":"):  # pragma: no cover
@@ -25,10 +127,29 @@ def _copy(*, dump_key, database):
     if source_db == target_db:  # pragma: no cover
         raise exceptions.RuntimeError("Target database cannot be the same as source database.")
 
-    logging.success_msg("Creating copy")
-    db.drop(target_db, using=database)
-    copy_db_sql = f'CREATE DATABASE "{target_db["NAME"]}" WITH TEMPLATE "{source_db["NAME"]}"'
-    db.psql(copy_db_sql, using=database, kill_connections=source_db)
+    is_auto = strategy == "auto"
+    if is_auto:
+        strategy = _auto_strategy(source_db, using=database)
+
+    logging.success_msg(f'Creating copy using the "{strategy}" strategy')
+    with spans.span("drop"):
+        db.drop(target_db, using=database)
+
+    with spans.span("copy", strategy=strategy) as copy_span:
+        if strategy == "clone" and not _clone_copy(source_db, target_db, using=database):
+            # Databases that "auto" picked for cloning are too large to copy with a lock
+            strategy = "dump" if is_auto else "file_copy"
+            logging.success_msg(
+                f'File system does not support cloning. Using the "{strategy}" strategy'
+            )
+            copy_span.set(strategy=strategy)
+
+        if strategy == "dump":
+            _dump_copy(source_db, target_db, jobs=jobs, using=database)
+        elif strategy != "clone":
+            _template_copy(source_db, target_db, strategy=strategy, using=database)
+
+        copy_span.set(bytes=db.size(target_db, using=database), rows=db.rows(target_db))
 
     logging.success_msg(f'Successfully copied database "{database}" to "{dump_key}"')
 
@@ -36,28 +157,61 @@ def _copy(*, dump_key, database):
 
 
 def copy(
-    dump_key: str, *, database: Union[str, None] = None, config: Union[str, None] = None
-) -> str:
+    dump_key: str,
+    *,
+    database: Union[str, None] = None,
+    strategy: Union[str, None] = None,
+    jobs: Union[int, None] = None,
+    config: Union[str, None] = None,
+) -> spans.Result:
     """
-    Copies a database using `CREATE DATABASE <dump_key> TEMPLATE <database>`.
+    Copies a database to a local database.
 
     Note that we use dump keys with the same syntax that `dump` and `restore`
     commands take. Since `copy` only works with local database copies, this
     means the dump keys are always the database name prefixed with `:`.
 
+    The copy strategy is one of:
+
+    - `template`: `CREATE DATABASE <dump_key> TEMPLATE <database>`.
+    - `wal_log`: A template copy using `STRATEGY WAL_LOG` (Postgres 15+).
+    - `file_copy`: A template copy using `STRATEGY FILE_COPY` (Postgres 15+).
+    - `clone`: A `file_copy` copy that clones files with `file_copy_method = clone`
+      (Postgres 18+), falling back to copying them when the file system doesn't
+      support it.
+    - `dump`: A parallel, snapshot-consistent `pg_dump` and `pg_restore` that never
+      terminates connections to the copied database.
+    - `auto`: Uses `wal_log` or `template` for small databases. Databases larger than
+      `settings.PGCLONE_COPY_TEMPLATE_MAX_SIZE` use `clone` on Postgres 18+, falling
+      back to `dump` when the file system doesn't support cloning, and `dump` otherwise.
+
     Args:
         dump_key: A name to use for the copy. Must be prefixed with `:` and only
             consist of valid database name characters.
         database: The database to copy.
+        strategy: The copy strategy. Defaults to `settings.PGCLONE_COPY_STRATEGY`, which
+            is `template`.
+        jobs: The number of parallel jobs to use for the `dump` strategy.
         config: The configuration name from `settings.PGCLONE_CONFIGS`.
 
     Returns:
-        The dump key that was copied.
+        The dump key that was copied. The result is a string that also has the
+        `timings` and `spans` of every phase of the copy.
     """
     opts = options.get(
         dump_key=dump_key,
         config=config,
         database=database,
+        copy_strategy=strategy,
+        jobs=jobs,
     )
 
-    return _copy(dump_key=opts.dump_key, database=opts.database)
+    with spans.operation("copy", database=opts.database) as operation:
+        dump_key = _copy(
+            dump_key=opts.dump_key,
+            database=opts.database,
+            strategy=opts.copy_strategy,
+            jobs=opts.jobs,
+        )
+
+    return spans.Result(dump_key, operation)
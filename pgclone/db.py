@@ -1,6 +1,7 @@
 import contextlib
 import copy
 import functools
+import os
 import shlex
 import tempfile
 import textwrap
@@ -10,7 +11,7 @@ from django.conf import settings as django_settings
 from django.db import DEFAULT_DB_ALIAS, connections
 from django.db.utils import load_backend
 
-from pgclone import exceptions, run, settings
+from pgclone import exceptions, logging, run, settings
 
 
 def _no_queries_during_routing(execute, sql, params, many, context):  # pragma: no cover
@@ -104,6 +105,88 @@ def conn(*, using):
     return make(settings.conn_db(), using=using)
 
 
+def query(sql, params=None, *, database):
+    """Runs a query on a database and returns all of the resulting rows"""
+    connection = load_backend(database["ENGINE"]).DatabaseWrapper(database, "pgclone")
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+    finally:
+        connection.close()
+
+
+def execute(sql, params=None, *, database):
+    """Execute a statement in autocommit mode, such as one that can't run in a transaction"""
+    connection = load_backend(database["ENGINE"]).DatabaseWrapper(database, "pgclone")
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+    finally:
+        connection.close()
+
+
+@contextlib.contextmanager
+def lock(database, *, using):
+    """
+    Hold a session-level advisory lock for a database, serializing pgclone
+    operations on it across processes
+    """
+    lock_key = f"pgclone:{database['NAME']}"
+    conn_db = conn(using=using)
+    connection = load_backend(conn_db["ENGINE"]).DatabaseWrapper(conn_db, "pgclone")
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s))", [lock_key])
+            if not cursor.fetchone()[0]:  # pragma: no cover
+                logging.success_msg(
+                    f'Waiting for another pgclone operation on "{database["NAME"]}"'
+                )
+                cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", [lock_key])
+
+            try:
+                yield
+            finally:
+                cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", [lock_key])
+    finally:
+        connection.close()
+
+
+def server_version(*, using):
+    """Returns the integer version number of the Postgres server, e.g. 150004"""
+    return int(query("SHOW server_version_num", database=conn(using=using))[0][0])
+
+
+def size(database, *, using):
+    """Returns the size of a database in bytes"""
+    return query("SELECT pg_database_size(%s)", [database["NAME"]], database=conn(using=using))[0][
+        0
+    ]
+
+
+def rows(database):
+    """Returns the estimated number of rows in the user tables of a database"""
+    return query(
+        "SELECT COALESCE(SUM(n_live_tup), 0) FROM pg_stat_user_tables", database=database
+    )[0][0]
+
+
+def comment(database, *, using):
+    """Returns the comment of a database or None if it has no comment or doesn't exist"""
+    rows = query(
+        "SELECT shobj_description(oid, 'pg_database') FROM pg_database WHERE datname = %s",
+        [database["NAME"]],
+        database=conn(using=using),
+    )
+    return rows[0][0] if rows else None
+
+
+def set_comment(database, comment, *, using):
+    """Sets the comment of a database"""
+    comment = comment.replace("'", "''")
+    psql(f"""COMMENT ON DATABASE "{database['NAME']}" IS '{comment}'""", using=using)
+
+
 def url(db_config):
     """Convert a database dictionary config to a url"""
     user = urllib.parse.quote(db_config["USER"])
@@ -163,6 +246,43 @@ def psql(sql, *, using, ignore_errors=False, kill_connections=None):
         )
 
 
+def transfer(source_url, target, *, jobs=1, pg_dump_args=""):
+    """Streams a pg_dump of the source database URL directly into the target database.
+
+    With more than one job, a parallel directory-format dump is spooled
+    locally and restored with the same amount of parallel jobs. Otherwise
+    pg_dump is piped directly into pg_restore.
+    """
+    pg_dump_cmd_fmt = "pg_dump --no-acl --no-owner {db_dump_url} " + pg_dump_args
+    pg_restore_args = f"--verbose --no-acl --no-owner -d {url(target)}"
+
+    # Like restores, pg_restore errors are ignored since some databases
+    # (like Aurora) produce errors we cannot get around
+    if jobs > 1:
+        with tempfile.TemporaryDirectory(dir=settings.spool_dir()) as spool_dir:
+            spool_path = shlex.quote(os.path.join(spool_dir, "dump"))
+            pg_dump_cmd_fmt += f" -Fd -j {jobs} -f {spool_path}"
+            logging.success_msg(
+                f"Spooling DB copy with cmd: {pg_dump_cmd_fmt.format(db_dump_url='<DB_URL>')}"
+            )
+            run.shell(pg_dump_cmd_fmt.format(db_dump_url=source_url))
+
+            logging.success_msg(f"Running pg_restore with {jobs} jobs")
+            run.shell(f"pg_restore -j {jobs} {pg_restore_args} {spool_path}", ignore_errors=True)
+    else:
+        pg_dump_cmd_fmt += " -Fc"
+        logging.success_msg(
+            f"Streaming DB copy with cmd: {pg_dump_cmd_fmt.format(db_dump_url='<DB_URL>')}"
+            f" | pg_restore {pg_restore_args.replace(url(target), '<DB_URL>')}"
+        )
+        # Errors of pg_dump are never ignored so that a failed dump isn't swapped in
+        run.pipe(
+            pg_dump_cmd_fmt.format(db_dump_url=source_url),
+            f"pg_restore {pg_restore_args}",
+            ignore_consumer_errors=True,
+        )
+
+
 def drop(database, *, using):
     _kill_connections(database, using=using)
     drop_sql = f'DROP DATABASE IF EXISTS "{database["NAME"]}"'
@@ -0,0 +1,127 @@
+"""
+Resumable, chunked downloads of dumps.
+
+Dumps are downloaded in chunks with range requests, retrying every chunk on
+failure. Downloaded chunks are kept in `settings.PGCLONE_SPOOL_DIR` until the
+download finishes so that a rerun of a failed restore of the same dump only
+downloads the remaining chunks.
+"""
+
+import concurrent.futures
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from pgclone import exceptions, logging, settings
+
+# The maximum number of seconds to wait between retries of a chunk
+_MAX_BACKOFF = 30
+
+
+def _spool_dir(file_path):
+    spool_dir = settings.spool_dir() or tempfile.gettempdir()
+    file_hash = hashlib.sha1(file_path.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(spool_dir, f"pgclone-download-{file_hash}")
+
+
+def _prepare_spool(file_path, *, size, chunk_size):
+    """
+    Create the spool directory of a download, discarding chunks of a previous
+    download if the file or the chunk size changed
+    """
+    spool_dir = _spool_dir(file_path)
+    meta_path = os.path.join(spool_dir, "meta.json")
+    meta = {"file_path": file_path, "size": size, "chunk_size": chunk_size}
+
+    try:
+        with open(meta_path) as f:
+            if json.load(f) != meta:
+                shutil.rmtree(spool_dir)
+    except (OSError, ValueError):
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    if not os.path.exists(meta_path):
+        os.makedirs(spool_dir, exist_ok=True)
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+
+    return spool_dir
+
+
+def _download_chunk(storage_client, file_path, *, start, end, chunk_path, retries):
+    """Download a chunk to chunk_path, retrying failures. Finished chunks are skipped"""
+    if os.path.exists(chunk_path):
+        return False
+
+    part_path = chunk_path + ".part"
+    for attempt in range(retries + 1):
+        try:
+            storage_client.download_range(file_path, start, end, part_path)
+            if os.path.getsize(part_path) != end - start + 1:
+                raise exceptions.RuntimeError("Downloaded chunk is incomplete.")
+        except Exception as exc:
+            if attempt == retries:
+                raise exceptions.RuntimeError(
+                    f'Could not download bytes {start}-{end} of "{file_path}"'
+                    f" after {retries + 1} attempts."
+                ) from exc
+
+            time.sleep(min(2**attempt, _MAX_BACKOFF))
+        else:
+            # Chunks are only considered downloaded once they are complete
+            os.replace(part_path, chunk_path)
+            return True
+
+
+def stream(storage_client, file_path, out):
+    """
+    Download a file in chunks and write it to a binary file object, such as the
+    stdin of pg_restore. Chunks are downloaded in parallel ahead of the writer.
+    """
+    size = storage_client.size(file_path)
+    if size is None:
+        raise exceptions.RuntimeError(f'Could not determine the size of "{file_path}".')
+
+    chunk_size = settings.download_chunk_size()
+    spool_dir = _prepare_spool(file_path, size=size, chunk_size=chunk_size)
+    ranges = [(start, min(start + chunk_size, size) - 1) for start in range(0, size, chunk_size)]
+    chunk_paths = [os.path.join(spool_dir, f"{i}.chunk") for i in range(len(ranges))]
+    num_cached = sum(os.path.exists(chunk_path) for chunk_path in chunk_paths)
+    if num_cached:
+        logging.success_msg(
+            f"Resuming download of {file_path} from {num_cached} of {len(ranges)} chunks"
+        )
+
+    workers = settings.download_workers()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def submit(i):
+            return executor.submit(
+                _download_chunk,
+                storage_client,
+                file_path,
+                start=ranges[i][0],
+                end=ranges[i][1],
+                chunk_path=chunk_paths[i],
+                retries=settings.download_retries(),
+            )
+
+        # Only download a few chunks ahead of the writer to bound spool usage
+        # by chunks that were never written
+        futures = {i: submit(i) for i in range(min(workers * 2, len(ranges)))}
+        try:
+            for i in range(len(ranges)):
+                futures.pop(i).result()
+                if i + workers * 2 < len(ranges):
+                    futures[i + workers * 2] = submit(i + workers * 2)
+
+                with open(chunk_paths[i], "rb") as chunk_f:
+                    shutil.copyfileobj(chunk_f, out)
+        finally:
+            for future in futures.values():
+                future.cancel()
+
+    shutil.rmtree(spool_dir, ignore_errors=True)
@@ -1,56 +1,403 @@
+import concurrent.futures
 import datetime as dt
+import functools
+import json
 import os
 import re
-from typing import List, Union
+import shlex
+import subprocess
+import time
+from typing import Dict, List, Union
 
-from django.apps import apps
+from django.db import connections
 
-from pgclone import db, exceptions, logging, options, run, settings, storage
+from pgclone import (
+    db,
+    exceptions,
+    exclusions,
+    fingerprint,
+    hooks,
+    logging,
+    ls_cmd,
+    manifest,
+    options,
+    physical,
+    run,
+    scrub,
+    settings,
+    spans,
+    stats,
+    storage,
+    tenants,
+    throttle,
+)
 
 DT_FORMAT = "%Y-%m-%d-%H-%M-%S-%f"
 
+# The minimum seconds to wait for a replica to replay the changes of the primary
+_MIN_REPLAY_TIMEOUT = 60
 
-def _dump_key(*, instance, database, config):
-    """Obtain the key for the db dump"""
-    now = dt.datetime.utcnow().strftime(DT_FORMAT)
+
+def _dump_prefix(*, instance, database, config):
+    """Obtain the instance/database/config prefix of db dump keys"""
     instance = re.sub(r"[^a-zA-Z0-9_-]", "_", instance)
     database = re.sub(r"[^a-zA-Z0-9_-]", "_", database)
     config_name = re.sub(r"[^a-zA-Z0-9_-]", "_", config)
-    return os.path.join(instance, database, config_name, f"{now}.dump")
+    return os.path.join(instance, database, config_name, "")
 
 
-def _dump(*, exclude, config, pre_dump_hooks, instance, database, storage_location):
-    """Dump implementation"""
+def _dump_key(*, instance, database, config):
+    """Obtain the key for the db dump"""
+    now = dt.datetime.utcnow().strftime(DT_FORMAT)
+    return _dump_prefix(instance=instance, database=database, config=config) + f"{now}.dump"
+
+
+def _dump_options(**options):
+    """
+    Return the options that change the contents of a dump, normalized like they
+    are stored in manifests
+    """
+    return json.loads(json.dumps(options, sort_keys=True, default=list))
+
+
+def _unchanged_dump_key(dump_db, *, prefix, storage_client, dump_options, current=None):
+    """
+    Return the latest dump key of a prefix if the database hasn't changed since it
+    was dumped with the same options, comparing the fingerprint stored in its
+    manifest with the current fingerprint, which is collected unless provided.
+    Options are compared since dumps of the "none" config share a prefix no
+    matter how their options are overridden
+    """
+    dump_keys = ls_cmd.ls(
+        dump_key=prefix, storage_location=storage_client.storage_location, limit=1
+    )
+    if not dump_keys:
+        return None
+
+    previous_manifest = manifest.read(storage_client, dump_keys[0])
+    if previous_manifest.get("options") != dump_options:
+        return None
+
+    previous = previous_manifest.get("fingerprint")
+    current = current or fingerprint.collect(dump_db)
+    return None if fingerprint.changed(previous, current) else dump_keys[0]
+
+
+def _dumped_bytes(dump_db, *, excluded_tables, using, schemas=(), exclude_schemas=()):
+    """Return the size of the data that will be dumped"""
+    if not schemas and not exclude_schemas:
+        return db.size(dump_db, using=using) - sum(entry["bytes"] for entry in excluded_tables)
+
+    return tenants.size(schemas, exclude_schemas, database=dump_db) - sum(
+        entry["bytes"]
+        for entry in excluded_tables
+        if tenants.matches(entry["schema"], schemas=schemas, exclude_schemas=exclude_schemas)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _pg_dump_version():
+    """Return the major version of pg_dump"""
+    output = subprocess.run(
+        ["pg_dump", "--version"], capture_output=True, text=True, check=True
+    ).stdout
+    return int(re.search(r"(\d+)", output).group(1))
+
+
+def _statistics_args(analyze):
+    """Dump planner statistics when analyzing and pg_dump supports it"""
+    return "--statistics" if analyze and _pg_dump_version() >= 18 else ""
+
+
+def _replica_lag(source_db):
+    """
+    Return the replay lag of a replica in seconds. Replicas that replayed everything
+    they received, and databases that aren't replicas, have no lag
+    """
+    lag = db.query(
+        "SELECT CASE WHEN NOT pg_is_in_recovery()"
+        " OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+        " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END",
+        database=source_db,
+    )[0][0]
+    return float(lag)
+
+
+def _has_replayed(source_db, *, lsn):
+    """
+    True if a replica replayed the WAL of its primary up to a location. Databases
+    that aren't replicas have nothing to replay
+    """
+    return db.query(
+        "SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, true)",
+        [lsn],
+        database=source_db,
+    )[0][0]
+
+
+def _wait_for_replay(source_db, *, lsn, timeout):
+    """Wait for a replica to replay the WAL of its primary up to a location"""
+    deadline = time.time() + timeout
+    while not _has_replayed(source_db, lsn=lsn):
+        if time.time() >= deadline:
+            raise exceptions.RuntimeError(
+                f'Replica "{source_db["NAME"]}" did not replay the changes of the primary'
+                f" up to {lsn} within {timeout} seconds."
+            )
+
+        time.sleep(1)
+
+
+def _wait_for_replica(source_db, *, max_lag, timeout):
+    """Wait for the lag of a replica to be under max_lag seconds"""
+    deadline = time.time() + timeout
+    while True:
+        lag = _replica_lag(source_db)
+        if lag <= max_lag:
+            return lag
+
+        if time.time() >= deadline:
+            raise exceptions.RuntimeError(
+                f'Replica "{source_db["NAME"]}" is {lag:.1f} seconds behind, which is over'
+                f" the maximum lag of {max_lag} seconds."
+            )
+
+        logging.success_msg(f"Waiting for replica lag of {lag:.1f} seconds to catch up")
+        time.sleep(min(5, max(deadline - time.time(), 0)))
+
+
+def _catch_up(source_db, *, dump_db, dump_from, max_lag, timeout):
+    """
+    Wait for a replica to replay everything committed on the primary, including
+    the changes of pre-dump hooks, and for its lag to be under max_lag seconds
+    """
+    lsn = fingerprint._lsn(dump_db)
+    with spans.span("replica_replay", lsn=lsn):
+        _wait_for_replay(source_db, lsn=lsn, timeout=max(timeout, _MIN_REPLAY_TIMEOUT))
+
+    if max_lag is not None:
+        with spans.span("replica_lag") as lag_span:
+            lag = _wait_for_replica(source_db, max_lag=max_lag, timeout=timeout)
+            lag_span.set(lag=lag)
+        logging.success_msg(f'Dumping from "{dump_from}" with a lag of {lag:.1f} seconds')
+
+
+def _dump(
+    *,
+    exclude,
+    config,
+    pre_dump_hooks,
+    instance,
+    database,
+    storage_location,
+    exclude_larger_than=None,
+    keep_partitions=None,
+    schemas=(),
+    exclude_schemas=(),
+    scrub_rules=None,
+    analyze=False,
+    rate_limit=None,
+    nice=None,
+    health_query=None,
+    health_threshold=None,
+    dump_from=None,
+    max_lag=None,
+    lag_timeout=0,
+    if_changed=False,
+    engine="logical",
+    snapshot=None,
+    excluded_tables=None,
+    dump_manifest=None,
+    pre_hook_fingerprint=None,
+):
+    """
+    Dump implementation. Dumps of every schema provide the excluded tables, the
+    manifest and the fingerprint of their schema instead of collecting them
+    """
     if not settings.allow_dump():  # pragma: no cover
         raise exceptions.RuntimeError("Dump not allowed.")
 
+    if health_query and health_threshold is None:
+        raise exceptions.ValueError("Must provide a threshold for the dump health query.")
+
+    if scrub_rules and (rate_limit or health_query):
+        raise exceptions.ValueError("Scrubbed dumps cannot be throttled.")
+
+    if engine == physical.ENGINE and (
+        exclude
+        or exclude_larger_than
+        or keep_partitions is not None
+        or schemas
+        or exclude_schemas
+        or scrub_rules
+        or rate_limit
+        or health_query
+    ):
+        raise exceptions.ValueError(
+            "Physical dumps back up entire clusters and cannot exclude, scrub or throttle data."
+        )
+
     storage_client = storage.client(storage_location)
     dump_db = db.conf(using=database)
+    dump_options = _dump_options(
+        engine=engine,
+        exclude=exclude,
+        exclude_larger_than=exclude_larger_than,
+        keep_partitions=keep_partitions,
+        schemas=schemas,
+        exclude_schemas=exclude_schemas,
+        scrub=scrub_rules or {},
+        analyze=bool(analyze),
+    )
+
+    # Fingerprints are compared before hooks run. They are stored after hooks run,
+    # so changes made by the hooks themselves don't count as changes
+    if if_changed:
+        with spans.span("fingerprint") as fingerprint_span:
+            unchanged_dump_key = _unchanged_dump_key(
+                dump_db,
+                prefix=_dump_prefix(config=config, instance=instance, database=database),
+                storage_client=storage_client,
+                dump_options=dump_options,
+                current=pre_hook_fingerprint,
+            )
+            fingerprint_span.set(changed=not unchanged_dump_key)
 
-    # pre-dump hooks
-    with db.route(dump_db):
-        for management_command_name in pre_dump_hooks:  # pragma: no cover
-            logging.success_msg(f'Running "manage.py {management_command_name}" pre_dump hook')
-            run.management(management_command_name)
+        if unchanged_dump_key:
+            logging.success_msg(
+                f'Database "{database}" is unchanged since "{unchanged_dump_key}". Skipping dump'
+            )
+            return unchanged_dump_key
+
+    # pre-dump hooks always run on the dumped database, even when dumping from a replica
+    with spans.span("hooks", count=len(pre_dump_hooks)):
+        hooks.execute(pre_dump_hooks, kind="pre_dump", database=dump_db, using=database)
+
+    # pg_dump reads from the replica, if any, moving its load off the primary.
+    # Exported snapshots are only exported once the replica caught up
+    source_db = db.conf(using=dump_from) if dump_from else dump_db
+    if dump_from and not snapshot:
+        _catch_up(
+            source_db, dump_db=dump_db, dump_from=dump_from, max_lag=max_lag, timeout=lag_timeout
+        )
 
     # Run the pg dump command that streams to the storage location
     dump_key = _dump_key(config=config, instance=instance, database=database)
     file_path = os.path.join(storage_location, dump_key)
 
-    exclude_tables = [apps.get_model(model)._meta.db_table for model in exclude]
+    if engine == physical.ENGINE:
+        logging.success_msg(f'Taking a physical backup of the cluster of "{database}"')
+        with spans.span("manifest"):
+            dump_manifest = {
+                "engine": physical.ENGINE,
+                "options": dump_options,
+                "fingerprint": fingerprint.collect(dump_db),
+            }
+
+        with spans.span("pg_basebackup", dump_key=dump_key) as backup_span:
+            physical.backup(source_db, storage_client=storage_client, file_path=file_path)
+            backup_span.set(archive_bytes=storage_client.size(file_path))
+
+        manifest.write(storage_client, dump_key, dump_manifest)
+        logging.success_msg(f'Database "{database}" successfully dumped to "{dump_key}"')
+        return dump_key
+
+    if excluded_tables is None:
+        excluded_tables = exclusions.resolve(
+            exclude,
+            database=dump_db,
+            larger_than=exclude_larger_than,
+            keep_partitions=keep_partitions,
+        )
     exclude_args = " ".join(
-        [f"--exclude-table-data={table_name}" for table_name in exclude_tables]
+        args
+        for args in (
+            exclusions.pg_dump_args(excluded_tables),
+            tenants.pg_dump_args(schemas, exclude_schemas),
+        )
+        if args
     )
     # Note - do note format {db_dump_url} with an `f` string.
     # It will be formatted later when running the command
-    pg_dump_cmd_fmt = "pg_dump -Fc --no-acl --no-owner {db_dump_url} " + exclude_args
-    pg_dump_cmd_fmt += " " + storage_client.pg_dump(file_path)
+    # Scrubbed dumps are tar-format archives since their data is rewritten by pgclone
+    dump_format = "-Ft" if scrub_rules else "-Fc"
+    pg_dump_cmd_fmt = f"pg_dump {dump_format} --no-acl --no-owner {{db_dump_url}} " + exclude_args
+    if _statistics_args(analyze):
+        pg_dump_cmd_fmt += " " + _statistics_args(analyze)
+    if snapshot:
+        # Dump the database as of a snapshot exported by another session
+        pg_dump_cmd_fmt += f" --snapshot={shlex.quote(snapshot)}"
+    pg_dump_cmd_fmt = throttle.niced(pg_dump_cmd_fmt, nice)
+    # Throttled and scrubbed dumps are pumped into the storage command by pgclone
+    is_throttled = rate_limit or health_query
+    storage_cmd = throttle.niced(f"cat {storage_client.pg_dump(file_path, nice=nice)}", nice)
+    if not is_throttled and not scrub_rules:
+        pg_dump_cmd_fmt += " " + storage_client.pg_dump(file_path, nice=nice)
 
     anon_pg_dump_cmd = pg_dump_cmd_fmt.format(db_dump_url="<DB_URL>")
+    if is_throttled:
+        anon_pg_dump_cmd += f" (throttled) | {storage_cmd}"
+    elif scrub_rules:
+        anon_pg_dump_cmd += f" (scrubbed) | {storage_cmd}"
     logging.success_msg(f"Creating DB copy with cmd: {anon_pg_dump_cmd}")
 
-    pg_dump_cmd = pg_dump_cmd_fmt.format(db_dump_url=db.url(dump_db))
-    run.shell(pg_dump_cmd, env=storage_client.env)
+    # Collect the manifest before dumping so that table statistics reflect usage
+    # of the dumped database and not the dump itself
+    with spans.span("manifest"):
+        if dump_manifest is None:
+            dump_manifest = manifest.collect(dump_db, excluded_tables=excluded_tables)
+            dump_manifest["fingerprint"] = fingerprint.collect(dump_db)
+        else:
+            dump_manifest = dict(dump_manifest)
+
+        dump_manifest["scrubbed_tables"] = sorted(scrub_rules or {})
+        dump_manifest["schemas"] = list(schemas)
+        dump_manifest["exclude_schemas"] = list(exclude_schemas)
+        dump_manifest["options"] = dump_options
+
+    pg_dump_cmd = pg_dump_cmd_fmt.format(db_dump_url=db.url(source_db))
+    with spans.span("pg_dump", dump_key=dump_key) as pg_dump_span:
+        if is_throttled:
+            run.pipe(
+                pg_dump_cmd,
+                storage_cmd,
+                env=storage_client.env,
+                pump=throttle.pump(
+                    rate_limit=rate_limit,
+                    health_query=health_query,
+                    health_threshold=health_threshold,
+                    database=dump_db,
+                ),
+            )
+        elif scrub_rules:
+            run.pipe(
+                pg_dump_cmd,
+                storage_cmd,
+                env=storage_client.env,
+                pump=scrub.pump(rules=scrub_rules, database=source_db),
+            )
+        else:
+            run.shell(pg_dump_cmd, env=storage_client.env)
+
+        pg_dump_span.set(
+            bytes=_dumped_bytes(
+                dump_db,
+                excluded_tables=excluded_tables,
+                using=database,
+                schemas=schemas,
+                exclude_schemas=exclude_schemas,
+            ),
+            archive_bytes=storage_client.size(file_path),
+            rows=db.rows(dump_db),
+        )
+
+    stats.record(
+        "dump",
+        db_bytes=pg_dump_span.attributes["bytes"],
+        archive_bytes=pg_dump_span.attributes["archive_bytes"],
+        seconds=pg_dump_span.duration,
+    )
+    manifest.write(storage_client, dump_key, dump_manifest)
 
     logging.success_msg(f'Database "{database}" successfully dumped to "{dump_key}"')
 
@@ -60,39 +407,306 @@ def _dump(*, exclude, config, pre_dump_hooks, instance, database, storage_locati
 def dump(
     *,
     exclude: Union[List[str], None] = None,
+    exclude_larger_than: Union[int, None] = None,
+    keep_partitions: Union[int, str, Dict[str, Union[int, str]], None] = None,
+    schemas: Union[List[str], None] = None,
+    exclude_schemas: Union[List[str], None] = None,
+    scrub: Union[Dict[str, Dict[str, str]], None] = None,
     pre_dump_hooks: Union[List[str], None] = None,
     instance: Union[str, None] = None,
     database: Union[str, None] = None,
     storage_location: Union[str, None] = None,
+    analyze: Union[bool, None] = None,
+    rate_limit: Union[int, None] = None,
+    nice: Union[int, None] = None,
+    dump_from: Union[str, None] = None,
+    if_changed: bool = False,
+    engine: Union[str, None] = None,
     config: Union[str, None] = None,
-) -> str:
+) -> spans.Result:
     """Dumps a database.
 
     Args:
-        exclude: The models to exclude when dumping the utils.
-        pre_dump_hooks: A list of management command names to run before dumping the utils.
+        exclude: The models, apps and table patterns whose data is excluded from the
+            dump. Model labels are `app_label.ModelName` and app labels exclude every
+            model of the app. `table:<glob>` and `regex:<pattern>` match table names.
+        exclude_larger_than: Exclude the data of tables larger than this many bytes.
+        keep_partitions: Exclude the data of older partitions of range-partitioned
+            tables, keeping this many of the newest partitions or the partitions with
+            data newer than this ISO date. Use a dictionary of partitioned models or
+            tables to these values to only apply them to some tables.
+        schemas: Only dump schemas matching these patterns, which match schema
+            names with `*` and `?` wildcards.
+        exclude_schemas: Don't dump schemas matching these patterns.
+        scrub: A dictionary of tables or models to dictionaries of their columns and
+            transformers. The data of these columns is transformed while dumping,
+            without changing the dumped database. See `pgclone.scrub` for transformers.
+        pre_dump_hooks: A list of hooks to run before dumping the utils. See
+            the hooks section of the docs for the supported hooks.
         instance: The instance name to use in the dump key.
         database: The database to dump.
         storage_location: The storage location to store dumps.
+        analyze: Include planner statistics in the dump so that restores don't
+            need to analyze. Requires pg_dump 18 or later.
+        rate_limit: The maximum bytes per second streamed from pg_dump to storage.
+        nice: The niceness of pg_dump and the storage uploader, lowering their CPU and
+            IO priority.
+        dump_from: The database alias of a replica of the database to run pg_dump on.
+            The dump is named after the dumped database and pre-dump hooks run on it.
+        if_changed: Only dump if the database changed since the latest dump of its
+            instance, database and config. Otherwise the latest dump key is returned.
+        engine: "logical" to dump the database with pg_dump or "physical" to take
+            a base backup of its entire cluster with pg_basebackup.
+        config: The configuration name from `settings.PGCLONE_CONFIGS`.
+
+    Returns:
+        The dump key associated with the database dump. The result is a string that
+        also has the `timings` and `spans` of every phase of the dump.
+    """
+    opts = options.get(
+        exclude=exclude,
+        exclude_larger_than=exclude_larger_than,
+        keep_partitions=keep_partitions,
+        schemas=schemas,
+        exclude_schemas=exclude_schemas,
+        scrub=scrub,
+        config=config,
+        pre_dump_hooks=pre_dump_hooks,
+        instance=instance,
+        database=database,
+        storage_location=storage_location,
+        analyze=analyze,
+        dump_rate_limit=rate_limit,
+        dump_nice=nice,
+        dump_from=dump_from,
+        dump_engine=engine,
+    )
+
+    with spans.operation("dump", database=opts.database) as operation:
+        dump_key = _dump(
+            exclude=opts.exclude,
+            exclude_larger_than=opts.exclude_larger_than,
+            keep_partitions=opts.keep_partitions,
+            schemas=opts.schemas,
+            exclude_schemas=opts.exclude_schemas,
+            scrub_rules=opts.scrub,
+            config=opts.config,
+            pre_dump_hooks=opts.pre_dump_hooks,
+            instance=opts.instance,
+            database=opts.database,
+            storage_location=opts.storage_location,
+            analyze=opts.analyze,
+            rate_limit=opts.dump_rate_limit,
+            nice=opts.dump_nice,
+            health_query=opts.dump_health_query,
+            health_threshold=opts.dump_health_threshold,
+            dump_from=opts.dump_from,
+            max_lag=opts.dump_max_lag,
+            lag_timeout=opts.dump_lag_timeout,
+            if_changed=if_changed,
+            engine=opts.dump_engine,
+        )
+
+    return spans.Result(dump_key, operation)
+
+
+def _dump_schema(schema, *, config, database, logger, **kwargs):
+    """Dump one schema to its own archive in a worker thread"""
+    with (
+        logging.set_logger(logger),
+        spans.operation("dump", database=database, schema=schema) as operation,
+    ):
+        try:
+            dump_key = _dump(
+                schemas=[schema],
+                exclude_schemas=[],
+                config=f"{config}__{schema}",
+                pre_dump_hooks=[],
+                database=database,
+                **kwargs,
+            )
+        finally:
+            # Worker threads have their own database connections
+            connections.close_all()
+
+    return spans.Result(dump_key, operation)
+
+
+def _dump_schemas(
+    *,
+    schemas,
+    exclude_schemas,
+    pre_dump_hooks,
+    database,
+    dump_from,
+    num_jobs,
+    exclude,
+    exclude_larger_than,
+    keep_partitions,
+    if_changed,
+    max_lag=None,
+    lag_timeout=0,
+    **kwargs,
+):
+    """Dump every matching schema to its own archive as of a single snapshot"""
+    dump_db = db.conf(using=database)
+    source_db = db.conf(using=dump_from) if dump_from else dump_db
+    names = tenants.resolve(schemas, exclude_schemas, database=source_db)
+    if not names:
+        raise exceptions.RuntimeError(f'No schemas of "{database}" match the schema patterns.')
+
+    # Like dumps of databases, fingerprints are compared before hooks run and
+    # stored after hooks run. Every schema is compared with its own fingerprint
+    pre_hook_fingerprints = fingerprint.collect_schemas(dump_db, names) if if_changed else {}
+    hooks.execute(pre_dump_hooks, kind="pre_dump", database=dump_db, using=database)
+
+    # The catalog of the database is read once and scoped to every schema
+    excluded_tables = exclusions.resolve(
+        exclude,
+        database=dump_db,
+        larger_than=exclude_larger_than,
+        keep_partitions=keep_partitions,
+    )
+    manifests = manifest.collect_schemas(dump_db, names, excluded_tables=excluded_tables)
+    fingerprints = fingerprint.collect_schemas(dump_db, names)
+
+    # The snapshot is fixed once it's exported, so the replica catches up first
+    if dump_from:
+        _catch_up(
+            source_db, dump_db=dump_db, dump_from=dump_from, max_lag=max_lag, timeout=lag_timeout
+        )
+
+    logging.success_msg(f"Dumping {len(names)} schema(s) with {num_jobs} job(s)")
+    logger = logging.get_logger()
+    # Every schema is dumped as of the same snapshot so that the archives are consistent
+    with tenants.exported_snapshot(source_db) as snapshot:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_jobs) as executor:
+            futures = {
+                name: executor.submit(
+                    _dump_schema,
+                    name,
+                    database=database,
+                    dump_from=dump_from,
+                    snapshot=snapshot,
+                    logger=logger,
+                    exclude=exclude,
+                    exclude_larger_than=exclude_larger_than,
+                    keep_partitions=keep_partitions,
+                    if_changed=if_changed,
+                    excluded_tables=[
+                        entry for entry in excluded_tables if entry["schema"] == name
+                    ],
+                    dump_manifest=dict(manifests[name], fingerprint=fingerprints[name]),
+                    pre_hook_fingerprint=pre_hook_fingerprints.get(name),
+                    **kwargs,
+                )
+                for name in names
+            }
+            concurrent.futures.wait(futures.values())
+
+    failed = [name for name, future in futures.items() if future.exception()]
+    if failed:
+        raise exceptions.RuntimeError(
+            f"Dumping schema(s) {', '.join(failed)} failed."
+        ) from futures[failed[0]].exception()
+
+    return {name: future.result() for name, future in futures.items()}
+
+
+def dump_schemas(
+    schemas: Union[List[str], None] = None,
+    *,
+    exclude_schemas: Union[List[str], None] = None,
+    exclude: Union[List[str], None] = None,
+    exclude_larger_than: Union[int, None] = None,
+    keep_partitions: Union[int, str, Dict[str, Union[int, str]], None] = None,
+    scrub: Union[Dict[str, Dict[str, str]], None] = None,
+    pre_dump_hooks: Union[List[str], None] = None,
+    instance: Union[str, None] = None,
+    database: Union[str, None] = None,
+    storage_location: Union[str, None] = None,
+    analyze: Union[bool, None] = None,
+    rate_limit: Union[int, None] = None,
+    nice: Union[int, None] = None,
+    dump_from: Union[str, None] = None,
+    if_changed: bool = False,
+    jobs: Union[int, None] = None,
+    config: Union[str, None] = None,
+) -> Dict[str, spans.Result]:
+    """Dumps every schema of a database to its own archive, such as one per tenant.
+
+    Schemas are dumped in parallel as of a single snapshot of the database, so
+    the archives are consistent with each other. The config of every dump key
+    is suffixed with its schema, for example `instance/database/none__tenant_a/`.
+    Pre-dump hooks run once before any schema is dumped.
+
+    Args:
+        schemas: Dump the schemas matching these patterns, which match schema names
+            with `*` and `?` wildcards. Defaults to every schema.
+        exclude_schemas: Don't dump schemas matching these patterns.
+        exclude: The models, apps and table patterns whose data is excluded from
+            every archive.
+        exclude_larger_than: Exclude the data of tables larger than this many bytes.
+        keep_partitions: Exclude the data of older partitions of range-partitioned
+            tables. See `pgclone.dump`.
+        scrub: Columns of tables or models to transform while dumping. See
+            `pgclone.dump`.
+        pre_dump_hooks: A list of hooks to run before dumping the schemas.
+        instance: The instance name to use in the dump keys.
+        database: The database to dump.
+        storage_location: The storage location to store dumps.
+        analyze: Include planner statistics in the dumps.
+        rate_limit: The maximum bytes per second streamed from every pg_dump to storage.
+        nice: The niceness of pg_dump and the storage uploader.
+        dump_from: The database alias of a replica of the database to run pg_dump on.
+        if_changed: Only dump schemas that changed since their latest dump. Otherwise
+            the latest dump key of the schema is returned.
+        jobs: The number of schemas to dump in parallel.
         config: The configuration name from `settings.PGCLONE_CONFIGS`.
 
     Returns:
-        The dump key associated with the database dump.
+        A dictionary of schema names to their dump keys. Like `pgclone.dump`, dump
+        keys have the `timings` and `spans` of every phase of their dump.
     """
     opts = options.get(
         exclude=exclude,
+        exclude_larger_than=exclude_larger_than,
+        keep_partitions=keep_partitions,
+        schemas=schemas,
+        exclude_schemas=exclude_schemas,
+        scrub=scrub,
         config=config,
         pre_dump_hooks=pre_dump_hooks,
         instance=instance,
         database=database,
         storage_location=storage_location,
+        jobs=jobs,
+        analyze=analyze,
+        dump_rate_limit=rate_limit,
+        dump_nice=nice,
+        dump_from=dump_from,
     )
 
-    return _dump(
+    return _dump_schemas(
+        schemas=opts.schemas,
+        exclude_schemas=opts.exclude_schemas,
+        pre_dump_hooks=opts.pre_dump_hooks,
+        database=opts.database,
+        dump_from=opts.dump_from,
+        num_jobs=opts.jobs,
         exclude=opts.exclude,
+        exclude_larger_than=opts.exclude_larger_than,
+        keep_partitions=opts.keep_partitions,
+        scrub_rules=opts.scrub,
         config=opts.config,
-        pre_dump_hooks=opts.pre_dump_hooks,
         instance=opts.instance,
-        database=opts.database,
         storage_location=opts.storage_location,
+        analyze=opts.analyze,
+        rate_limit=opts.dump_rate_limit,
+        nice=opts.dump_nice,
+        health_query=opts.dump_health_query,
+        health_threshold=opts.dump_health_threshold,
+        max_lag=opts.dump_max_lag,
+        lag_timeout=opts.dump_lag_timeout,
+        if_changed=if_changed,
     )
@@ -15,3 +15,7 @@ class ValueError(Error, ValueError):
 
 class RuntimeError(Error, RuntimeError):
     """When a runtime error happens specific to pgclone"""
+
+
+class Cancelled(Error):
+    """When a pgclone job is cancelled"""
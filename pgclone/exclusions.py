@@ -0,0 +1,307 @@
+"""
+Resolves the tables whose data is excluded from dumps.
+
+Exclusions are model labels (`app_label.ModelName`), app labels (`app_label`),
+glob patterns of table names (`table:audit_*`), or regular expressions of
+table names (`regex:^log_\\d+$`). Patterns match either `table` or
+`schema.table`, so they also catch unmanaged tables and tables that aren't
+models. Tables larger than a number of bytes can be excluded as well.
+
+The data of older partitions of range-partitioned tables can also be excluded,
+keeping either the newest partitions or the partitions with data newer than a
+date. Partitions are ordered by their upper bounds. Default partitions are
+always kept, and so are tables that aren't partitioned by time when a date
+applies to every partitioned table.
+"""
+
+import datetime as dt
+import fnmatch
+import re
+import shlex
+
+from django.apps import apps
+from django.core.exceptions import AppRegistryNotReady
+
+from pgclone import db, exceptions, logging
+
+_PATTERN_PREFIXES = ("table:", "regex:")
+
+
+def is_pattern(rule):
+    """True if an exclusion is a pattern, which doesn't need Django models to resolve"""
+    return rule.startswith(_PATTERN_PREFIXES)
+
+
+def _model_tables(rule):
+    """Return the tables of a model label or of every model of an app label"""
+    try:
+        if "." in rule:
+            return [apps.get_model(rule)._meta.db_table]
+        else:
+            return [
+                model._meta.db_table
+                for model in apps.get_app_config(rule).get_models(include_auto_created=True)
+            ]
+    except LookupError as exc:
+        raise exceptions.ValueError(f'"{rule}" is not a model or app label.') from exc
+
+
+def _matches(rule, *, schema, table):
+    names = (table, f"{schema}.{table}")
+    if rule.startswith("table:"):
+        return any(fnmatch.fnmatchcase(name, rule[6:]) for name in names)
+    else:
+        return any(re.fullmatch(rule[6:], name) for name in names)
+
+
+def _tables(database):
+    """Return the schema, name, size and search path visibility of every user table"""
+    return db.query(
+        "SELECT n.nspname, c.relname, pg_total_relation_size(c.oid), pg_table_is_visible(c.oid)"
+        " FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace"
+        " WHERE c.relkind IN ('r', 'p')"
+        " AND n.nspname NOT IN ('pg_catalog', 'information_schema')"
+        " AND n.nspname !~ '^pg_toast'"
+        " ORDER BY n.nspname, c.relname",
+        database=database,
+    )
+
+
+def _partitions(database):
+    """
+    Return the leaf tables of every partition of range-partitioned tables along with
+    the partitioned table and the bound of the partition. Partitions that are
+    partitioned themselves have a row for each of their leaf tables
+    """
+    return db.query(
+        "SELECT pn.nspname, p.relname, c.oid, pg_get_expr(c.relpartbound, c.oid),"
+        " ln.nspname, l.relname, pg_total_relation_size(l.oid)"
+        " FROM pg_partitioned_table pt"
+        " JOIN pg_class p ON p.oid = pt.partrelid"
+        " JOIN pg_namespace pn ON pn.oid = p.relnamespace"
+        " JOIN pg_inherits i ON i.inhparent = p.oid"
+        " JOIN pg_class c ON c.oid = i.inhrelid"
+        " CROSS JOIN LATERAL pg_partition_tree(c.oid) t"
+        " JOIN pg_class l ON l.oid = t.relid"
+        " JOIN pg_namespace ln ON ln.oid = l.relnamespace"
+        " WHERE pt.partstrat = 'r' AND NOT p.relispartition AND t.isleaf"
+        " ORDER BY pn.nspname, p.relname, ln.nspname, l.relname",
+        database=database,
+    )
+
+
+def _bound_value(value):
+    """Convert a value of a partition bound to a comparable value"""
+    if value in ("MINVALUE", "MAXVALUE"):
+        return (0 if value == "MINVALUE" else 2, 0)
+
+    if value.startswith("'"):
+        value = value[1:-1].replace("''", "'")
+
+    try:
+        return (1, float(value))
+    except ValueError:
+        pass
+
+    try:
+        # Time zones of timestamps are ignored
+        return (1, dt.datetime.fromisoformat(value[:19]))
+    except ValueError:
+        return (1, value)
+
+
+def _upper_bound(bound):
+    """
+    Return the comparable upper bound of a range partition from its definition, such
+    as "FOR VALUES FROM ('2024-01-01') TO ('2024-02-01')", or None for default partitions
+    """
+    match = re.search(r"\) TO \((.*)\)$", bound)
+    if not match:
+        return None
+
+    return tuple(_bound_value(value) for value in re.findall(r"'(?:[^']|'')*'|[^,\s]+", match[1]))
+
+
+def _partition_rules(keep_partitions, *, partitioned):
+    """
+    Resolve the models and tables of a dictionary of partition rules to table names.
+    Targets that aren't partitioned tables are errors, so that rules aren't ignored
+    """
+    rules = {}
+    for target, rule in keep_partitions.items():
+        try:
+            table = apps.get_model(target)._meta.db_table
+        except (LookupError, ValueError, AppRegistryNotReady):
+            # Apps aren't set up when dumping with the lightweight CLI
+            table = target
+
+        if not any(table in (f"{schema}.{name}", name) for schema, name in partitioned):
+            raise exceptions.ValueError(
+                f'"{target}" is not a partitioned table or a model of one.'
+            )
+
+        rules[table] = rule
+
+    return rules
+
+
+def _partition_rule(keep_partitions, *, schema, table):
+    """Return the partitions kept of a partitioned table"""
+    if not isinstance(keep_partitions, dict):
+        return keep_partitions
+
+    return keep_partitions.get(f"{schema}.{table}", keep_partitions.get(table))
+
+
+def _validate_partition_rule(rule):
+    is_count = isinstance(rule, int) and not isinstance(rule, bool) and rule >= 0
+    try:
+        is_date = isinstance(rule, str) and bool(dt.date.fromisoformat(rule))
+    except ValueError:
+        is_date = False
+
+    if not is_count and not is_date:
+        raise exceptions.ValueError(f'"{rule}" is not a number of partitions or a date.')
+
+
+def _is_dated(upper_bounds):
+    """True if the upper bounds of a table's partitions are times, ignoring MINVALUE/MAXVALUE"""
+    return all(
+        isinstance(upper_bound[0][1], dt.datetime)
+        for upper_bound in upper_bounds
+        if upper_bound[0][0] == 1
+    )
+
+
+def _is_kept(upper_bound, *, rule, newest):
+    """True if the data of a partition is kept by a rule"""
+    if upper_bound is None:
+        # Default partitions can have data of any age
+        return True
+    elif isinstance(rule, int):
+        return upper_bound in newest
+
+    rank, value = upper_bound[0]
+    if rank != 1:
+        # Partitions up to MAXVALUE are always newer and up to MINVALUE never are
+        return rank == 2
+    elif not isinstance(value, dt.datetime):
+        raise exceptions.ValueError(
+            f'Partitions bounded by "{value}" can\'t be kept since "{rule}".'
+        )
+
+    return value > dt.datetime.fromisoformat(rule)
+
+
+def _old_partitions(keep_partitions, *, database):
+    """Return the leaf tables of the partitions whose data isn't kept"""
+    for rule in (
+        keep_partitions.values() if isinstance(keep_partitions, dict) else [keep_partitions]
+    ):
+        _validate_partition_rule(rule)
+
+    partitioned = {}
+    for schema, table, partition, bound, *leaf in _partitions(database):
+        partitions = partitioned.setdefault((schema, table), {})
+        partitions.setdefault(partition, (_upper_bound(bound), []))[1].append(leaf)
+
+    if isinstance(keep_partitions, dict):
+        keep_partitions = _partition_rules(keep_partitions, partitioned=partitioned)
+
+    old = []
+    for (schema, table), partitions in partitioned.items():
+        rule = _partition_rule(keep_partitions, schema=schema, table=table)
+        if rule is None:
+            continue
+
+        upper_bounds = sorted(bound for bound, _ in partitions.values() if bound is not None)
+        if isinstance(keep_partitions, str) and not _is_dated(upper_bounds):
+            # Dates that apply to every table don't apply to tables partitioned by other values
+            logging.success_msg(
+                f'Keeping every partition of "{schema}.{table}" since it isn\'t partitioned'
+                " by time. Use a dictionary of tables to keep older partitions of it."
+            )
+            continue
+
+        newest = upper_bounds[len(upper_bounds) - rule :] if isinstance(rule, int) and rule else []
+        for upper_bound, leaves in partitions.values():
+            if not _is_kept(upper_bound, rule=rule, newest=newest):
+                old.extend(
+                    {
+                        "schema": leaf_schema,
+                        "table": leaf_table,
+                        "bytes": num_bytes,
+                        "rule": f"keep_partitions:{rule}",
+                    }
+                    for leaf_schema, leaf_table, num_bytes in leaves
+                )
+
+    return old
+
+
+def resolve(rules, *, database, larger_than=None, keep_partitions=None):
+    """
+    Resolve exclusions to the tables of a database.
+
+    Args:
+        rules: Model labels, app labels and patterns of excluded tables.
+        database: The configuration of the dumped database.
+        larger_than: Also exclude tables whose total size is larger than this many bytes.
+        keep_partitions: Exclude the data of older partitions of range-partitioned
+            tables, keeping this many of the newest partitions or the partitions with
+            data newer than this ISO date. A dictionary of partitioned models or
+            tables to these rules only applies to those tables.
+
+    Returns:
+        A list of dictionaries with the "schema", "table", "bytes" and the "rule"
+        that excluded every table.
+    """
+    # Model tables are resolved like pg_dump resolves unqualified names, using the search path
+    model_tables = {}
+    for rule in rules:
+        if not is_pattern(rule):
+            for table in _model_tables(rule):
+                model_tables.setdefault(table, rule)
+
+    excluded = []
+    for schema, table, num_bytes, is_visible in _tables(database):
+        if is_visible and table in model_tables:
+            rule = model_tables[table]
+        else:
+            rule = next(
+                (
+                    rule
+                    for rule in rules
+                    if is_pattern(rule) and _matches(rule, schema=schema, table=table)
+                ),
+                None,
+            )
+
+        if rule is None and larger_than is not None and num_bytes > larger_than:
+            rule = f"larger_than:{larger_than}"
+
+        if rule:
+            excluded.append({"schema": schema, "table": table, "bytes": num_bytes, "rule": rule})
+
+    if keep_partitions is not None:
+        excluded_names = {(entry["schema"], entry["table"]) for entry in excluded}
+        excluded.extend(
+            entry
+            for entry in _old_partitions(keep_partitions, database=database)
+            if (entry["schema"], entry["table"]) not in excluded_names
+        )
+
+    return excluded
+
+
+def _quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def pg_dump_args(excluded):
+    """Return the pg_dump arguments that exclude the data of tables"""
+    return " ".join(
+        "--exclude-table-data="
+        + shlex.quote(f"{_quote_ident(entry['schema'])}.{_quote_ident(entry['table'])}")
+        for entry in excluded
+    )
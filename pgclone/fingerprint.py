@@ -0,0 +1,127 @@
+"""
+Cheap fingerprints of databases, used to skip dumps of databases that haven't
+changed since they were last dumped.
+
+Fingerprints have the tuple counters of the database from `pg_stat_database`
+and a hash of its schema, including the file nodes of tables, which change
+when tables are truncated or rewritten, and the last values of sequences. The
+WAL location is recorded for reference, but isn't compared since it's shared
+by every database of the server. Transaction counters aren't used since
+read-only transactions, such as fingerprinting itself, increase them.
+
+Fingerprints of schemas, used for dumps of every schema, have the tuple counters
+of the tables of the schema from `pg_stat_user_tables` instead.
+
+Tuple counters are reported by every session asynchronously, usually within a
+second of a commit and up to a minute under contention, and
+`pg_stat_force_next_flush()` only flushes the counters of the session calling
+it. Writes committed just before a fingerprint is compared may not be counted
+yet. Since they are counted by the next comparison, they only delay a dump by
+one run. The schema hash isn't delayed.
+"""
+
+import hashlib
+
+from pgclone import db
+
+# The keys of fingerprints that are compared to find changes
+_COMPARED = ("tuples", "schema")
+
+
+def _lsn(database):
+    return db.query(
+        "SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn()"
+        " ELSE pg_current_wal_lsn() END::text",
+        database=database,
+    )[0][0]
+
+
+def _tuples(database):
+    inserted, updated, deleted = db.query(
+        "SELECT tup_inserted, tup_updated, tup_deleted"
+        " FROM pg_stat_database WHERE datname = current_database()",
+        database=database,
+    )[0]
+    return {"inserted": inserted, "updated": updated, "deleted": deleted}
+
+
+def _schema_tuples(database, schemas):
+    rows = db.query(
+        "SELECT schemaname, SUM(n_tup_ins), SUM(n_tup_upd), SUM(n_tup_del)"
+        " FROM pg_stat_user_tables WHERE schemaname = ANY(%s) GROUP BY schemaname",
+        [list(schemas)],
+        database=database,
+    )
+    tuples = {schema: {"inserted": 0, "updated": 0, "deleted": 0} for schema in schemas}
+    for schema, inserted, updated, deleted in rows:
+        tuples[schema] = {
+            "inserted": int(inserted),
+            "updated": int(updated),
+            "deleted": int(deleted),
+        }
+
+    return tuples
+
+
+def _catalog(database):
+    """Return the relations and the sequences of a database with their schema first"""
+    rows = db.query(
+        "SELECT n.nspname, c.relname, c.relkind, c.relfilenode,"
+        " (SELECT string_agg(a.attname || ' ' || format_type(a.atttypid, a.atttypmod), ','"
+        "  ORDER BY a.attnum) FROM pg_attribute a"
+        "  WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped)"
+        " FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace"
+        " WHERE n.nspname NOT IN ('pg_catalog', 'information_schema')"
+        " AND n.nspname !~ '^pg_toast'"
+        " ORDER BY n.nspname, c.relname",
+        database=database,
+    )
+    rows += db.query(
+        "SELECT schemaname, sequencename, last_value FROM pg_sequences"
+        " ORDER BY schemaname, sequencename",
+        database=database,
+    )
+    return rows
+
+
+def _schema_hash(database):
+    return hashlib.sha256(repr(_catalog(database)).encode("utf-8")).hexdigest()
+
+
+def collect(database):
+    """Collect the fingerprint of a database"""
+    return {
+        "lsn": _lsn(database),
+        "tuples": _tuples(database),
+        "schema": _schema_hash(database),
+    }
+
+
+def collect_schemas(database, schemas):
+    """
+    Collect the fingerprints of schemas of a database, reading its catalog once.
+
+    Returns:
+        A dictionary of schema names to their fingerprints.
+    """
+    lsn = _lsn(database)
+    tuples = _schema_tuples(database, schemas)
+    catalog = _catalog(database)
+    return {
+        schema: {
+            "lsn": lsn,
+            "tuples": tuples[schema],
+            "schema": hashlib.sha256(
+                repr([row for row in catalog if row[0] == schema]).encode("utf-8")
+            ).hexdigest(),
+        }
+        for schema in schemas
+    }
+
+
+def changed(previous, current):
+    """True if a database changed between two fingerprints"""
+    if not previous:
+        return True
+
+    return any(previous.get(key) != current[key] for key in _COMPARED)
@@ -0,0 +1,195 @@
+"""
+Runs pre-dump and pre-swap hooks.
+
+Hooks are management command names, or paths of SQL files prefixed with
+"sql:". Hooks can also be dictionaries with the "hook" to run and a list of
+hooks that it runs "after".
+
+With `settings.PGCLONE_HOOK_WORKERS` greater than one, management command hooks
+run concurrently in subprocesses once the hooks they depend on have finished.
+Otherwise they run one after another in the current process. SQL hooks
+always run with `psql` over one connection.
+"""
+
+import concurrent.futures
+import shlex
+import subprocess
+import sys
+
+from pgclone import db, exceptions, logging, run, settings
+
+
+def _parse(hooks):
+    """Normalize hooks into a list of dictionaries with "hook" and "after" keys"""
+    parsed = []
+    for hook in hooks:
+        if isinstance(hook, str):
+            hook = {"hook": hook}
+
+        if not hook.get("hook"):
+            raise exceptions.ValueError(f'Hook "{hook}" must have a "hook" key.')
+
+        parsed.append({"hook": hook["hook"], "after": list(hook.get("after", []))})
+
+    names = [hook["hook"] for hook in parsed]
+    if len(set(names)) != len(names):
+        raise exceptions.ValueError("Hooks must be unique.")
+
+    for hook in parsed:
+        for dependency in hook["after"]:
+            if dependency not in names:
+                raise exceptions.ValueError(
+                    f'Hook "{hook["hook"]}" runs after unknown hook "{dependency}".'
+                )
+
+    return parsed
+
+
+def _ordered(hooks):
+    """Return hooks ordered by their dependencies, keeping the declared order otherwise"""
+    ordered = []
+    done = set()
+    remaining = list(hooks)
+    while remaining:
+        ready = [hook for hook in remaining if set(hook["after"]) <= done]
+        if not ready:
+            raise exceptions.ValueError("Hooks have circular dependencies.")
+
+        ordered.append(ready[0])
+        done.add(ready[0]["hook"])
+        remaining.remove(ready[0])
+
+    return ordered
+
+
+def _stream(cmd, *, name):
+    """Run a command and stream its output to the logger, prefixed by the hook name"""
+    logger = logging.get_logger()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    for line in iter(process.stdout.readline, b""):
+        # Prefix lines since output of concurrent hooks is interleaved
+        msg = f"[{name}] {line.decode('utf-8').rstrip()}"
+        logger.info(msg)
+    process.wait()
+
+    if process.returncode:
+        raise exceptions.RuntimeError(f'Hook "{name}" failed.')
+
+
+def _run_sql(hook, *, database):
+    # Note - the database URL is passed to psql and never logged. It is shell-quoted
+    # by db.url, so it is unquoted when passed as an argument
+    _stream(
+        [
+            "psql",
+            "-X",
+            "-q",
+            "-v",
+            "ON_ERROR_STOP=1",
+            "--single-transaction",
+            "-f",
+            hook[4:],
+            shlex.split(db.url(database))[0],
+        ],
+        name=hook,
+    )
+
+
+def _run_subprocess(hook, *, database, using):
+    _stream(
+        [
+            sys.executable,
+            "-m",
+            "django",
+            "pgclone",
+            "hook",
+            hook,
+            "--route",
+            database["NAME"],
+            "--database",
+            using,
+        ],
+        name=hook,
+    )
+
+
+def _run_hook(hook, *, kind, database, using, isolated, logger=None):
+    if logger:
+        # Hooks in other threads don't share the current logger
+        with logging.set_logger(logger):
+            return _run_hook(hook, kind=kind, database=database, using=using, isolated=isolated)
+
+    if hook.startswith("sql:"):
+        logging.success_msg(f'Running "{hook[4:]}" {kind} hook')
+        _run_sql(hook, database=database)
+    elif isolated:
+        logging.success_msg(f'Running "manage.py {hook}" {kind} hook in a subprocess')
+        _run_subprocess(hook, database=database, using=using)
+    else:
+        logging.success_msg(f'Running "manage.py {hook}" {kind} hook')
+        with db.route(database):
+            run.management(hook)
+
+
+def _run_parallel(hooks, *, kind, database, using):
+    logger = logging.get_logger()
+    pending = list(hooks)
+    done = set()
+    running = {}
+    error = None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=settings.hook_workers()) as executor:
+        while pending or running:
+            # Start every hook whose dependencies finished, unless a hook failed
+            for hook in [hook for hook in pending if set(hook["after"]) <= done]:
+                if error:
+                    break
+
+                pending.remove(hook)
+                future = executor.submit(
+                    _run_hook,
+                    hook["hook"],
+                    kind=kind,
+                    database=database,
+                    using=using,
+                    isolated=True,
+                    logger=logger,
+                )
+                running[future] = hook["hook"]
+
+            if not running:
+                break
+
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                name = running.pop(future)
+                if future.exception():
+                    error = error or future.exception()
+                else:
+                    done.add(name)
+
+    if error:
+        raise error
+
+
+def execute(hooks, *, kind, database, using, isolated=True):
+    """
+    Run hooks on a database.
+
+    Args:
+        hooks: The hooks to run.
+        kind: The kind of hook, such as "pre_swap", used when logging.
+        database: The database configuration the hooks are routed to.
+        using: The database alias of the routed database.
+        isolated: Allow running hooks concurrently in subprocesses, which route
+            to databases by name on the server of the alias.
+    """
+    hooks = _ordered(_parse(hooks))
+
+    if settings.hook_workers() > 1 and isolated:
+        _run_parallel(hooks, kind=kind, database=database, using=using)
+    else:
+        for hook in hooks:
+            _run_hook(hook["hook"], kind=kind, database=database, using=using, isolated=False)
@@ -0,0 +1,196 @@
+"""
+Background restore jobs.
+
+Jobs are queued on a bounded worker pool in the current process. Their
+status and logs are stored in the Django cache so that they can be
+inspected and cancelled from other processes, such as a web UI or
+`python manage.py pgclone jobs`.
+"""
+
+import concurrent.futures
+import datetime as dt
+import threading
+import uuid
+from typing import List, Union
+
+from django.core.cache import caches
+from django.db import connections
+
+from pgclone import exceptions, logging, settings
+
+# How long job statuses and logs are kept in the cache
+_TIMEOUT = 24 * 60 * 60
+# The maximum number of job IDs remembered for listing
+_MAX_JOBS = 100
+
+_executor = None
+_executor_lock = threading.Lock()
+_current = threading.local()
+
+
+def _cache():
+    return caches[settings.job_cache()]
+
+
+def _job_key(job_id):
+    return f"pgclone-job-{job_id}"
+
+
+def _log_key(job_id):
+    return f"pgclone-job-{job_id}-log"
+
+
+def _cancel_key(job_id):
+    return f"pgclone-job-{job_id}-cancel"
+
+
+def _slot_key(position):
+    return f"pgclone-jobs-{position % _MAX_JOBS}"
+
+
+def _get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=settings.job_workers(), thread_name_prefix="pgclone-job"
+            )
+
+        return _executor
+
+
+def _update(job_id, **fields):
+    job = _cache().get(_job_key(job_id)) or {"id": job_id}
+    job.update(fields)
+    _cache().set(_job_key(job_id), job, _TIMEOUT)
+
+
+def _now():
+    return dt.datetime.utcnow().isoformat()
+
+
+def _run(job_id, restore_kwargs):
+    from pgclone import restore_cmd
+
+    if is_cancelled(job_id):
+        _update(job_id, status="cancelled", finished_at=_now())
+        return
+
+    _update(job_id, status="running", started_at=_now())
+    logger = logging.new_cache_logger(
+        _log_key(job_id), clear=True, cache_name=settings.job_cache()
+    )
+    _current.job_id = job_id
+    try:
+        with logging.set_logger(logger):
+            dump_key = restore_cmd.restore(**restore_kwargs)
+    except exceptions.Cancelled:
+        _update(job_id, status="cancelled", finished_at=_now())
+    except Exception as exc:
+        logger.exception("Restore failed")
+        _update(job_id, status="failed", error=str(exc), finished_at=_now())
+    else:
+        _update(
+            job_id,
+            status="succeeded",
+            dump_key=str(dump_key),
+            timings=dump_key.timings,
+            finished_at=_now(),
+        )
+    finally:
+        del _current.job_id
+        connections.close_all()
+
+
+def checkpoint(phase):
+    """
+    Record the progress of the running job and raise `exceptions.Cancelled` if it
+    was cancelled. Does nothing when not running in a job.
+    """
+    job_id = getattr(_current, "job_id", None)
+    if job_id is None:
+        return
+
+    _update(job_id, phase=phase)
+    if is_cancelled(job_id):
+        raise exceptions.Cancelled(f'Job "{job_id}" was cancelled.')
+
+
+def submit(dump_key: Union[str, None] = None, **restore_kwargs) -> str:
+    """
+    Queue a restore in the background.
+
+    At most `settings.PGCLONE_JOB_WORKERS` restores run at the same time in the
+    current process. Restores of the same database are always serialized across
+    processes with an advisory lock.
+
+    Args:
+        dump_key: The dump key to restore.
+        **restore_kwargs: Any other arguments to `pgclone.restore`.
+
+    Returns:
+        The job ID.
+    """
+    job_id = uuid.uuid4().hex
+    _update(
+        job_id,
+        status="queued",
+        dump_key=dump_key,
+        database=restore_kwargs.get("database"),
+        created_at=_now(),
+    )
+
+    # Jobs are listed from a ring of slots claimed with an atomic increment, so
+    # that concurrent submissions from other processes don't overwrite each other
+    _cache().add("pgclone-jobs-count", 0, _TIMEOUT)
+    position = _cache().incr("pgclone-jobs-count")
+    _cache().set(_slot_key(position), (position, job_id), _TIMEOUT)
+
+    _get_executor().submit(_run, job_id, dict(restore_kwargs, dump_key=dump_key))
+
+    return job_id
+
+
+def get(job_id: str) -> dict:
+    """
+    Get the status of a job.
+
+    Returns:
+        A dictionary with the "status" of the job (queued, running, succeeded, failed,
+        or cancelled), the current "phase" of the restore, the "log" of the restore
+        and other metadata.
+    """
+    job = _cache().get(_job_key(job_id))
+    if not job:
+        raise exceptions.KeyError(f'Job "{job_id}" does not exist.')
+
+    return dict(job, log=_cache().get(_log_key(job_id)) or "")
+
+
+def ls() -> List[dict]:
+    """List the statuses of the most recent jobs, most recent first"""
+    count = _cache().get("pgclone-jobs-count") or 0
+    positions = range(count, max(count - _MAX_JOBS, 0), -1)
+    slots = _cache().get_many([_slot_key(position) for position in positions])
+    # Ignore slots that were claimed again by jobs submitted after the count was read
+    job_keys = [
+        _job_key(slots[_slot_key(position)][1])
+        for position in positions
+        if slots.get(_slot_key(position), (None,))[0] == position
+    ]
+    jobs = _cache().get_many(job_keys)
+    return [jobs[job_key] for job_key in job_keys if job_key in jobs]
+
+
+def is_cancelled(job_id: str) -> bool:
+    return bool(_cache().get(_cancel_key(job_id)))
+
+
+def cancel(job_id: str) -> None:
+    """
+    Cancel a job. Queued jobs will not run and running jobs stop before
+    the restored database is swapped in.
+    """
+    get(job_id)  # Ensure the job exists
+    _cache().set(_cancel_key(job_id), True, _TIMEOUT)
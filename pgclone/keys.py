@@ -0,0 +1,76 @@
+import datetime as dt
+import re
+
+_DUMP_KEY_RE = re.compile(
+    r"^(?P<instance>[\w-]+)/(?P<database>[\w-]+)/(?P<config>[\w-]+)/"
+    r"(?P<timestamp>\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2}-\d+)\.dump$"
+)
+
+
+class DumpKey:
+    """
+    A parsed dump key in the format of "instance/database/config/timestamp.dump".
+
+    Keys that don't follow the format (which are only listed when
+    `settings.PGCLONE_VALIDATE_DUMP_KEYS` is `False`) have no
+    instance, database, config, or timestamp.
+    """
+
+    __slots__ = ("key", "instance", "database", "config", "timestamp")
+
+    def __init__(self, key, *, instance=None, database=None, config=None, timestamp=None):
+        self.key = key
+        self.instance = instance
+        self.database = database
+        self.config = config
+        self.timestamp = timestamp
+
+    def __str__(self):
+        return self.key
+
+    def __repr__(self):
+        return f"DumpKey({self.key!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, DumpKey) and self.key == other.key
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    @property
+    def is_valid(self):
+        return self.timestamp is not None
+
+    @property
+    def group(self):
+        """The (instance, database, config) group of the key"""
+        return (self.instance, self.database, self.config)
+
+
+def _parse_timestamp(timestamp):
+    # Avoid strptime, which is an order of magnitude slower when listing
+    # large amounts of keys
+    return dt.datetime(*(int(part) for part in timestamp.split("-")))
+
+
+def parse(key):
+    """Parse a dump key string, returning an unstructured `DumpKey` if it is invalid"""
+    match = _DUMP_KEY_RE.match(key)
+    if not match:
+        return DumpKey(key)
+
+    try:
+        timestamp = _parse_timestamp(match["timestamp"])
+    except ValueError:  # pragma: no cover
+        return DumpKey(key)
+
+    return DumpKey(
+        key,
+        instance=match["instance"],
+        database=match["database"],
+        config=match["config"],
+        timestamp=timestamp,
+    )
@@ -1,32 +1,103 @@
-import re
+import datetime as dt
+import heapq
+import itertools
 import subprocess
 from typing import List, Union
 
-from pgclone import db, exceptions, options, settings, storage
+from pgclone import db, exceptions, keys, manifest, options, settings, storage
 
 
-def _is_valid_dump_key(dump_key):
+def _naive_utc(value):
     """
-    True if the `dump_key` is in the valid format of
-    "database_name/timestamp.dump"
+    Dump key timestamps are naive UTC times, so times with a time zone are
+    converted to naive UTC times before being compared with them
     """
-    regexmatch = re.match(
-        r"^[\w-]+/[\w-]+/[\w-]+/\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2}-\d+\.dump$",
-        dump_key,
-    )
-    return regexmatch if settings.validate_dump_keys() else True
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(dt.timezone.utc).replace(tzinfo=None)
 
+    return value
 
-def _parse_dump_key(dump_key):
-    regexmatch = re.match(
-        r"^(?P<instance>[\w-]+)/(?P<database>[\w-]+)/(?P<config>[\w-]+)/"
-        r"\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2}-\d+\.dump$",
-        dump_key,
-    )
-    return regexmatch.groupdict() if regexmatch else None
 
+def _iter_dump_keys(storage_client, *, prefix, since, until):
+    """
+    Lazily yield parsed dump keys from storage, filtering out invalid keys and
+    keys outside of the `since` and `until` range
+    """
+    validate = settings.validate_dump_keys()
+
+    for key in storage_client.iter_keys(prefix=prefix):
+        if manifest.is_manifest_key(key):
+            continue
+
+        dump_key = keys.parse(key)
+
+        if not dump_key.is_valid:
+            # Invalid keys have no timestamp and can't be filtered by time
+            if validate or since or until:
+                continue
+        elif (since and dump_key.timestamp < since) or (until and dump_key.timestamp > until):
+            continue
 
-def _ls(*, dump_key, instances, databases, configs, local, database, storage_location, config):
+        yield dump_key
+
+
+def _latest_per_group(dump_keys, *, reverse_sorted):
+    """Only keep the latest key of every instance/database/config group"""
+    if reverse_sorted:
+        # The first key of every group is the latest, so keys can be streamed
+        seen = set()
+        for dump_key in dump_keys:
+            if dump_key.is_valid and dump_key.group not in seen:
+                seen.add(dump_key.group)
+                yield dump_key
+    else:
+        latest = {}
+        for dump_key in dump_keys:
+            if dump_key.is_valid and (
+                dump_key.group not in latest or latest[dump_key.group] < dump_key
+            ):
+                latest[dump_key.group] = dump_key
+
+        yield from latest.values()
+
+
+def _query(storage_client, *, prefix, since, until, limit, latest_per_group):
+    """
+    Query dump keys, returning them in reverse order.
+
+    When the storage backend lists keys in reverse order, the listing stops
+    as soon as `limit` keys are found. Otherwise only `limit` keys are kept
+    in memory while listing.
+    """
+    dump_keys = _iter_dump_keys(storage_client, prefix=prefix, since=since, until=until)
+    reverse_sorted = storage_client.reverse_sorted
+
+    if latest_per_group:
+        dump_keys = _latest_per_group(dump_keys, reverse_sorted=reverse_sorted)
+
+    if reverse_sorted:
+        return list(itertools.islice(dump_keys, limit))
+    elif limit is not None:
+        return heapq.nlargest(limit, dump_keys)
+    else:
+        return sorted(dump_keys, reverse=True)
+
+
+def _ls(
+    *,
+    dump_key,
+    instances,
+    databases,
+    configs,
+    local,
+    database,
+    storage_location,
+    config,
+    since=None,
+    until=None,
+    limit=None,
+    latest_per_group=False,
+):
     """
     Ls implementation
     """
@@ -35,7 +106,11 @@ def _ls(*, dump_key, instances, databases, configs, local, database, storage_loc
             'Can only use one of "instances", "databases", "configs", or "local".'
         )
 
+    if limit is not None and limit < 0:
+        raise exceptions.ValueError('"limit" must be a non-negative number.')
+
     storage_client = storage.client(storage_location)
+    since, until = _naive_utc(since), _naive_utc(until)
 
     if local:
         conn_db_url = db.url(db.conn(using=database))
@@ -44,22 +119,21 @@ def _ls(*, dump_key, instances, databases, configs, local, database, storage_loc
 
         return [f":{db_name.strip()}" for db_name in stdout.split("\n") if db_name.strip()]
 
-    dump_keys = [
-        dump_key for dump_key in storage_client.ls(prefix=dump_key) if _is_valid_dump_key(dump_key)
-    ]
-
     if instances or databases or configs:
-        parsed_dump_keys = [_parse_dump_key(dump_key) for dump_key in dump_keys]
-        if instances:
-            return sorted({dump_key["instance"] for dump_key in parsed_dump_keys if dump_key})
-        elif databases:
-            return sorted({dump_key["database"] for dump_key in parsed_dump_keys if dump_key})
-        elif configs:
-            return sorted({dump_key["config"] for dump_key in parsed_dump_keys if dump_key})
-        else:
-            raise AssertionError
+        attr = "instance" if instances else "database" if databases else "config"
+        dump_keys = _iter_dump_keys(storage_client, prefix=dump_key, since=since, until=until)
+        values = sorted({getattr(dump_key, attr) for dump_key in dump_keys if dump_key.is_valid})
+        return values[:limit]
     else:
-        return sorted(dump_keys, reverse=True)
+        dump_keys = _query(
+            storage_client,
+            prefix=dump_key,
+            since=since,
+            until=until,
+            limit=limit,
+            latest_per_group=latest_per_group,
+        )
+        return [str(dump_key) for dump_key in dump_keys]
 
 
 def ls(
@@ -72,6 +146,10 @@ def ls(
     database: Union[str, None] = None,
     storage_location: Union[str, None] = None,
     config: Union[str, None] = None,
+    since: Union[dt.datetime, None] = None,
+    until: Union[dt.datetime, None] = None,
+    limit: Union[int, None] = None,
+    latest_per_group: bool = False,
 ) -> List[str]:
     """
     Lists dump keys.
@@ -85,9 +163,14 @@ def ls(
         database: The database to restore.
         storage_location: The storage location to use for the restore.
         config: The configuration name from `settings.PGCLONE_CONFIGS`.
+        since: Only list dump keys created at or after this time. Naive times are UTC.
+        until: Only list dump keys created at or before this time. Naive times are UTC.
+        limit: Return at most this many results.
+        latest_per_group: Only list the latest dump key of every instance, database,
+            and config.
 
     Returns:
-        The list of dump keys.
+        The list of dump keys, most recent first.
     """
     opts = options.get(
         dump_key=dump_key, config=config, database=database, storage_location=storage_location
@@ -102,4 +185,8 @@ def ls(
         databases=databases,
         configs=configs,
         local=local,
+        since=since,
+        until=until,
+        limit=limit,
+        latest_per_group=latest_per_group,
     )
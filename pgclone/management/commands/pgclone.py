@@ -1,8 +1,51 @@
+import datetime as dt
 import sys
 
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 
-from pgclone import copy_cmd, dump_cmd, exceptions, logging, ls_cmd, restore_cmd
+from pgclone import (
+    backfill,
+    clone_cmd,
+    copy_cmd,
+    db,
+    dump_cmd,
+    exceptions,
+    jobs,
+    logging,
+    ls_cmd,
+    plan,
+    provenance,
+    restore_cmd,
+    settings,
+    sync,
+)
+
+
+def _fmt_bytes(num_bytes):
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(num_bytes) < 1024 or unit == "TB":
+            return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{num_bytes} B"
+        num_bytes /= 1024
+
+
+def _keep_partitions(value):
+    """Parse a number of partitions or a date"""
+    return int(value) if value.isdigit() else value
+
+
+def _write_plan(results):
+    for key, value in results.items():
+        if value is None:
+            value = "unknown"
+        elif key.endswith("_bytes"):
+            value = _fmt_bytes(value)
+        elif key == "seconds":
+            value = f"{value:.0f}"
+        elif isinstance(value, list):
+            value = ", ".join(value) or "none"
+
+        sys.stdout.write(f"{key}: {value}\n")
 
 
 class Subcommands(BaseCommand):
@@ -63,6 +106,28 @@ class LsCommand(BaseSubcommand):
         parser.add_argument("--databases", action="store_true", help="Only list databases.")
         parser.add_argument("--configs", action="store_true", help="Only list configs.")
         parser.add_argument("--local", action="store_true", help="Only list local restore keys.")
+        parser.add_argument(
+            "--since",
+            type=dt.datetime.fromisoformat,
+            help=(
+                "Only list dump keys created at or after this ISO-formatted time."
+                " Times without a time zone are UTC."
+            ),
+        )
+        parser.add_argument(
+            "--until",
+            type=dt.datetime.fromisoformat,
+            help=(
+                "Only list dump keys created at or before this ISO-formatted time."
+                " Times without a time zone are UTC."
+            ),
+        )
+        parser.add_argument("--limit", type=int, help="List at most this many results.")
+        parser.add_argument(
+            "--latest-per-group",
+            action="store_true",
+            help="Only list the latest dump key of every instance, database, and config.",
+        )
         parser.add_argument(
             "-d",
             "--database",
@@ -89,15 +154,71 @@ class LsCommand(BaseSubcommand):
             database=options["database"],
             storage_location=options["storage_location"],
             config=options["config"],
+            since=options["since"],
+            until=options["until"],
+            limit=options["limit"],
+            latest_per_group=options["latest_per_group"],
+        )
+        local_provenance = (
+            provenance.local(using=options["database"] or settings.database())
+            if options["local"]
+            else {}
         )
         for dump_name in results:
+            # Local databases restored by pgclone show where they came from
+            if dump_name[1:] in local_provenance:
+                restored = local_provenance[dump_name[1:]]
+                dump_name += f"\t{restored['dump_key']}\t{restored['restored_at']}"
+
             sys.stdout.write(dump_name + "\n")
 
 
 class DumpCommand(BaseSubcommand):
     def add_arguments(self, parser):
         parser.add_argument(
-            "-e", "--exclude", nargs="*", help="Model(s) you wish to exclude when dumping."
+            "-e",
+            "--exclude",
+            nargs="*",
+            help=(
+                "Model(s), app(s), or table:<glob> and regex:<pattern> table patterns"
+                " you wish to exclude when dumping."
+            ),
+        )
+        parser.add_argument(
+            "--exclude-larger-than",
+            type=int,
+            help="Exclude the data of tables larger than this many bytes.",
+        )
+        parser.add_argument(
+            "--keep-partitions",
+            type=_keep_partitions,
+            help=(
+                "Exclude the data of older partitions, keeping this many of the newest"
+                " partitions or the partitions with data newer than this date."
+            ),
+        )
+        parser.add_argument(
+            "--schema",
+            nargs="*",
+            dest="schemas",
+            help="Only dump schemas matching these patterns.",
+        )
+        parser.add_argument(
+            "--exclude-schema",
+            nargs="*",
+            dest="exclude_schemas",
+            help="Don't dump schemas matching these patterns.",
+        )
+        parser.add_argument(
+            "--split-schemas",
+            action="store_true",
+            help="Dump every matching schema to its own archive in parallel.",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            help="Dump this many schemas in parallel when splitting schemas.",
         )
         parser.add_argument(
             "--pre-dump-hook",
@@ -114,11 +235,50 @@ class DumpCommand(BaseSubcommand):
             "--database",
             help="Dump this database.",
         )
+        parser.add_argument(
+            "--from",
+            dest="dump_from",
+            help="Run pg_dump on this replica of the dumped database.",
+        )
         parser.add_argument(
             "-s",
             "--storage-location",
             help="Dump to this storage location.",
         )
+        parser.add_argument(
+            "--analyze",
+            default=None,  # Use None so that configs/settings can be used as defaults
+            action="store_true",
+            help="Include planner statistics in the dump when supported by pg_dump.",
+        )
+        parser.add_argument(
+            "--rate-limit",
+            type=int,
+            help="Stream the dump to storage at most this many bytes per second.",
+        )
+        parser.add_argument(
+            "--nice",
+            type=int,
+            help="Run pg_dump and the storage uploader with this niceness.",
+        )
+        parser.add_argument(
+            "--if-changed",
+            action="store_true",
+            help="Skip the dump if the database didn't change since it was last dumped.",
+        )
+        parser.add_argument(
+            "--engine",
+            choices=["logical", "physical"],
+            help=(
+                "Dump the database with pg_dump (logical) or back up its entire cluster"
+                " with pg_basebackup (physical)."
+            ),
+        )
+        parser.add_argument(
+            "--plan",
+            action="store_true",
+            help="Estimate the dump without running it.",
+        )
         parser.add_argument(
             "-c",
             "--config",
@@ -126,19 +286,74 @@ class DumpCommand(BaseSubcommand):
         )
 
     def subhandle(self, *args, **options):
+        if options["plan"]:
+            return _write_plan(
+                plan.dump(
+                    exclude=options["exclude"],
+                    exclude_larger_than=options["exclude_larger_than"],
+                    keep_partitions=options["keep_partitions"],
+                    database=options["database"],
+                    config=options["config"],
+                )
+            )
+
+        if options["split_schemas"]:
+            if options["engine"]:
+                raise exceptions.ValueError("--split-schemas can't be used with --engine.")
+
+            dump_keys = dump_cmd.dump_schemas(
+                options["schemas"],
+                exclude_schemas=options["exclude_schemas"],
+                exclude=options["exclude"],
+                exclude_larger_than=options["exclude_larger_than"],
+                keep_partitions=options["keep_partitions"],
+                pre_dump_hooks=options["pre_dump_hooks"],
+                instance=options["instance"],
+                database=options["database"],
+                storage_location=options["storage_location"],
+                analyze=options["analyze"],
+                rate_limit=options["rate_limit"],
+                nice=options["nice"],
+                dump_from=options["dump_from"],
+                if_changed=options["if_changed"],
+                jobs=options["jobs"],
+                config=options["config"],
+            )
+            for schema, dump_key in dump_keys.items():
+                sys.stdout.write(f"{schema}: {dump_key}\n")
+
+            return
+
         dump_cmd.dump(
             exclude=options["exclude"],
+            exclude_larger_than=options["exclude_larger_than"],
+            keep_partitions=options["keep_partitions"],
+            schemas=options["schemas"],
+            exclude_schemas=options["exclude_schemas"],
             pre_dump_hooks=options["pre_dump_hooks"],
             instance=options["instance"],
             database=options["database"],
             storage_location=options["storage_location"],
+            analyze=options["analyze"],
+            rate_limit=options["rate_limit"],
+            nice=options["nice"],
+            dump_from=options["dump_from"],
+            if_changed=options["if_changed"],
+            engine=options["engine"],
             config=options["config"],
         )
 
 
 class RestoreCommand(BaseSubcommand):
     def add_arguments(self, parser):
-        parser.add_argument("dump_key", nargs="?", help="The dump key (or prefix) to restore.")
+        parser.add_argument(
+            "dump_key",
+            nargs="*",
+            help=(
+                "The dump key (or prefix) to restore. Use database=dump_key pairs to"
+                " restore several databases concurrently and swap them in together."
+            ),
+        )
         parser.add_argument(
             "--pre-swap-hook",
             nargs="*",
@@ -166,6 +381,64 @@ class RestoreCommand(BaseSubcommand):
             "--storage-location",
             help="Restore from this storage location.",
         )
+        parser.add_argument(
+            "--analyze",
+            default=None,  # Use None so that configs/settings can be used as defaults
+            action="store_true",
+            help="Rebuild planner statistics before swapping in the restored database.",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            help="Use this many parallel jobs when analyzing and prewarming.",
+        )
+        parser.add_argument(
+            "--backfill",
+            nargs="*",
+            help=(
+                "Model(s) or table(s) whose data is restored after the restored"
+                " database is swapped in."
+            ),
+        )
+        parser.add_argument(
+            "--schema",
+            nargs="*",
+            dest="schemas",
+            help="Only restore schemas matching these patterns.",
+        )
+        parser.add_argument(
+            "--exclude-schema",
+            nargs="*",
+            dest="exclude_schemas",
+            help="Don't restore schemas matching these patterns.",
+        )
+        parser.add_argument(
+            "--prewarm",
+            nargs="*",
+            help=(
+                "Model(s), table(s), largest:N, or most_read:N tables to load"
+                " into the buffer cache after the swap."
+            ),
+        )
+        parser.add_argument(
+            "--if-changed",
+            action="store_true",
+            help=(
+                "Skip the restore if the database was already restored from the latest"
+                " matching dump with the same pre-swap hooks."
+            ),
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Resume an interrupted restore from its last completed phase.",
+        )
+        parser.add_argument(
+            "--plan",
+            action="store_true",
+            help="Estimate the restore and check disk space without running it.",
+        )
         parser.add_argument(
             "-c",
             "--config",
@@ -173,12 +446,131 @@ class RestoreCommand(BaseSubcommand):
         )
 
     def subhandle(self, *args, **options):
+        if any("=" in dump_key for dump_key in options["dump_key"]):
+            return self._restore_many(**options)
+
+        if len(options["dump_key"]) > 1:
+            raise exceptions.ValueError(
+                "Use database=dump_key pairs to restore more than one database."
+            )
+
+        options["dump_key"] = options["dump_key"][0] if options["dump_key"] else None
+        if options["plan"]:
+            return _write_plan(
+                plan.restore(
+                    dump_key=options["dump_key"],
+                    reversible=options["reversible"],
+                    database=options["database"],
+                    storage_location=options["storage_location"],
+                    config=options["config"],
+                )
+            )
+
         restore_cmd.restore(
             dump_key=options["dump_key"],
             pre_swap_hooks=options["pre_swap_hooks"],
             reversible=options["reversible"],
             database=options["database"],
             storage_location=options["storage_location"],
+            analyze=options["analyze"],
+            jobs=options["jobs"],
+            prewarm=options["prewarm"],
+            backfill=options["backfill"],
+            schemas=options["schemas"],
+            exclude_schemas=options["exclude_schemas"],
+            if_changed=options["if_changed"],
+            resume=options["resume"],
+            config=options["config"],
+        )
+
+    def _restore_many(self, **options):
+        if not all("=" in dump_key for dump_key in options["dump_key"]):
+            raise exceptions.ValueError("Every dump key must be a database=dump_key pair.")
+        elif (
+            options["plan"]
+            or options["database"]
+            or options["backfill"]
+            or options["if_changed"]
+            or options["resume"]
+        ):
+            raise exceptions.ValueError(
+                "--plan, --database, --backfill, --if-changed and --resume can't be used when"
+                " restoring several databases."
+            )
+
+        restore_cmd.restore_many(
+            dict(dump_key.split("=", 1) for dump_key in options["dump_key"]),
+            pre_swap_hooks=options["pre_swap_hooks"],
+            reversible=options["reversible"],
+            storage_location=options["storage_location"],
+            analyze=options["analyze"],
+            jobs=options["jobs"],
+            prewarm=options["prewarm"],
+            schemas=options["schemas"],
+            exclude_schemas=options["exclude_schemas"],
+            config=options["config"],
+        )
+
+
+class CloneCommand(BaseSubcommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from",
+            dest="source",
+            help="The database alias or postgres:// URL to clone.",
+        )
+        parser.add_argument(
+            "-e", "--exclude", nargs="*", help="Model(s) you wish to exclude when cloning."
+        )
+        parser.add_argument(
+            "--pre-swap-hook",
+            nargs="*",
+            dest="pre_swap_hooks",
+            help=(
+                "Management command(s) that will be executed on"
+                " the cloned database before it is swapped to the"
+                " primary database."
+            ),
+        )
+        parser.add_argument(
+            "-r",
+            "--reversible",
+            default=None,  # Use None so that configs/settings can be used as defaults
+            action="store_true",
+            help="Keep pre/post clone database copies available for reversion.",
+        )
+        parser.add_argument(
+            "-d",
+            "--database",
+            help="Clone into this database.",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            help="Use this many parallel jobs, spooling the clone locally.",
+        )
+        parser.add_argument(
+            "--analyze",
+            default=None,  # Use None so that configs/settings can be used as defaults
+            action="store_true",
+            help="Rebuild planner statistics before swapping in the cloned database.",
+        )
+        parser.add_argument(
+            "-c",
+            "--config",
+            help="Use this configuration to supply default option values.",
+        )
+
+    def subhandle(self, *args, **options):
+        clone_cmd.clone(
+            source=options["source"],
+            exclude=options["exclude"],
+            pre_swap_hooks=options["pre_swap_hooks"],
+            reversible=options["reversible"],
+            database=options["database"],
+            jobs=options["jobs"],
+            analyze=options["analyze"],
             config=options["config"],
         )
 
@@ -194,6 +586,17 @@ class CopyCommand(BaseSubcommand):
             "--database",
             help="Copy this database.",
         )
+        parser.add_argument(
+            "--strategy",
+            choices=copy_cmd.STRATEGIES,
+            help="The strategy for copying the database.",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            help="Use this many parallel jobs for the dump strategy.",
+        )
         parser.add_argument(
             "-c",
             "--config",
@@ -204,14 +607,174 @@ class CopyCommand(BaseSubcommand):
         copy_cmd.copy(
             dump_key=options["dump_key"],
             database=options["database"],
+            strategy=options["strategy"],
+            jobs=options["jobs"],
             config=options["config"],
         )
 
 
+class JobsCommand(BaseSubcommand):
+    def add_arguments(self, parser):
+        parser.add_argument("job_id", nargs="?", help="Show the status and log of this job.")
+        parser.add_argument("--cancel", action="store_true", help="Cancel the job.")
+
+    def subhandle(self, *args, **options):
+        job_id = options["job_id"]
+
+        if options["cancel"]:
+            if not job_id:
+                raise exceptions.ValueError("Must provide a job ID to cancel.")
+
+            jobs.cancel(job_id)
+            sys.stdout.write(f"Cancelled job {job_id}\n")
+        elif job_id:
+            job = jobs.get(job_id)
+            for field in ("status", "phase", "database", "dump_key", "error"):
+                if job.get(field):
+                    sys.stdout.write(f"{field}: {job[field]}\n")
+            sys.stdout.write(job["log"])
+        else:
+            for job in jobs.ls():
+                sys.stdout.write(
+                    f"{job['id']} {job['status']} {job.get('database') or ''}"
+                    f" {job.get('dump_key') or ''}\n"
+                )
+
+
+class BackfillCommand(BaseSubcommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-d",
+            "--database",
+            help="Backfill this database.",
+        )
+        parser.add_argument(
+            "--status",
+            action="store_true",
+            help="Show the pending and backfilled tables without backfilling.",
+        )
+
+    def subhandle(self, *args, **options):
+        if options["status"]:
+            state = backfill.status(database=options["database"])
+            if not state:
+                sys.stdout.write("No backfill in progress\n")
+            else:
+                sys.stdout.write(f"dump_key: {state['dump_key']}\n")
+                sys.stdout.write(f"done: {', '.join(state['done'])}\n")
+                sys.stdout.write(f"pending: {', '.join(state['pending'])}\n")
+        else:
+            backfill.resume(database=options["database"])
+
+
+class SyncCommand(BaseSubcommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from",
+            dest="source",
+            help="Start syncing from this database.",
+        )
+        parser.add_argument(
+            "-d",
+            "--database",
+            help="Sync this database.",
+        )
+        parser.add_argument(
+            "-s",
+            "--storage-location",
+            help="The storage location of the initial dump.",
+        )
+        parser.add_argument(
+            "--pre-swap-hook",
+            nargs="*",
+            dest="pre_swap_hooks",
+            help="Hook(s) to run on the initial copy or with --run-hooks.",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            help="Restore the initial copy with this many parallel jobs.",
+        )
+        parser.add_argument(
+            "-c",
+            "--config",
+            help="Use this config from settings.PGCLONE_CONFIGS.",
+        )
+        actions = parser.add_mutually_exclusive_group()
+        actions.add_argument(
+            "--status", action="store_true", help="Show the lag of the synced database."
+        )
+        actions.add_argument("--pause", action="store_true", help="Pause syncing.")
+        actions.add_argument("--resume", action="store_true", help="Resume syncing.")
+        actions.add_argument(
+            "--run-hooks",
+            action="store_true",
+            help="Pause syncing while running pre-swap hooks on the synced database.",
+        )
+        actions.add_argument(
+            "--stop",
+            action="store_true",
+            help="Stop syncing and drop the subscription, slot and publication.",
+        )
+
+    def subhandle(self, *args, **options):
+        if options["status"]:
+            state = sync.status(database=options["database"])
+            for key in ("source", "enabled", "lag_seconds", "lag_bytes"):
+                value = "unknown" if state[key] is None else state[key]
+                sys.stdout.write(f"{key}: {value}\n")
+        elif options["pause"]:
+            sync.pause(database=options["database"])
+        elif options["resume"]:
+            sync.resume(database=options["database"])
+        elif options["run_hooks"]:
+            sync.run_hooks(
+                options["pre_swap_hooks"], database=options["database"], config=options["config"]
+            )
+        elif options["stop"]:
+            sync.stop(database=options["database"])
+        elif not options["source"]:
+            raise exceptions.ValueError("Must provide a database to sync from with --from.")
+        else:
+            sync.start(
+                options["source"],
+                database=options["database"],
+                storage_location=options["storage_location"],
+                pre_swap_hooks=options["pre_swap_hooks"],
+                jobs=options["jobs"],
+                config=options["config"],
+            )
+
+
+class HookCommand(BaseCommand):
+    help = "Run a management command hook on a routed database. Used by subprocess hooks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("hook", help="The management command to run.")
+        parser.add_argument("--route", required=True, help="Route queries to this database.")
+        parser.add_argument(
+            "-d",
+            "--database",
+            help="The database alias to use for connecting to the routed database.",
+        )
+
+    def handle(self, *args, **options):
+        database = options["database"] or settings.database()
+        # Output isn't buffered so that the parent process can stream it
+        with db.route(db.make(options["route"], using=database, check=False)):
+            call_command(options["hook"])
+
+
 class Command(Subcommands):
     subcommands = {
         "ls": LsCommand,
         "dump": DumpCommand,
         "restore": RestoreCommand,
         "copy": CopyCommand,
+        "clone": CloneCommand,
+        "jobs": JobsCommand,
+        "backfill": BackfillCommand,
+        "sync": SyncCommand,
+        "hook": HookCommand,
     }
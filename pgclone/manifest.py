@@ -0,0 +1,107 @@
+"""
+Dump manifests are JSON files stored next to dumps. They record information
+about the dumped database that is used when restoring, such as the largest and
+most-read tables.
+"""
+
+import json
+import os
+
+from pgclone import db
+
+# The maximum number of tables recorded for each ranking
+_MAX_TABLES = 100
+
+
+def key(dump_key):
+    """Return the key of the manifest for a dump key"""
+    return os.path.splitext(dump_key)[0] + ".json"
+
+
+def is_manifest_key(key):
+    return key.endswith(".json")
+
+
+def _tables(database, *, order_by):
+    return [
+        {"name": name, "bytes": num_bytes, "reads": reads}
+        for name, num_bytes, reads in db.query(
+            "SELECT quote_ident(schemaname) || '.' || quote_ident(relname),"
+            " pg_total_relation_size(relid),"
+            " COALESCE(heap_blks_read, 0) + COALESCE(heap_blks_hit, 0)"
+            " + COALESCE(idx_blks_read, 0) + COALESCE(idx_blks_hit, 0) AS reads"
+            f" FROM pg_statio_user_tables ORDER BY {order_by} DESC LIMIT %s",
+            [_MAX_TABLES],
+            database=database,
+        )
+    ]
+
+
+def _manifest(*, largest_tables, most_read_tables, excluded_tables):
+    return {
+        "largest_tables": largest_tables,
+        "most_read_tables": most_read_tables,
+        "excluded_tables": [
+            {
+                "name": f"{entry['schema']}.{entry['table']}",
+                "bytes": entry["bytes"],
+                "rule": entry["rule"],
+            }
+            for entry in excluded_tables
+        ],
+    }
+
+
+def collect(database, *, excluded_tables=()):
+    """Collect the manifest of a database that is about to be dumped"""
+    return _manifest(
+        largest_tables=_tables(database, order_by="2"),
+        most_read_tables=_tables(database, order_by="reads"),
+        excluded_tables=excluded_tables,
+    )
+
+
+def collect_schemas(database, schemas, *, excluded_tables=()):
+    """
+    Collect the manifests of schemas of a database that are about to be dumped,
+    reading the tables of the database once.
+
+    Returns:
+        A dictionary of schema names to their manifests.
+    """
+    rows = db.query(
+        "SELECT schemaname, quote_ident(schemaname) || '.' || quote_ident(relname),"
+        " pg_total_relation_size(relid),"
+        " COALESCE(heap_blks_read, 0) + COALESCE(heap_blks_hit, 0)"
+        " + COALESCE(idx_blks_read, 0) + COALESCE(idx_blks_hit, 0)"
+        " FROM pg_statio_user_tables WHERE schemaname = ANY(%s)",
+        [list(schemas)],
+        database=database,
+    )
+
+    manifests = {}
+    for schema in schemas:
+        tables = [
+            {"name": name, "bytes": num_bytes, "reads": reads}
+            for table_schema, name, num_bytes, reads in rows
+            if table_schema == schema
+        ]
+        manifests[schema] = _manifest(
+            largest_tables=sorted(tables, key=lambda table: -table["bytes"])[:_MAX_TABLES],
+            most_read_tables=sorted(tables, key=lambda table: -table["reads"])[:_MAX_TABLES],
+            excluded_tables=[entry for entry in excluded_tables if entry["schema"] == schema],
+        )
+
+    return manifests
+
+
+def write(storage_client, dump_key, manifest):
+    file_path = os.path.join(storage_client.storage_location, key(dump_key))
+    storage_client.write(file_path, json.dumps(manifest, indent=2).encode("utf-8"))
+
+
+def read(storage_client, dump_key):
+    """Read the manifest of a dump, returning an empty dictionary if there is none"""
+    file_path = os.path.join(storage_client.storage_location, key(dump_key))
+    contents = storage_client.read(file_path)
+    return json.loads(contents) if contents else {}
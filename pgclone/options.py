@@ -15,11 +15,26 @@ class _Options:
         dump_key=None,
         reversible=None,
         exclude=None,
+        exclude_larger_than=None,
+        keep_partitions=None,
+        schemas=None,
+        exclude_schemas=None,
+        scrub=None,
         pre_swap_hooks=None,
         pre_dump_hooks=None,
         instance=None,
         database=None,
         storage_location=None,
+        jobs=None,
+        source=None,
+        copy_strategy=None,
+        analyze=None,
+        prewarm=None,
+        backfill=None,
+        dump_rate_limit=None,
+        dump_nice=None,
+        dump_from=None,
+        dump_engine=None,
     ):
         """Parse options for pgclone commands
 
@@ -41,6 +56,11 @@ class _Options:
         if (
             not config
             or exclude is not None
+            or exclude_larger_than is not None
+            or keep_partitions is not None
+            or schemas is not None
+            or exclude_schemas is not None
+            or scrub is not None
             or pre_dump_hooks is not None
             or pre_swap_hooks is not None
         ):
@@ -72,6 +92,61 @@ class _Options:
         self.exclude = (
             _first_non_none(exclude, config_opts.get("exclude"), settings.exclude()) or []
         )
+        self.exclude_larger_than = _first_non_none(
+            exclude_larger_than,
+            config_opts.get("exclude_larger_than"),
+            settings.exclude_larger_than(),
+        )
+        self.keep_partitions = _first_non_none(
+            keep_partitions, config_opts.get("keep_partitions"), settings.keep_partitions()
+        )
+        self.schemas = (
+            _first_non_none(schemas, config_opts.get("schemas"), settings.schemas()) or []
+        )
+        self.exclude_schemas = (
+            _first_non_none(
+                exclude_schemas, config_opts.get("exclude_schemas"), settings.exclude_schemas()
+            )
+            or []
+        )
+        self.scrub = _first_non_none(scrub, config_opts.get("scrub"), settings.scrub()) or {}
+        self.jobs = _first_non_none(jobs, config_opts.get("jobs"), settings.jobs()) or 1
+        self.source = source or config_opts.get("source")
+        self.copy_strategy = (
+            copy_strategy or config_opts.get("copy_strategy") or settings.copy_strategy()
+        )
+        self.analyze = (
+            _first_non_none(analyze, config_opts.get("analyze"), settings.analyze()) or False
+        )
+        self.prewarm = (
+            _first_non_none(prewarm, config_opts.get("prewarm"), settings.prewarm()) or []
+        )
+        self.backfill = (
+            _first_non_none(backfill, config_opts.get("backfill"), settings.backfill()) or []
+        )
+        self.dump_rate_limit = _first_non_none(
+            dump_rate_limit, config_opts.get("dump_rate_limit"), settings.dump_rate_limit()
+        )
+        self.dump_nice = _first_non_none(
+            dump_nice, config_opts.get("dump_nice"), settings.dump_nice()
+        )
+        self.dump_health_query = (
+            config_opts.get("dump_health_query") or settings.dump_health_query()
+        )
+        self.dump_health_threshold = _first_non_none(
+            config_opts.get("dump_health_threshold"), settings.dump_health_threshold()
+        )
+        self.dump_from = dump_from or config_opts.get("dump_from") or settings.dump_from()
+        self.dump_engine = dump_engine or config_opts.get("dump_engine") or settings.dump_engine()
+        if self.dump_engine not in ("logical", "physical"):
+            raise exceptions.ValueError(f'"{self.dump_engine}" is not a valid dump engine.')
+
+        self.dump_max_lag = _first_non_none(
+            config_opts.get("dump_max_lag"), settings.dump_max_lag()
+        )
+        self.dump_lag_timeout = (
+            _first_non_none(config_opts.get("dump_lag_timeout"), settings.dump_lag_timeout()) or 0
+        )
         self.config = config
 
 
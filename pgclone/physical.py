@@ -0,0 +1,237 @@
+"""
+Physical backups and restores of entire Postgres clusters.
+
+Physical dumps are compressed tar-format base backups taken with
+`pg_basebackup`. They're stored like other dumps, and their manifest marks
+them as physical so that restores know how to restore them.
+
+Physical backups are restored into a local data directory under
+`settings.PGCLONE_PHYSICAL_DIR` instead of into a database. The restored
+cluster is started on a temporary port for pre-swap hooks and then swapped with
+the cluster of the restored database alias, which serves on the port of the
+alias. Like logical restores, reversible restores keep the previous data
+directory around as the `__pre` directory, which is restored with `:pre`.
+"""
+
+import contextlib
+import fcntl
+import os
+import pathlib
+import shlex
+import shutil
+
+from pgclone import db, exceptions, hooks, jobs, logging, run, settings, spans
+
+ENGINE = "physical"
+
+# Settings that make restored clusters only reachable locally. They're appended to
+# postgresql.auto.conf, which overrides postgresql.conf. Sockets are created in the
+# data directory, which is relative since data directories are renamed when swapped
+_CONF = """
+# Added by pgclone when restoring a physical backup
+port = {port}
+listen_addresses = 'localhost'
+unix_socket_directories = '.'
+primary_conninfo = ''
+"""
+
+# Used when the backed up cluster kept its pg_hba.conf outside of its data directory
+_HBA_CONF = """local all all trust
+host all all 127.0.0.1/32 scram-sha-256
+host all all ::1/128 scram-sha-256
+"""
+
+
+def backup(source_db, *, storage_client, file_path):
+    """Stream a base backup of the cluster of a database to storage"""
+    # Base backups streamed to stdout must fetch the WAL needed to make them consistent
+    run.shell(
+        f"pg_basebackup -d {db.url(source_db)} -D - -Ft -z -X fetch -c fast"
+        f" {storage_client.pg_dump(file_path)}",
+        env=storage_client.env,
+    )
+
+
+def _data_dirs(database):
+    """
+    Return the data, temp, swap and pre data directories of the cluster of a
+    database alias
+    """
+    physical_dir = settings.physical_dir()
+    if not physical_dir:
+        raise exceptions.RuntimeError(
+            "Set settings.PGCLONE_PHYSICAL_DIR to restore physical backups."
+        )
+
+    data_dir = os.path.join(os.path.abspath(physical_dir), db.conf(using=database)["NAME"])
+    return data_dir, data_dir + "__temp", data_dir + "__swap", data_dir + "__pre"
+
+
+def _temp_port(database):
+    port = int(db.conf(using=database)["PORT"] or 5432)
+    return settings.physical_temp_port() or port + 1
+
+
+@contextlib.contextmanager
+def _lock(data_dir):
+    """Serialize physical restores of the same cluster across processes"""
+    os.makedirs(os.path.dirname(data_dir), exist_ok=True)
+    with open(data_dir + ".lock", "w") as lock_f:
+        fcntl.flock(lock_f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_f, fcntl.LOCK_UN)
+
+
+def _is_running(data_dir):
+    return os.path.exists(os.path.join(data_dir, "postmaster.pid"))
+
+
+def _start(data_dir, *, port=None):
+    """Start the cluster of a data directory, optionally on another port"""
+    options = f" -o {shlex.quote(f'-p {port}')}" if port else ""
+    log_path = os.path.join(data_dir, "pgclone.log")
+    run.shell(f"pg_ctl -D {shlex.quote(data_dir)} -l {shlex.quote(log_path)}{options} -w start")
+
+
+def _stop(data_dir):
+    if _is_running(data_dir):
+        run.shell(f"pg_ctl -D {shlex.quote(data_dir)} -m fast -w stop")
+
+
+def _remove(data_dir):
+    _stop(data_dir)
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def _extract(file_path, *, data_dir, storage_client, port):
+    """Extract a base backup into a data directory that only serves locally"""
+    _remove(data_dir)
+    os.makedirs(data_dir, mode=0o700)
+    run.shell(
+        f"{storage_client.pg_restore(file_path)} tar -xzf - -C {shlex.quote(data_dir)}",
+        env=storage_client.env,
+    )
+
+    data_path = pathlib.Path(data_dir)
+    # Clusters that keep their configuration elsewhere, such as on Debian, don't
+    # back it up
+    if not (data_path / "postgresql.conf").exists():
+        (data_path / "postgresql.conf").write_text("")
+    if not (data_path / "pg_hba.conf").exists():
+        (data_path / "pg_hba.conf").write_text(_HBA_CONF)
+
+    with open(data_path / "postgresql.auto.conf", "a") as conf_f:
+        conf_f.write(_CONF.format(port=port))
+
+
+def _swap(*, data_dir, temp_dir, swap_dir):
+    """Swap the temp cluster in for the cluster of the data directory"""
+    _stop(temp_dir)
+    _stop(data_dir)
+    _remove(swap_dir)
+    if os.path.exists(data_dir):
+        os.rename(data_dir, swap_dir)
+
+    os.rename(temp_dir, data_dir)
+    _start(data_dir)
+
+
+def has_pre(database):
+    """True if a reversible physical restore kept the previous cluster of a database alias"""
+    return bool(settings.physical_dir()) and os.path.exists(_data_dirs(database)[3])
+
+
+def _swap_in(*, database, pre_swap_hooks):
+    """
+    Start the temp cluster on the temporary port, run pre-swap hooks on it, and
+    swap it in for the cluster of a database alias
+    """
+    data_dir, temp_dir, swap_dir, _ = _data_dirs(database)
+    temp_port = _temp_port(database)
+    temp_db = dict(db.conf(using=database), HOST="localhost", PORT=temp_port)
+
+    # The cluster replays the WAL of the backup when it starts
+    with spans.span("start"):
+        _start(temp_dir, port=temp_port)
+
+    jobs.checkpoint("hooks")
+    with spans.span("hooks", count=len(pre_swap_hooks)):
+        # The temp cluster is on another port, so hooks can't run in subprocesses,
+        # which only route to databases on the server of the alias
+        hooks.execute(
+            pre_swap_hooks,
+            kind="pre_swap",
+            database=temp_db,
+            using=database,
+            isolated=False,
+        )
+
+    jobs.checkpoint("swapping")
+    logging.success_msg("Swapping the restored cluster with the running cluster")
+    with spans.span("swap"):
+        _swap(data_dir=data_dir, temp_dir=temp_dir, swap_dir=swap_dir)
+
+
+def restore(dump_key, *, database, storage_client, file_path, pre_swap_hooks, reversible):
+    """
+    Restore a physical backup to the cluster of a database alias. The alias must
+    point to the port of the local cluster that pgclone manages
+    """
+    data_dir, temp_dir, swap_dir, pre_dir = _data_dirs(database)
+    restore_db = db.conf(using=database)
+
+    with _lock(data_dir):
+        jobs.checkpoint("restoring")
+        logging.success_msg(f'Extracting physical backup "{dump_key}"')
+        with spans.span("extract", dump_key=dump_key) as extract_span:
+            _extract(
+                file_path,
+                data_dir=temp_dir,
+                storage_client=storage_client,
+                port=restore_db["PORT"] or 5432,
+            )
+            extract_span.set(archive_bytes=storage_client.size(file_path))
+
+        _swap_in(database=database, pre_swap_hooks=pre_swap_hooks)
+
+        with spans.span("cleanup"):
+            if reversible:
+                logging.success_msg("Keeping the previous cluster for reversible restore")
+                _remove(pre_dir)
+                if os.path.exists(swap_dir):
+                    os.rename(swap_dir, pre_dir)
+            else:
+                _remove(swap_dir)
+                _remove(pre_dir)
+
+    return dump_key
+
+
+def restore_pre(*, database, pre_swap_hooks):
+    """
+    Restore the previous cluster that a reversible physical restore kept. Like
+    restoring `:pre` of a database, the previous cluster is copied so that it can
+    be restored again
+    """
+    data_dir, temp_dir, swap_dir, pre_dir = _data_dirs(database)
+
+    with _lock(data_dir):
+        if not os.path.exists(pre_dir):
+            raise exceptions.RuntimeError(
+                f'No previous cluster of "{database}" was kept by a reversible restore.'
+            )
+
+        jobs.checkpoint("restoring")
+        logging.success_msg("Copying the previous cluster")
+        with spans.span("create", template=os.path.basename(pre_dir)):
+            _remove(temp_dir)
+            shutil.copytree(pre_dir, temp_dir, symlinks=True)
+
+        _swap_in(database=database, pre_swap_hooks=pre_swap_hooks)
+
+        with spans.span("cleanup"):
+            _remove(swap_dir)
+
+    return ":pre"
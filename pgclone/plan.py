@@ -0,0 +1,185 @@
+"""
+Pre-flight estimates of dumps and restores.
+
+Estimates use the throughput recorded by previous dumps and restores. Values
+that can't be estimated, for example, because there is no recorded history,
+are `None`.
+"""
+
+import os
+import shutil
+from typing import Dict, List, Union
+
+from pgclone import db, dump_cmd, exceptions, exclusions, options, restore_cmd, stats, storage
+
+
+def _divide(numerator, denominator):
+    return numerator / denominator if numerator is not None and denominator else None
+
+
+def _free_disk_bytes(*, using):
+    """
+    Return the free disk space of the database server's data directory. This
+    can only be determined when the data directory is on the local machine.
+    """
+    try:
+        data_dir = db.query("SHOW data_directory", database=db.conn(using=using))[0][0]
+        return shutil.disk_usage(data_dir).free if os.path.isdir(data_dir) else None
+    except Exception:  # pragma: no cover
+        # Reading the data directory requires elevated privileges
+        return None
+
+
+def _dump_plan(*, exclude, exclude_larger_than, database, keep_partitions=None):
+    dump_db = db.conf(using=database)
+    excluded_tables = exclusions.resolve(
+        exclude,
+        database=dump_db,
+        larger_than=exclude_larger_than,
+        keep_partitions=keep_partitions,
+    )
+    excluded_names = [f"{entry['schema']}.{entry['table']}" for entry in excluded_tables]
+    dump_stats = stats.load().get("dump", {})
+
+    db_bytes = db.size(dump_db, using=database)
+    dumped_bytes = dump_cmd._dumped_bytes(dump_db, excluded_tables=excluded_tables, using=database)
+    rows = db.query(
+        "SELECT COALESCE(SUM(n_live_tup), 0) FROM pg_stat_user_tables"
+        " WHERE NOT (schemaname || '.' || relname = ANY(%s))",
+        [excluded_names],
+        database=dump_db,
+    )[0][0]
+    compression_ratio = dump_stats.get("compression_ratio")
+
+    return {
+        "database_bytes": db_bytes,
+        "excluded_tables": excluded_names,
+        "dumped_bytes": dumped_bytes,
+        "dumped_rows": rows,
+        "archive_bytes": int(dumped_bytes * compression_ratio) if compression_ratio else None,
+        "seconds": _divide(dumped_bytes, dump_stats.get("bytes_per_second")),
+    }
+
+
+def _restore_plan(*, dump_key, reversible, database, storage_location):
+    if not dump_key:
+        raise exceptions.ValueError("Must provide a dump key or prefix to restore.")
+
+    restore_stats = stats.load().get("restore", {})
+
+    if dump_key.startswith(":"):
+        local_db = db.make(dump_key[1:], using=database, check=False)
+        archive_bytes = None
+        restored_bytes = db.size(local_db, using=database)
+        # Local restores are copied with a template and are not reversible
+        reversible = False
+        seconds = None
+    else:
+        dump_key = restore_cmd._resolve_dump_key(dump_key, storage_location=storage_location)
+        storage_client = storage.client(storage_location)
+        archive_bytes = storage_client.size(os.path.join(storage_location, dump_key))
+        compression_ratio = restore_stats.get("compression_ratio")
+        restored_bytes = (
+            int(archive_bytes / compression_ratio)
+            if archive_bytes is not None and compression_ratio
+            else None
+        )
+        seconds = _divide(restored_bytes, restore_stats.get("bytes_per_second"))
+
+    # The temp database is created next to the restored database. Reversible
+    # restores also keep a __post copy of the temp database
+    required_bytes = restored_bytes * (2 if reversible else 1) if restored_bytes else None
+    free_bytes = _free_disk_bytes(using=database)
+
+    return {
+        "dump_key": dump_key,
+        "archive_bytes": archive_bytes,
+        "restored_bytes": restored_bytes,
+        "required_disk_bytes": required_bytes,
+        "free_disk_bytes": free_bytes,
+        "enough_disk": (
+            required_bytes <= free_bytes
+            if required_bytes is not None and free_bytes is not None
+            else None
+        ),
+        "seconds": seconds,
+    }
+
+
+def dump(
+    *,
+    exclude: Union[List[str], None] = None,
+    exclude_larger_than: Union[int, None] = None,
+    keep_partitions: Union[int, str, Dict[str, Union[int, str]], None] = None,
+    database: Union[str, None] = None,
+    config: Union[str, None] = None,
+) -> dict:
+    """
+    Estimate a dump without running it.
+
+    Args:
+        exclude: The models, apps and table patterns to exclude when dumping.
+        exclude_larger_than: Exclude the data of tables larger than this many bytes.
+        keep_partitions: Exclude the data of older partitions, keeping this many of the
+            newest partitions or the partitions with data newer than this ISO date.
+        database: The database to dump.
+        config: The configuration name from `settings.PGCLONE_CONFIGS`.
+
+    Returns:
+        The size of the database, the size and rows of the dumped data, the excluded
+        tables, the estimated archive size, and the estimated duration in seconds.
+    """
+    opts = options.get(
+        exclude=exclude,
+        exclude_larger_than=exclude_larger_than,
+        keep_partitions=keep_partitions,
+        database=database,
+        config=config,
+    )
+
+    return _dump_plan(
+        exclude=opts.exclude,
+        exclude_larger_than=opts.exclude_larger_than,
+        keep_partitions=opts.keep_partitions,
+        database=opts.database,
+    )
+
+
+def restore(
+    dump_key: Union[str, None] = None,
+    *,
+    reversible: Union[bool, None] = None,
+    database: Union[str, None] = None,
+    storage_location: Union[str, None] = None,
+    config: Union[str, None] = None,
+) -> dict:
+    """
+    Estimate a restore without running it.
+
+    Args:
+        dump_key: The specific dump key or the most recent dump matching the prefix.
+        reversible: True if the restore is reversible.
+        database: The database to restore.
+        storage_location: The storage location to use for the restore.
+        config: The configuration name from `settings.PGCLONE_CONFIGS`.
+
+    Returns:
+        The dump key, its archive size, the estimated size of the restored database,
+        the disk space required for the restore, the free disk space of the database
+        server (only available for local servers), whether there is enough disk space,
+        and the estimated duration in seconds.
+    """
+    opts = options.get(
+        dump_key=dump_key,
+        config=config,
+        reversible=reversible,
+        database=database,
+        storage_location=storage_location,
+    )
+
+    return _restore_plan(
+        dump_key=opts.dump_key,
+        reversible=opts.reversible,
+        database=opts.database,
+        storage_location=opts.storage_location,
+    )
@@ -0,0 +1,118 @@
+"""
+Warms the buffer cache of restored databases with pg_prewarm.
+"""
+
+import concurrent.futures
+import copy
+import time
+
+from django.apps import apps
+
+from pgclone import db, exceptions, logging
+
+_RANKINGS = {"largest": "largest_tables", "most_read": "most_read_tables"}
+
+
+def _model_table(target):
+    """Return the table of a model label, or None if the target isn't a model"""
+    try:
+        return apps.get_model(target)._meta.db_table
+    except (LookupError, ValueError):
+        return None
+
+
+def _largest_tables(database, *, count):
+    """Return the largest tables of the restored database when there is no manifest"""
+    rows = db.query(
+        "SELECT quote_ident(schemaname) || '.' || quote_ident(relname)"
+        " FROM pg_stat_user_tables ORDER BY pg_total_relation_size(relid) DESC LIMIT %s",
+        [count],
+        database=database,
+    )
+    return [name for (name,) in rows]
+
+
+def tables(targets, *, manifest, database):
+    """
+    Resolve prewarm targets to table names.
+
+    Targets are model labels, table names, or "largest:N" and "most_read:N"
+    for the N largest or most-read tables recorded in the dump manifest.
+    """
+    resolved = []
+    for target in targets:
+        ranking, _, count = target.partition(":")
+        if ranking in _RANKINGS and count:
+            if not count.isdigit():
+                raise exceptions.ValueError(f'Invalid prewarm target "{target}".')
+
+            if _RANKINGS[ranking] in manifest:
+                resolved += [table["name"] for table in manifest[_RANKINGS[ranking]][: int(count)]]
+            elif ranking == "largest":
+                resolved += _largest_tables(database, count=int(count))
+            else:
+                logging.success_msg(f'Skipping prewarm of "{target}". The dump has no manifest')
+        else:
+            resolved.append(_model_table(target) or target)
+
+    # Preserve order while removing duplicates
+    return list(dict.fromkeys(resolved))
+
+
+def _is_installed(database):
+    """Return True if the pg_prewarm extension is installed in the database"""
+    return bool(
+        db.query("SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm'", database=database)
+    )
+
+
+def _prewarm_table(table, *, database, deadline):
+    """Prewarm a table, returning an error message if it wasn't prewarmed"""
+    remaining_ms = int((deadline - time.time()) * 1000)
+    if remaining_ms <= 0:
+        return "out of time"
+
+    # Cap every statement by the remaining time budget
+    database = copy.deepcopy(database)
+    database["OPTIONS"]["options"] = (
+        database["OPTIONS"].get("options", "") + f" -c statement_timeout={remaining_ms}"
+    ).strip()
+
+    try:
+        db.query("SELECT pg_prewarm(%s::regclass)", [table], database=database)
+    except Exception as exc:
+        return str(exc).strip()
+
+
+def run(targets, *, manifest, database, num_jobs, timeout):
+    """
+    Prewarm tables of a database in parallel, stopping after `timeout` seconds
+    """
+    table_names = tables(targets, manifest=manifest, database=database)
+    if not table_names:
+        return
+
+    # Creating the extension would take locks on the live database, so it's only used if installed
+    if not _is_installed(database):
+        logging.success_msg('Skipping prewarm. Run "CREATE EXTENSION pg_prewarm" to enable it')
+        return
+
+    logging.success_msg(f"Prewarming {len(table_names)} table(s) with {num_jobs} job(s)")
+    start = time.time()
+    deadline = start + timeout
+    warmed = 0
+    # Threads don't share the current logger, so results are logged here
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_jobs) as executor:
+        errors = executor.map(
+            lambda table: _prewarm_table(table, database=database, deadline=deadline),
+            table_names,
+        )
+        for table, error in zip(table_names, errors):
+            if error:
+                logging.success_msg(f'Did not prewarm "{table}": {error}')
+            else:
+                warmed += 1
+
+    logging.success_msg(
+        f"Prewarmed {warmed} of {len(table_names)} table(s) in {time.time() - start:.1f} seconds"
+    )
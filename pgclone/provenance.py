@@ -0,0 +1,105 @@
+"""
+Records where restored databases came from.
+
+Restored databases are stamped with their provenance in their database comment:
+the dump key that was restored, when it was restored, and a hash of the
+pre-swap hooks that ran on it. Progressive restores also record whether the
+deferred tables were backfilled. Comments are kept when databases are renamed,
+so the `:pre` snapshot of a reversible restore keeps the provenance of the
+database it replaced.
+"""
+
+import datetime as dt
+import hashlib
+import json
+import os
+
+from pgclone import db, hooks, logging
+
+_PREFIX = "pgclone-provenance:"
+# The prefix of every comment that pgclone sets on databases
+_PGCLONE_PREFIX = "pgclone-"
+
+
+def hooks_hash(pre_swap_hooks):
+    """
+    Hash the pre-swap hooks of a restore. The contents of SQL hooks are
+    included so that changing them changes the hash
+    """
+    digest = hashlib.sha256()
+    for hook in hooks._parse(pre_swap_hooks):
+        digest.update(json.dumps(hook, sort_keys=True).encode("utf-8"))
+        if hook["hook"].startswith("sql:") and os.path.exists(hook["hook"][4:]):
+            with open(hook["hook"][4:], "rb") as sql_f:
+                digest.update(sql_f.read())
+
+    return digest.hexdigest()
+
+
+def _parse(comment):
+    if comment and comment.startswith(_PREFIX):
+        try:
+            return json.loads(comment[len(_PREFIX) :])
+        except ValueError:
+            return None
+
+    return None
+
+
+def _set(database, provenance, *, using):
+    db.set_comment(database, _PREFIX + json.dumps(provenance, sort_keys=True), using=using)
+
+
+def stamp(database, *, dump_key, pre_swap_hooks, using, backfilled=None):
+    """
+    Stamp a restored database with its provenance. `backfilled` is False for
+    progressive restores until `record_backfill` records that they finished
+    """
+    comment = db.comment(database, using=using)
+    if comment and not comment.startswith(_PGCLONE_PREFIX):
+        logging.success_msg(
+            f'Replacing the comment of database "{database["NAME"]}" with its provenance.'
+            f" The previous comment was: {comment}"
+        )
+
+    provenance = {
+        "dump_key": dump_key,
+        "restored_at": dt.datetime.utcnow().isoformat(timespec="seconds"),
+        "hooks": hooks_hash(pre_swap_hooks),
+    }
+    if backfilled is not None:
+        provenance["backfilled"] = backfilled
+
+    _set(database, provenance, using=using)
+    return provenance
+
+
+def record_backfill(database, *, dump_key, using):
+    """Record that the backfill of a progressive restore of a dump key finished"""
+    provenance = read(database, using=using)
+    if provenance and provenance.get("dump_key") == dump_key:
+        _set(database, dict(provenance, backfilled=True), using=using)
+
+
+def read(database, *, using):
+    """Return the provenance of a database or None if it wasn't restored by pgclone"""
+    return _parse(db.comment(database, using=using))
+
+
+def local(*, using):
+    """Return the provenance of every database on the server that has one, by name"""
+    rows = db.query(
+        "SELECT datname, shobj_description(oid, 'pg_database') FROM pg_database",
+        database=db.conn(using=using),
+    )
+    return {name: _parse(comment) for name, comment in rows if _parse(comment)}
+
+
+def is_current(database, *, dump_key, pre_swap_hooks, using):
+    """True if a database was restored from a dump key with the same pre-swap hooks"""
+    provenance = read(database, using=using)
+    return bool(
+        provenance
+        and provenance.get("dump_key") == dump_key
+        and provenance.get("hooks") == hooks_hash(pre_swap_hooks)
+    )
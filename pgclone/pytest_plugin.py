@@ -0,0 +1,55 @@
+"""
+A pytest plugin that provides per-worker test databases cloned from a dump.
+
+Override pytest-django's `django_db_setup` fixture to use it:
+
+    @pytest.fixture(scope="session")
+    def django_db_setup(pgclone_db):
+        pass
+"""
+
+import pytest
+
+from pgclone import settings
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("pgclone")
+    group.addoption(
+        "--pgclone-dump-key",
+        help="The dump key or prefix to restore for test databases.",
+    )
+    group.addoption(
+        "--pgclone-config",
+        help="The pgclone configuration to use for test databases.",
+    )
+    group.addoption(
+        "--pgclone-no-recycle",
+        action="store_true",
+        help="Drop worker databases after the session instead of recycling them.",
+    )
+
+
+def _worker(config):
+    # pytest-xdist stores the worker ID in workerinput
+    return getattr(config, "workerinput", {}).get("workerid", settings.test_worker())
+
+
+@pytest.fixture(scope="session")
+def pgclone_db(request, django_db_blocker):
+    """Set up the default database from a dump for the session, returning its name"""
+    # Import lazily since the plugin is loaded before Django is configured
+    from pgclone import testing
+
+    config = request.config
+    with django_db_blocker.unblock():
+        db_name = testing.setup(
+            config.getoption("pgclone_dump_key") or settings.test_dump_key(),
+            worker=_worker(config),
+            config=config.getoption("pgclone_config"),
+        )
+
+    yield db_name
+
+    with django_db_blocker.unblock():
+        testing.teardown(recycle=not config.getoption("pgclone_no_recycle"))
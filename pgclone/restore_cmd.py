@@ -1,9 +1,96 @@
+import concurrent.futures
+import contextlib
+import json
 import os
-from typing import List, Union
+import shlex
+import tempfile
+import time
+from typing import Dict, List, Union
 
 from django.db import connections
 
-from pgclone import db, exceptions, logging, ls_cmd, options, run, settings, storage
+from pgclone import (
+    backfill,
+    db,
+    download,
+    exceptions,
+    hooks,
+    jobs,
+    logging,
+    ls_cmd,
+    manifest,
+    options,
+    physical,
+    prewarm,
+    provenance,
+    run,
+    settings,
+    spans,
+    stats,
+    storage,
+    sync,
+    tenants,
+)
+
+# The phases of a restore in order. The last completed phase is recorded in the
+# comment of the temp_db, which moves to the restore_db when they're swapped
+PHASES = ("created", "restored", "post-snapshot", "hooks-done", "swapped")
+
+_STATE_PREFIX = "pgclone-restore:"
+
+# The most tables analyzed by name. Analyzing more tables by name, such as in
+# databases with a schema per tenant, can exceed the maximum command line length
+_MAX_ANALYZED_TABLES = 500
+
+# The dump key recorded in the restore state of clones. Source URLs can have
+# passwords, so the source isn't recorded
+CLONE_DUMP_KEY = ":clone"
+
+
+def _mark(database, *, dump_key, phase, using):
+    """Record the last completed phase of a restore in the comment of a database"""
+    state = json.dumps({"dump_key": dump_key, "phase": phase}, sort_keys=True)
+    db.set_comment(database, _STATE_PREFIX + state, using=using)
+
+
+def _completed(phase, *, state):
+    """True if a resumed restore already completed a phase"""
+    return bool(state) and PHASES.index(state["phase"]) >= PHASES.index(phase)
+
+
+def _matches(dump_key, recorded_dump_key):
+    """True if a dump key or prefix matches the recorded dump key of a restore"""
+    if dump_key.startswith(":") or dump_key.endswith(".dump"):
+        return dump_key == recorded_dump_key
+
+    return recorded_dump_key.startswith(dump_key)
+
+
+def _resume_state(dump_key, *, database):
+    """
+    Return the recorded state of an interrupted restore of a database, validating
+    it against the dump key or prefix being restored, if any
+    """
+    restore_db, temp_db, _, _, _ = _restore_dbs(database)
+    for state_db in (temp_db, restore_db):
+        comment = db.comment(state_db, using=database) or ""
+        if comment.startswith(_STATE_PREFIX):
+            state = json.loads(comment[len(_STATE_PREFIX) :])
+            break
+    else:
+        raise exceptions.RuntimeError(f'There is no interrupted restore of "{database}".')
+
+    if state_db == restore_db:
+        # The temp_db was swapped in, even if the swap wasn't recorded
+        state["phase"] = "swapped"
+
+    if dump_key and not _matches(dump_key, state["dump_key"]):
+        raise exceptions.ValueError(
+            f'The interrupted restore of "{database}" is of "{state["dump_key"]}",'
+            f' not "{dump_key}".'
+        )
+
+    return state
 
 
 def _db_exists(database, *, using):
@@ -54,25 +141,41 @@ def _local_restore(dump_key, *, temp_db, post_db, pre_db, using):
     # try to restore the temp_db, so do nothing if this database
     # is provided by the user
     if local_restore_db != temp_db:  # pragma: no branch
-        db.drop(temp_db, using=using)
-        create_temp_sql = (
-            f'CREATE DATABASE "{temp_db["NAME"]}" WITH TEMPLATE "{local_restore_db["NAME"]}"'
-        )
-        db.psql(create_temp_sql, using=using)
+        with spans.span("drop"):
+            db.drop(temp_db, using=using)
+
+        with spans.span("create", template=local_restore_db["NAME"]):
+            create_temp_sql = (
+                f'CREATE DATABASE "{temp_db["NAME"]}" WITH TEMPLATE "{local_restore_db["NAME"]}"'
+            )
+            db.psql(create_temp_sql, using=using)
 
     _set_search_path(temp_db, using=using)
+    _mark(temp_db, dump_key=dump_key, phase="created", using=using)
 
     return dump_key
 
 
-def _remote_restore(dump_key, *, temp_db, using, storage_location):
-    storage_client = storage.client(storage_location)
+def _create_temp_db(temp_db, *, dump_key, using):
+    """Creates an empty temporary database for restoring"""
+    logging.success_msg("Creating the temporary restore db")
+    with spans.span("drop"):
+        db.drop(temp_db, using=using)
+
+    with spans.span("create"):
+        create_temp_sql = f'CREATE DATABASE "{temp_db["NAME"]}"'
+        db.psql(create_temp_sql, using=using)
+        _set_search_path(temp_db, using=using)
+        _mark(temp_db, dump_key=dump_key, phase="created", using=using)
 
-    # We are restoring from a remote dump. If the dump key is not valid,
-    # assume it is the latest dump of a database name and get the latest
-    # dump key
+
+def _resolve_dump_key(dump_key, *, storage_location):
+    """
+    If the dump key is not valid, assume it is a prefix and return the
+    latest dump key matching it
+    """
     if not dump_key.endswith(".dump"):
-        dump_keys = ls_cmd.ls(dump_key=dump_key, storage_location=storage_location)
+        dump_keys = ls_cmd.ls(dump_key=dump_key, storage_location=storage_location, limit=1)
         found_dump_key = dump_keys[0] if dump_keys else None
 
         if not found_dump_key:
@@ -82,52 +185,121 @@ def _remote_restore(dump_key, *, temp_db, using, storage_location):
 
         dump_key = found_dump_key
 
+    return dump_key
+
+
+def _is_physical(dump_key, *, storage_client):
+    """True if a dump is a physical backup, which is restored as a cluster"""
+    return manifest.read(storage_client, dump_key).get("engine") == physical.ENGINE
+
+
+def _restore_list(dump_key, *, file_path, storage_client, schemas, exclude_schemas):
+    """Write the TOC list that only restores the matching schemas of an archive"""
+    logging.success_msg(f'Filtering the schemas of "{dump_key}"')
+    toc = tenants.filter_toc(
+        tenants.toc(file_path=file_path, storage_client=storage_client),
+        schemas=schemas,
+        exclude_schemas=exclude_schemas,
+    )
+    fd, restore_list_path = tempfile.mkstemp(suffix=".list", dir=settings.spool_dir())
+    with os.fdopen(fd, "w") as f:
+        f.write("\n".join(toc) + "\n")
+
+    return restore_list_path
+
+
+def _remote_restore(
+    dump_key,
+    *,
+    temp_db,
+    using,
+    storage_location,
+    backfill_tables=(),
+    pre_swap_hooks=(),
+    schemas=(),
+    exclude_schemas=(),
+):
+    storage_client = storage.client(storage_location)
+    dump_key = _resolve_dump_key(dump_key, storage_location=storage_location)
     file_path = os.path.join(storage_location, dump_key)
 
-    logging.success_msg("Creating the temporary restore db")
-    db.drop(temp_db, using=using)
-    create_temp_sql = f'CREATE DATABASE "{temp_db["NAME"]}"'
-    db.psql(create_temp_sql, using=using)
-    _set_search_path(temp_db, using=using)
+    if _is_physical(dump_key, storage_client=storage_client):
+        raise exceptions.ValueError(
+            f'"{dump_key}" is a physical backup, which can only be restored with "restore".'
+        )
+
+    _create_temp_db(temp_db, dump_key=dump_key, using=using)
 
-    logging.success_msg(f'Running pg_restore on "{dump_key}"')
     pg_restore_cmd = f"pg_restore --verbose --no-acl --no-owner -d {db.url(temp_db)}"
-    pg_restore_cmd = storage_client.pg_restore(file_path) + " " + pg_restore_cmd
+    if backfill_tables:
+        # Restore everything except the data of backfilled tables from a spooled archive
+        archive_path, restore_list_path = backfill.prepare(
+            dump_key,
+            file_path=file_path,
+            storage_client=storage_client,
+            tables=backfill_tables,
+            restore_db=db.conf(using=using),
+            pre_swap_hooks=pre_swap_hooks,
+            schemas=schemas,
+            exclude_schemas=exclude_schemas,
+        )
+        pg_restore_cmd += f" -L {shlex.quote(restore_list_path)} {shlex.quote(archive_path)}"
+    else:
+        if schemas or exclude_schemas:
+            # Streamed archives are read in order, so filtering keeps the order of the TOC
+            restore_list_path = _restore_list(
+                dump_key,
+                file_path=file_path,
+                storage_client=storage_client,
+                schemas=schemas,
+                exclude_schemas=exclude_schemas,
+            )
+            pg_restore_cmd += f" -L {shlex.quote(restore_list_path)}"
+
+        if not settings.download_chunk_size():
+            pg_restore_cmd = storage_client.pg_restore(file_path) + " " + pg_restore_cmd
+
+    logging.success_msg(f'Running pg_restore on "{dump_key}"')
 
     # When restoring, we need to ignore errors because there are certain
     # errors we cannot get around when pg restoring some DBs (like Aurora).
     # In the future, we may parse the output of the pg_restore command to see
     # if an unexpected error happened.
-    run.shell(pg_restore_cmd, env=storage_client.env, ignore_errors=True)
+    with spans.span("pg_restore", dump_key=dump_key) as pg_restore_span:
+        if settings.download_chunk_size() and not backfill_tables:
+            # Resumable downloads are streamed into pg_restore in chunks
+            run.shell_input(
+                pg_restore_cmd,
+                lambda stdin: download.stream(storage_client, file_path, stdin),
+                ignore_errors=True,
+            )
+        else:
+            run.shell(pg_restore_cmd, env=storage_client.env, ignore_errors=True)
 
-    return dump_key
+        if (schemas or exclude_schemas) and not backfill_tables:
+            os.remove(restore_list_path)
 
+        pg_restore_span.set(
+            bytes=db.size(temp_db, using=using),
+            archive_bytes=storage_client.size(file_path),
+            rows=db.rows(temp_db),
+        )
 
-def _restore(*, dump_key, pre_swap_hooks, config, reversible, database, storage_location):
-    """
-    Restore implementation
-    """
-    if not settings.allow_restore():  # pragma: no cover
-        raise exceptions.RuntimeError("Restore not allowed.")
+    stats.record(
+        "restore",
+        db_bytes=pg_restore_span.attributes["bytes"],
+        archive_bytes=pg_restore_span.attributes["archive_bytes"],
+        seconds=pg_restore_span.duration,
+    )
 
-    if not dump_key:
-        raise exceptions.ValueError("Must provide a dump key or prefix to restore.")
+    return dump_key
 
-    # Restore works in the following steps with the following databases:
-    # 1. Create the temp_db database to perform the restore without
-    #    affecting the restore_db
-    # 2. Call pg_restore on temp_db
-    # 3. If using --reversible, create the post_db restore copy of temp_db
-    # 4. Apply any pre_swap_hooks to temp_db
-    # 5. Terminate all connections on restore_db so that we
-    #    can swap in the temp_db
-    # 6. Rename restore_db to swap_db
-    # 7. Rename temp_db to restore_db
-    # 8. Delete swap_db and post/pre_db if not using --reversible OR
-    #    rename swap_db to pre_db if using --reversible
-    #
-    # Database variable names below reflect this process.
 
+def _restore_dbs(database):
+    """
+    Returns the configs of the restore database and the temp, swap, pre,
+    and post databases used behind the scenes when restoring it
+    """
     restore_db = db.conf(using=database)
     # The DB in which a restore happens behind the scenes. Pre-swap hooks
     # are applied to it
@@ -138,9 +310,84 @@ def _restore(*, dump_key, pre_swap_hooks, config, reversible, database, storage_
     # These two DBs are only for reversible restores
     pre_db = db.make(restore_db["NAME"] + "__pre", using=database)
     post_db = db.make(restore_db["NAME"] + "__post", using=database)
-    is_local_restore = dump_key.startswith(":")
 
-    if is_local_restore:
+    return restore_db, temp_db, swap_db, pre_db, post_db
+
+
+def _table_statistics(database):
+    """
+    Return the user tables of a database and whether they have planner statistics,
+    such as ones restored from a dump. Analyzing empty tables doesn't create
+    statistics, so tables that are known to be empty or were already analyzed
+    count as having them. Before Postgres 14, never analyzed tables also have
+    zero tuples, so the number of tuples is only used on Postgres 14 and later
+    """
+    return db.query(
+        "SELECT quote_ident(n.nspname) || '.' || quote_ident(c.relname),"
+        " EXISTS (SELECT 1 FROM pg_stats s"
+        "  WHERE s.schemaname = n.nspname AND s.tablename = c.relname)"
+        " OR (c.reltuples = 0 AND current_setting('server_version_num')::int >= 140000)"
+        " OR COALESCE(t.last_analyze, t.last_autoanalyze) IS NOT NULL"
+        " FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace"
+        " LEFT JOIN pg_stat_user_tables t ON t.relid = c.oid"
+        " WHERE c.relkind IN ('r', 'm')"
+        " AND n.nspname NOT IN ('pg_catalog', 'information_schema')"
+        " AND n.nspname !~ '^pg_toast'",
+        database=database,
+    )
+
+
+def _analyze(temp_db, *, num_jobs):
+    """
+    Rebuild planner statistics of the temp_db so that the first queries after the swap
+    don't run with bad plans. Tables that already have statistics, such as ones from
+    the dump, aren't analyzed again
+    """
+    table_statistics = _table_statistics(temp_db)
+    missing = [table for table, has_statistics in table_statistics if not has_statistics]
+    if not missing:
+        logging.success_msg("Using planner statistics from the dump")
+        return
+
+    # Analyzing in stages produces usable statistics quickly and refines them later
+    vacuumdb_cmd = f"vacuumdb --analyze-in-stages --jobs={num_jobs} --dbname={db.url(temp_db)}"
+    if len(missing) < len(table_statistics) and len(missing) <= _MAX_ANALYZED_TABLES:
+        # Autovacuum may have analyzed some tables while they were restored
+        vacuumdb_cmd += "".join(f" -t {shlex.quote(table)}" for table in missing)
+        logging.success_msg(
+            f"Analyzing {len(missing)} restored table(s) without statistics"
+            f" with {num_jobs} job(s)"
+        )
+    else:
+        logging.success_msg(f"Analyzing the restored database with {num_jobs} job(s)")
+
+    start = time.time()
+    run.shell(vacuumdb_cmd)
+    logging.success_msg(f"Analyzed the restored database in {time.time() - start:.1f} seconds")
+
+
+def _populate(
+    dump_key,
+    *,
+    database,
+    storage_location,
+    backfill_tables=(),
+    pre_swap_hooks=(),
+    prewarm_targets=(),
+    schemas=(),
+    exclude_schemas=(),
+):
+    """
+    Populate the temp_db of a database from a dump or local database. Returns the
+    restored dump key and the manifest of the dump when it's needed for prewarming
+    """
+    restore_db, temp_db, _, pre_db, post_db = _restore_dbs(database)
+
+    jobs.checkpoint("restoring")
+    dump_manifest = {}
+    # Any unfinished backfill is for the database that is about to be replaced
+    backfill.clear(restore_db)
+    if dump_key.startswith(":"):
         dump_key = _local_restore(
             dump_key,
             temp_db=temp_db,
@@ -150,53 +397,363 @@ def _restore(*, dump_key, pre_swap_hooks, config, reversible, database, storage_
         )
     else:
         dump_key = _remote_restore(
-            dump_key, temp_db=temp_db, using=database, storage_location=storage_location
+            dump_key,
+            temp_db=temp_db,
+            using=database,
+            storage_location=storage_location,
+            backfill_tables=backfill_tables,
+            pre_swap_hooks=pre_swap_hooks,
+            schemas=schemas,
+            exclude_schemas=exclude_schemas,
         )
+        if prewarm_targets:
+            dump_manifest = manifest.read(storage.client(storage_location), dump_key)
 
-    # When in reversible mode, make a special __post db snapshot.
-    # Note that reversible mode is a noop for local restores.
-    if reversible and not is_local_restore:
-        logging.success_msg("Creating 'post' snapshot for reversible restore")
-        db.drop(post_db, using=database)
-        create_post_db_sql = (
-            f'CREATE DATABASE "{post_db["NAME"]}" WITH TEMPLATE "{temp_db["NAME"]}"'
-        )
-        db.psql(create_post_db_sql, using=database)
+    _mark(temp_db, dump_key=dump_key, phase="restored", using=database)
+    return dump_key, dump_manifest
+
+
+def _pre_swap(
+    *,
+    dump_key,
+    pre_swap_hooks,
+    reversible,
+    is_local_restore,
+    database,
+    analyze,
+    num_jobs,
+    state=None,
+):
+    """
+    Prepare the populated temp_db for the swap, skipping the phases that a resumed
+    restore already completed
+    """
+    _, temp_db, _, _, post_db = _restore_dbs(database)
+
+    if not _completed("post-snapshot", state=state):
+        # Statistics are rebuilt before snapshots so that reversing keeps them.
+        # Local restores are template copies, which already have statistics
+        if analyze and not is_local_restore:
+            jobs.checkpoint("analyzing")
+            with spans.span("analyze"):
+                _analyze(temp_db, num_jobs=num_jobs)
+
+        # When in reversible mode, make a special __post db snapshot.
+        # Note that reversible mode is a noop for local restores.
+        if reversible and not is_local_restore:
+            logging.success_msg("Creating 'post' snapshot for reversible restore")
+            with spans.span("snapshot"):
+                db.drop(post_db, using=database)
+                create_post_db_sql = (
+                    f'CREATE DATABASE "{post_db["NAME"]}" WITH TEMPLATE "{temp_db["NAME"]}"'
+                )
+                db.psql(create_post_db_sql, using=database)
+
+        _mark(temp_db, dump_key=dump_key, phase="post-snapshot", using=database)
 
     # pre-swap hook step
-    with db.route(temp_db):
-        for management_command_name in pre_swap_hooks:
-            logging.success_msg(f'Running "manage.py {management_command_name}" pre_swap hook')
-            run.management(management_command_name)
+    if not _completed("hooks-done", state=state):
+        jobs.checkpoint("hooks")
+        with spans.span("hooks", count=len(pre_swap_hooks)):
+            hooks.execute(pre_swap_hooks, kind="pre_swap", database=temp_db, using=database)
 
-    # swap step
-    logging.success_msg("Swapping the restored copy with the primary database")
-    db.drop(swap_db, using=database)
-    alter_db_sql = f'ALTER DATABASE "{restore_db["NAME"]}" RENAME TO "{swap_db["NAME"]}"'
-    # There's a scenario where the restore DB may not exist before running
-    # this, so just ignore errors on this command
-    db.psql(alter_db_sql, ignore_errors=True, using=database, kill_connections=restore_db)
-
-    rename_sql = f'ALTER DATABASE "{temp_db["NAME"]}" RENAME TO "{restore_db["NAME"]}"'
-    db.psql(rename_sql, using=database, kill_connections=temp_db)
-
-    # If we're doing a reversible remote restore, keep the swap DB around as the prev DB
-    if reversible and not is_local_restore:
-        logging.success_msg("Creating 'pre' snapshot for reversible restore")
-        db.drop(pre_db, using=database)
-        rename_sql = f'ALTER DATABASE "{swap_db["NAME"]}" RENAME TO "{pre_db["NAME"]}"'
-        db.psql(rename_sql, using=database, kill_connections=swap_db)
-    else:
-        logging.success_msg("Cleaning pgclone resources")
+        _mark(temp_db, dump_key=dump_key, phase="hooks-done", using=database)
+
+
+def _rename(database):
+    """Swap the temp_db with the restore_db by renaming them"""
+    restore_db, temp_db, swap_db, _, _ = _restore_dbs(database)
+
+    with spans.span("swap"):
         db.drop(swap_db, using=database)
-        if not reversible and not is_local_restore:
-            # If we did a non-reversible remote restore, remove any previous restore
-            # points from reversible restores
-            db.drop(post_db, using=database)
+        alter_db_sql = f'ALTER DATABASE "{restore_db["NAME"]}" RENAME TO "{swap_db["NAME"]}"'
+        # There's a scenario where the restore DB may not exist before running
+        # this, so just ignore errors on this command
+        db.psql(alter_db_sql, ignore_errors=True, using=database, kill_connections=restore_db)
+
+        rename_sql = f'ALTER DATABASE "{temp_db["NAME"]}" RENAME TO "{restore_db["NAME"]}"'
+        try:
+            db.psql(rename_sql, using=database, kill_connections=temp_db)
+        except Exception:
+            # Put the restore_db back so that a failed swap leaves it in place
+            undo_sql = f'ALTER DATABASE "{swap_db["NAME"]}" RENAME TO "{restore_db["NAME"]}"'
+            db.psql(undo_sql, ignore_errors=True, using=database, kill_connections=swap_db)
+            raise
+
+
+def _unrename(database):
+    """Reverse `_rename`, putting the previous restore_db back in place"""
+    restore_db, temp_db, swap_db, _, _ = _restore_dbs(database)
+
+    rename_sql = f'ALTER DATABASE "{restore_db["NAME"]}" RENAME TO "{temp_db["NAME"]}"'
+    db.psql(rename_sql, using=database, kill_connections=restore_db)
+
+    # The restore DB may not have existed before the swap
+    rename_sql = f'ALTER DATABASE "{swap_db["NAME"]}" RENAME TO "{restore_db["NAME"]}"'
+    db.psql(rename_sql, ignore_errors=True, using=database, kill_connections=swap_db)
+
+
+def _post_swap(
+    *, reversible, is_local_restore, database, num_jobs=1, prewarm_targets=(), dump_manifest=None
+):
+    """Prewarm the swapped in restore_db and clean up the swap_db"""
+    restore_db, _, swap_db, pre_db, post_db = _restore_dbs(database)
+
+    # Warm the buffer cache of the new database before traffic reaches it
+    if prewarm_targets:
+        with spans.span("prewarm"):
+            prewarm.run(
+                prewarm_targets,
+                manifest=dump_manifest or {},
+                database=restore_db,
+                num_jobs=num_jobs,
+                timeout=settings.prewarm_timeout(),
+            )
+
+    with spans.span("cleanup"):
+        # If we're doing a reversible remote restore, keep the swap DB around as the prev DB
+        if reversible and not is_local_restore:
+            logging.success_msg("Creating 'pre' snapshot for reversible restore")
             db.drop(pre_db, using=database)
+            rename_sql = f'ALTER DATABASE "{swap_db["NAME"]}" RENAME TO "{pre_db["NAME"]}"'
+            db.psql(rename_sql, using=database, kill_connections=swap_db)
+        else:
+            logging.success_msg("Cleaning pgclone resources")
+            db.drop(swap_db, using=database)
+            if not reversible and not is_local_restore:
+                # If we did a non-reversible remote restore, remove any previous restore
+                # points from reversible restores
+                db.drop(post_db, using=database)
+                db.drop(pre_db, using=database)
+
+
+def _swap(
+    *,
+    dump_key,
+    pre_swap_hooks,
+    reversible,
+    is_local_restore,
+    database,
+    analyze=False,
+    num_jobs=1,
+    prewarm_targets=(),
+    dump_manifest=None,
+    state=None,
+):
+    """
+    Run pre-swap hooks on the populated temp_db and swap it with the restore_db
+    """
+    _pre_swap(
+        dump_key=dump_key,
+        pre_swap_hooks=pre_swap_hooks,
+        reversible=reversible,
+        is_local_restore=is_local_restore,
+        database=database,
+        analyze=analyze,
+        num_jobs=num_jobs,
+        state=state,
+    )
+
+    # swap step
+    if not _completed("swapped", state=state):
+        jobs.checkpoint("swapping")
+        logging.success_msg("Swapping the restored copy with the primary database")
+        _rename(database)
+        _mark(db.conf(using=database), dump_key=dump_key, phase="swapped", using=database)
+
+    _post_swap(
+        reversible=reversible,
+        is_local_restore=is_local_restore,
+        database=database,
+        num_jobs=num_jobs,
+        prewarm_targets=prewarm_targets,
+        dump_manifest=dump_manifest,
+    )
+
+
+def _validate(dump_key, *, database, resume=False):
+    """
+    Refuse restores of synced databases, since swapping them out would leave their
+    subscription and the slot on the source behind. Returns True if the dump key is
+    the previous cluster of a physical restore, which is a data directory and not
+    a database
+    """
+    if sync.is_synced(db.conf(using=database), using=database):
+        raise exceptions.RuntimeError(
+            f'Database "{database}" is synced by pgclone.'
+            ' Stop syncing it with "pgclone sync --stop" before restoring it.'
+        )
+
+    return dump_key == ":pre" and not resume and physical.has_pre(database)
+
+
+def _restore(
+    *,
+    dump_key,
+    pre_swap_hooks,
+    config,
+    reversible,
+    database,
+    storage_location,
+    analyze=False,
+    num_jobs=1,
+    prewarm_targets=(),
+    backfill_tables=(),
+    schemas=(),
+    exclude_schemas=(),
+    if_changed=False,
+    resume=False,
+):
+    """
+    Restore implementation
+    """
+    if not settings.allow_restore():  # pragma: no cover
+        raise exceptions.RuntimeError("Restore not allowed.")
+
+    if not dump_key and not resume:
+        raise exceptions.ValueError("Must provide a dump key or prefix to restore.")
+
+    if resume and if_changed:
+        raise exceptions.ValueError("Resumed restores cannot be skipped with if_changed.")
+
+    # Restore works in the following steps with the following databases:
+    # 1. Create the temp_db database to perform the restore without
+    #    affecting the restore_db
+    # 2. Call pg_restore on temp_db
+    # 3. If using --analyze, rebuild planner statistics on temp_db
+    # 4. If using --reversible, create the post_db restore copy of temp_db
+    # 5. Apply any pre_swap_hooks to temp_db
+    # 6. Terminate all connections on restore_db so that we
+    #    can swap in the temp_db
+    # 7. Rename restore_db to swap_db
+    # 8. Rename temp_db to restore_db
+    # 9. If using --prewarm, load tables of restore_db into the buffer cache
+    # 10. Delete swap_db and post/pre_db if not using --reversible OR
+    #     rename swap_db to pre_db if using --reversible
+    # 11. Stamp restore_db with the provenance of the restore
+    # 12. If using --backfill, restore the data of the deferred tables
+    #     into restore_db in the background
+    #
+    # The last completed phase is recorded so that --resume can skip the steps
+    # that an interrupted restore already completed.
+    #
+    # Database variable names below reflect this process.
+
+    restore_db = db.conf(using=database)
+    is_local_restore = bool(dump_key) and dump_key.startswith(":")
+
+    if _validate(dump_key, database=database, resume=resume):
+        dump_key = physical.restore_pre(database=database, pre_swap_hooks=pre_swap_hooks)
+        logging.success_msg(f'Successfully restored the previous cluster of "{database}"')
+        return dump_key
+
+    if not is_local_restore and not resume:
+        storage_client = storage.client(storage_location)
+        dump_key = _resolve_dump_key(dump_key, storage_location=storage_location)
+        if _is_physical(dump_key, storage_client=storage_client):
+            if (
+                backfill_tables
+                or prewarm_targets
+                or analyze
+                or if_changed
+                or schemas
+                or exclude_schemas
+            ):
+                raise exceptions.ValueError(
+                    "Physical backups cannot be restored with backfill, prewarm,"
+                    " analyze, if_changed or schemas."
+                )
+
+            dump_key = physical.restore(
+                dump_key,
+                database=database,
+                storage_client=storage_client,
+                file_path=os.path.join(storage_location, dump_key),
+                pre_swap_hooks=pre_swap_hooks,
+                reversible=reversible,
+            )
+            logging.success_msg(
+                f'Successfully restored physical backup "{dump_key}" to database "{database}"'
+            )
+            return dump_key
+
+    # Serialize restores of the same database across processes
+    with db.lock(restore_db, using=database):
+        # The state is read under the lock so that another restore can't change it
+        # between validating and resuming it
+        state = _resume_state(dump_key, database=database) if resume else None
+        if state:
+            dump_key = state["dump_key"]
+            # Clones are transferred from their source like remote restores
+            is_local_restore = dump_key.startswith(":") and dump_key != CLONE_DUMP_KEY
+            if dump_key == CLONE_DUMP_KEY and not _completed("restored", state=state):
+                raise exceptions.RuntimeError(
+                    f'The clone into "{database}" was interrupted before its transfer'
+                    " finished. Clone it again."
+                )
+
+            logging.success_msg(
+                f'Resuming the restore of "{dump_key}" after the "{state["phase"]}" phase'
+            )
+
+        if if_changed and not is_local_restore:
+            if provenance.is_current(
+                restore_db, dump_key=dump_key, pre_swap_hooks=pre_swap_hooks, using=database
+            ):
+                logging.success_msg(
+                    f'Database "{database}" is already restored from "{dump_key}".'
+                    " Skipping restore"
+                )
+                return dump_key
+
+        if _completed("restored", state=state):
+            dump_manifest = {}
+            if prewarm_targets and not is_local_restore:
+                dump_manifest = manifest.read(storage.client(storage_location), dump_key)
+        else:
+            dump_key, dump_manifest = _populate(
+                dump_key,
+                database=database,
+                storage_location=storage_location,
+                backfill_tables=backfill_tables,
+                pre_swap_hooks=pre_swap_hooks,
+                prewarm_targets=prewarm_targets,
+                schemas=schemas,
+                exclude_schemas=exclude_schemas,
+            )
+
+        _swap(
+            dump_key=dump_key,
+            pre_swap_hooks=pre_swap_hooks,
+            reversible=reversible,
+            is_local_restore=is_local_restore,
+            database=database,
+            analyze=analyze,
+            num_jobs=num_jobs,
+            prewarm_targets=prewarm_targets,
+            dump_manifest=dump_manifest,
+            state=state,
+        )
+        # The backfill state is written when populating, so resumed restores also
+        # start the backfill of the tables deferred by the interrupted restore
+        is_backfilled = not backfill.is_pending(restore_db, dump_key=dump_key)
+        provenance.stamp(
+            restore_db,
+            dump_key=dump_key,
+            pre_swap_hooks=pre_swap_hooks,
+            using=database,
+            backfilled=None if is_backfilled else False,
+        )
 
     logging.success_msg(f'Successfully restored dump "{dump_key}" to database "{database}"')
 
+    if not is_backfilled:
+        # The backfill takes the lock for every table, so it runs after releasing it
+        logging.success_msg(
+            f'Database "{database}" is usable. Backfilling deferred tables in the background'
+        )
+        backfill.start(restore_db, using=database)
+
     return dump_key
 
 
@@ -207,8 +764,16 @@ def restore(
     reversible: Union[bool, None] = None,
     database: Union[str, None] = None,
     storage_location: Union[str, None] = None,
+    analyze: Union[bool, None] = None,
+    jobs: Union[int, None] = None,
+    prewarm: Union[List[str], None] = None,
+    backfill: Union[List[str], None] = None,
+    schemas: Union[List[str], None] = None,
+    exclude_schemas: Union[List[str], None] = None,
+    if_changed: bool = False,
+    resume: bool = False,
     config: Union[str, None] = None,
-) -> str:
+) -> spans.Result:
     """
     Restores a database dump.
 
@@ -219,10 +784,29 @@ def restore(
         reversible: True if the dump can be reversed.
         database: The database to restore.
         storage_location: The storage location to use for the restore.
+        analyze: Rebuild planner statistics before swapping in the restored database.
+            Statistics from the dump are used when available.
+        jobs: The number of parallel jobs to use when analyzing and prewarming.
+        prewarm: Tables to load into the buffer cache with pg_prewarm after the swap.
+            Tables are model labels, table names, or "largest:N" and "most_read:N"
+            for the N largest or most-read tables recorded when dumping.
+        backfill: Models or tables whose data is restored in the background after the
+            swap, making the database usable sooner. Interrupted backfills are resumed
+            with `pgclone.backfill.resume`.
+        schemas: Only restore schemas matching these patterns, which match schema
+            names with `*` and `?` wildcards. Objects outside of schemas, such as
+            extensions, are always restored.
+        exclude_schemas: Don't restore schemas matching these patterns.
+        if_changed: Skip the restore if the database was already restored from the
+            latest dump matching the dump key with the same pre-swap hooks.
+        resume: Resume an interrupted restore from its last completed phase, reusing
+            its temporary database. The dump key is optional and must match the
+            interrupted restore.
         config: The configuration name from `settings.PGCLONE_CONFIGS`.
 
     Returns:
-        The dump key that was restored.
+        The dump key that was restored. The result is a string that also has the
+        `timings` and `spans` of every phase of the restore.
     """
     opts = options.get(
         dump_key=dump_key,
@@ -231,13 +815,228 @@ def restore(
         reversible=reversible,
         database=database,
         storage_location=storage_location,
+        analyze=analyze,
+        jobs=jobs,
+        prewarm=prewarm,
+        backfill=backfill,
+        schemas=schemas,
+        exclude_schemas=exclude_schemas,
     )
 
-    return _restore(
-        dump_key=opts.dump_key,
-        pre_swap_hooks=opts.pre_swap_hooks,
-        config=opts.config,
-        reversible=opts.reversible,
-        database=opts.database,
-        storage_location=opts.storage_location,
-    )
+    with spans.operation("restore", database=opts.database) as operation:
+        dump_key = _restore(
+            dump_key=opts.dump_key,
+            pre_swap_hooks=opts.pre_swap_hooks,
+            config=opts.config,
+            reversible=opts.reversible,
+            database=opts.database,
+            storage_location=opts.storage_location,
+            analyze=opts.analyze,
+            num_jobs=opts.jobs,
+            prewarm_targets=opts.prewarm,
+            backfill_tables=opts.backfill,
+            schemas=opts.schemas,
+            exclude_schemas=opts.exclude_schemas,
+            if_changed=if_changed,
+            resume=resume,
+        )
+
+    return spans.Result(dump_key, operation)
+
+
+def _prepare(opts, *, operation, logger):
+    """Populate the temp_db of a database and run its pre-swap hooks in a worker thread"""
+    with logging.set_logger(logger), spans.resume(operation):
+        try:
+            dump_key, dump_manifest = _populate(
+                opts.dump_key,
+                database=opts.database,
+                storage_location=opts.storage_location,
+                prewarm_targets=opts.prewarm,
+                schemas=opts.schemas,
+                exclude_schemas=opts.exclude_schemas,
+            )
+            _pre_swap(
+                dump_key=dump_key,
+                pre_swap_hooks=opts.pre_swap_hooks,
+                reversible=opts.reversible,
+                is_local_restore=opts.dump_key.startswith(":"),
+                database=opts.database,
+                analyze=opts.analyze,
+                num_jobs=opts.jobs,
+            )
+            # Drop leftover swap databases before the swap window to keep it short
+            _, _, swap_db, _, _ = _restore_dbs(opts.database)
+            db.drop(swap_db, using=opts.database)
+
+            return dump_key, dump_manifest
+        finally:
+            # Worker threads have their own database connections
+            connections.close_all()
+
+
+def _swap_all(databases, *, operations):
+    """
+    Swap the temp_dbs of every database in one window. If any swap fails, the
+    databases that were already swapped are swapped back
+    """
+    logging.success_msg(f"Swapping the restored copies of {', '.join(databases)}")
+    swapped = []
+    try:
+        for database in databases:
+            with spans.resume(operations[database]):
+                _rename(database)
+            swapped.append(database)
+    except Exception as exc:
+        failed = database
+        for database in reversed(swapped):
+            logging.success_msg(f'Swapping back database "{database}"')
+            _unrename(database)
+
+        raise exceptions.RuntimeError(
+            f'Swapping "{failed}" failed. No databases were swapped.'
+        ) from exc
+
+
+def _restore_many(opts_list):
+    """
+    Restore several databases concurrently and swap them in together.
+    Returns the restored dump keys and operations of every database
+    """
+    if not settings.allow_restore():  # pragma: no cover
+        raise exceptions.RuntimeError("Restore not allowed.")
+
+    databases = [opts.database for opts in opts_list]
+    if len(set(databases)) != len(databases):
+        raise exceptions.ValueError("Databases can only be restored once at a time.")
+
+    for opts in opts_list:
+        if not opts.dump_key:
+            raise exceptions.ValueError(
+                f'Must provide a dump key or prefix for "{opts.database}".'
+            )
+        elif opts.backfill:
+            raise exceptions.ValueError(
+                "Backfills aren't supported when restoring many databases."
+            )
+        elif _validate(opts.dump_key, database=opts.database):
+            raise exceptions.ValueError(
+                f'The previous cluster of "{opts.database}" can\'t be restored with other'
+                ' databases. Restore it with "pgclone restore :pre".'
+            )
+
+    logger = logging.get_logger()
+    with contextlib.ExitStack() as stack:
+        # Locks are always taken in the same order so that concurrent restores can't deadlock
+        for database in sorted(databases):
+            stack.enter_context(db.lock(db.conf(using=database), using=database))
+
+        operations = {
+            opts.database: stack.enter_context(spans.operation("restore", database=opts.database))
+            for opts in opts_list
+        }
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(opts_list)) as executor:
+            futures = {
+                opts.database: executor.submit(
+                    _prepare, opts, operation=operations[opts.database], logger=logger
+                )
+                for opts in opts_list
+            }
+            concurrent.futures.wait(futures.values())
+
+        failed = [database for database, future in futures.items() if future.exception()]
+        if failed:
+            raise exceptions.RuntimeError(
+                f"Restoring {', '.join(failed)} failed. No databases were swapped."
+            ) from futures[failed[0]].exception()
+
+        _swap_all(databases, operations=operations)
+
+        for opts in opts_list:
+            with spans.resume(operations[opts.database]):
+                _post_swap(
+                    reversible=opts.reversible,
+                    is_local_restore=opts.dump_key.startswith(":"),
+                    database=opts.database,
+                    num_jobs=opts.jobs,
+                    prewarm_targets=opts.prewarm,
+                    dump_manifest=futures[opts.database].result()[1],
+                )
+                provenance.stamp(
+                    db.conf(using=opts.database),
+                    dump_key=futures[opts.database].result()[0],
+                    pre_swap_hooks=opts.pre_swap_hooks,
+                    using=opts.database,
+                )
+
+    for opts in opts_list:
+        logging.success_msg(
+            f'Successfully restored dump "{futures[opts.database].result()[0]}"'
+            f' to database "{opts.database}"'
+        )
+
+    return {
+        opts.database: (futures[opts.database].result()[0], operations[opts.database])
+        for opts in opts_list
+    }
+
+
+def restore_many(
+    dump_keys: Dict[str, str],
+    *,
+    pre_swap_hooks: Union[List[str], None] = None,
+    reversible: Union[bool, None] = None,
+    storage_location: Union[str, None] = None,
+    analyze: Union[bool, None] = None,
+    jobs: Union[int, None] = None,
+    prewarm: Union[List[str], None] = None,
+    schemas: Union[List[str], None] = None,
+    exclude_schemas: Union[List[str], None] = None,
+    config: Union[str, None] = None,
+) -> Dict[str, spans.Result]:
+    """
+    Restores dumps of several databases concurrently and swaps them in together.
+
+    Every database is restored into its temporary database and its pre-swap hooks
+    run before any database is swapped. If any restore fails, no database is
+    swapped. The swaps then happen one after another in a short window.
+
+    Args:
+        dump_keys: A dictionary of database aliases to the dump key (or prefix) restored
+            to them.
+        pre_swap_hooks: The list of pre-swap hooks to run on every restored database.
+        reversible: True if the dumps can be reversed.
+        storage_location: The storage location to use for the restores.
+        analyze: Rebuild planner statistics before swapping in the restored databases.
+        jobs: The number of parallel jobs to use when analyzing and prewarming.
+        prewarm: Tables to load into the buffer cache with pg_prewarm after the swap.
+        schemas: Only restore schemas matching these patterns.
+        exclude_schemas: Don't restore schemas matching these patterns.
+        config: The configuration name from `settings.PGCLONE_CONFIGS`.
+
+    Returns:
+        A dictionary of database aliases to the restored dump keys. Like
+        `pgclone.restore`, dump keys have the `timings` and `spans` of every phase.
+    """
+    opts_list = [
+        options.get(
+            dump_key=dump_key,
+            pre_swap_hooks=pre_swap_hooks,
+            config=config,
+            reversible=reversible,
+            database=database,
+            storage_location=storage_location,
+            analyze=analyze,
+            jobs=jobs,
+            prewarm=prewarm,
+            schemas=schemas,
+            exclude_schemas=exclude_schemas,
+        )
+        for database, dump_key in dump_keys.items()
+    ]
+
+    return {
+        database: spans.Result(dump_key, operation)
+        for database, (dump_key, operation) in _restore_many(opts_list).items()
+    }
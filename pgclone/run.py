@@ -2,6 +2,7 @@ import contextlib
 import io
 import os
 import subprocess
+import threading
 
 from django.core.management import call_command
 
@@ -34,6 +35,114 @@ def shell(cmd, ignore_errors=False, env=None):
     return process
 
 
+def _log_output(stream, logger):
+    for line in iter(stream.readline, b""):
+        logger.info(line.decode("utf-8").rstrip())
+
+
+def shell_input(cmd, write_input, ignore_errors=False, env=None):
+    """
+    Run a command, calling `write_input` with its binary stdin. Ensures
+    that an error is raised if it fails.
+    """
+    env = env or {}
+    logger = logging.get_logger()
+    process = subprocess.Popen(
+        cmd,
+        shell=True,
+        stdin=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        stdout=subprocess.PIPE,
+        env=dict(os.environ, **{k: v for k, v in env.items() if v is not None}),
+    )
+    # Output is logged in another thread so that writing input never blocks on it
+    log_thread = threading.Thread(target=_log_output, args=(process.stdout, logger), daemon=True)
+    log_thread.start()
+    try:
+        write_input(process.stdin)
+    except BrokenPipeError:  # pragma: no cover
+        # The command exited early, which is reported by its return code
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:  # pragma: no cover
+            pass
+
+        process.wait()
+        log_thread.join()
+
+    if process.returncode and not ignore_errors:
+        raise exceptions.RuntimeError("Error running command.")
+
+    return process
+
+
+def pipe(producer_cmd, consumer_cmd, ignore_consumer_errors=False, env=None, pump=None):
+    """
+    Pipe the output of one command into another. Ensures that an error is raised
+    if the producer fails, even when errors of the consumer are ignored.
+
+    When a pump is provided, it's called with the binary stdout of the producer and
+    the binary stdin of the consumer and copies the output, such as to throttle or
+    rewrite it. Otherwise the producer writes directly to the consumer.
+    """
+    env = dict(os.environ, **{k: v for k, v in (env or {}).items() if v is not None})
+    logger = logging.get_logger()
+    producer = subprocess.Popen(
+        producer_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env
+    )
+    consumer = subprocess.Popen(
+        consumer_cmd,
+        shell=True,
+        stdin=subprocess.PIPE if pump else producer.stdout,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        env=env,
+    )
+    if not pump:
+        # Only the consumer reads the output so that the producer stops if the consumer exits
+        producer.stdout.close()
+
+    log_threads = [
+        threading.Thread(target=_log_output, args=(producer.stderr, logger), daemon=True),
+        threading.Thread(target=_log_output, args=(consumer.stdout, logger), daemon=True),
+    ]
+    for thread in log_threads:
+        thread.start()
+
+    try:
+        if pump:
+            pump(producer.stdout, consumer.stdin)
+    except BrokenPipeError:  # pragma: no cover
+        # The consumer exited early, which is reported by its return code
+        producer.kill()
+    except BaseException:
+        producer.kill()
+        consumer.kill()
+        raise
+    finally:
+        if pump:
+            # Closing the output also stops children of a killed producer shell
+            producer.stdout.close()
+            try:
+                consumer.stdin.close()
+            except BrokenPipeError:  # pragma: no cover
+                pass
+
+        producer.wait()
+        consumer.wait()
+        for thread in log_threads:
+            thread.join()
+
+    if producer.returncode or (consumer.returncode and not ignore_consumer_errors):
+        # Dont print the commands since they might contain
+        # sensitive information
+        raise exceptions.RuntimeError("Error running command.")
+
+    return consumer
+
+
 def management(cmd, *cmd_args, **cmd_kwargs):
     logger = logging.get_logger()
     cmd_args = cmd_args or []
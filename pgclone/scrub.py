@@ -0,0 +1,310 @@
+"""
+Scrubs sensitive data while dumping, without changing the dumped database.
+
+Scrubbed dumps are tar-format archives. The output of `pg_dump -Ft` is streamed
+through pgclone, which rewrites the COPY data of scrubbed tables with
+per-column transformers in a pool of worker processes. Other tables are passed
+through as-is. Scrubbed archives are restored like any other dump.
+
+Transformers are applied to values that aren't NULL and are one of:
+
+- "null": Replace the value with NULL.
+- "empty": Replace the value with an empty string.
+- "hash": Replace the value with its SHA-256 hex digest, which keeps equal
+  values equal across tables.
+- "email": Replace the value with a fake email address derived from its hash.
+- "faker:<method>": Replace the value with a value from the method of a
+  `faker.Faker` instance, such as "faker:name". Requires `faker`.
+- The import path of a function that takes the value and returns the new
+  value or None for NULL.
+"""
+
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import io
+import itertools
+import subprocess
+import tarfile
+import tempfile
+
+from django.apps import apps
+from django.core.exceptions import AppRegistryNotReady
+from django.utils.module_loading import import_string
+
+from pgclone import db, exceptions, logging, settings
+
+# The number of COPY lines transformed by a worker at a time
+_CHUNK_LINES = 10000
+
+# COPY text format escapes. See https://www.postgresql.org/docs/current/sql-copy.html
+_ESCAPES = {
+    "\\": "\\\\",
+    "\n": "\\n",
+    "\r": "\\r",
+    "\t": "\\t",
+    "\b": "\\b",
+    "\f": "\\f",
+    "\v": "\\v",
+}
+_UNESCAPES = {escaped[1]: char for char, escaped in _ESCAPES.items()}
+
+
+def _hash(value):
+    return hashlib.sha256(value.encode("utf-8", "surrogateescape")).hexdigest()
+
+
+_BUILTINS = {
+    "null": lambda value: None,
+    "empty": lambda value: "",
+    "hash": _hash,
+    "email": lambda value: f"{_hash(value)[:16]}@example.com",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _transformer(name):
+    if name in _BUILTINS:
+        return _BUILTINS[name]
+    elif name.startswith("faker:"):
+        try:
+            import faker
+        except ImportError as exc:  # pragma: no cover
+            raise exceptions.RuntimeError(f'Install "faker" to use "{name}".') from exc
+
+        method = getattr(faker.Faker(), name[6:])
+        return lambda value: str(method())
+    else:
+        try:
+            return import_string(name)
+        except ImportError as exc:
+            raise exceptions.ValueError(f'"{name}" is not a valid transformer.') from exc
+
+
+def _unescape(field):
+    if "\\" not in field:
+        return field
+
+    chars = []
+    escaped = False
+    for char in field:
+        if escaped:
+            chars.append(_UNESCAPES.get(char, char))
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        else:
+            chars.append(char)
+
+    return "".join(chars)
+
+
+def _escape(value):
+    return "".join(_ESCAPES.get(char, char) for char in value)
+
+
+def _is_end(line):
+    """True for the line that ends COPY data. Empty lines are rows with an empty value"""
+    return line.rstrip("\n") == "\\."
+
+
+def _transform_lines(lines, *, transformers):
+    """
+    Transform lines of COPY data. Transformers map column indices to transformer names
+    so that they can be sent to worker processes
+    """
+    transformed = []
+    for num, line in enumerate(lines):
+        if _is_end(line):
+            # The end of the COPY data
+            transformed.extend(lines[num:])
+            break
+
+        fields = line.rstrip("\n").split("\t")
+        for index, name in transformers.items():
+            if fields[index] != "\\N":
+                value = _transformer(name)(_unescape(fields[index]))
+                fields[index] = "\\N" if value is None else _escape(str(value))
+
+        transformed.append("\t".join(fields) + ("\n" if line.endswith("\n") else ""))
+
+    return transformed
+
+
+def _transform(in_f, out_f, *, transformers, executor, workers):
+    """
+    Transform the COPY data of a table, keeping a bounded number of chunks in flight
+    so that memory usage doesn't depend on the size of the table
+    """
+    # Members of streamed archives aren't seekable, so lines are decoded as they're read
+    lines = (line.decode("utf-8", "surrogateescape") for line in in_f)
+
+    def data_lines():
+        # Lines after the end of the data are copied as-is once the data is written
+        for line in lines:
+            yield line
+            if _is_end(line):
+                return
+
+    data = data_lines()
+    chunks = iter(lambda: list(itertools.islice(data, _CHUNK_LINES)), [])
+    transform = functools.partial(_transform_lines, transformers=transformers)
+
+    def write(chunk):
+        out_f.write("".join(chunk).encode("utf-8", "surrogateescape"))
+
+    if not executor:
+        for chunk in chunks:
+            write(transform(chunk))
+    else:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(transform, chunk))
+            if len(pending) >= workers * 2:
+                write(pending.popleft().result())
+
+        while pending:
+            write(pending.popleft().result())
+
+    for line in lines:
+        write([line])
+
+
+def _table_name(target):
+    """Return the table name of a model label or table name"""
+    try:
+        return apps.get_model(target)._meta.db_table
+    except (LookupError, ValueError, AppRegistryNotReady):
+        # Apps aren't set up when dumping with the lightweight CLI
+        return target
+
+
+def _columns(database, *, schema, table):
+    """Return the columns of a table in the order pg_dump writes them"""
+    rows = db.query(
+        "SELECT a.attname FROM pg_attribute a"
+        " JOIN pg_class c ON c.oid = a.attrelid"
+        " JOIN pg_namespace n ON n.oid = c.relnamespace"
+        " WHERE n.nspname = %s AND c.relname = %s AND a.attnum > 0"
+        " AND NOT a.attisdropped AND a.attgenerated = ''"
+        " ORDER BY a.attnum",
+        [schema, table],
+        database=database,
+    )
+    return [name for (name,) in rows]
+
+
+def _tables(database):
+    """Return the schemas and names of the tables of a database"""
+    return db.query(
+        "SELECT n.nspname, c.relname FROM pg_class c"
+        " JOIN pg_namespace n ON n.oid = c.relnamespace"
+        " WHERE c.relkind IN ('r', 'p')",
+        database=database,
+    )
+
+
+def _scrubbed_members(toc, toc_member, *, rules, database):
+    """
+    Return the transformers of the tar members of scrubbed tables. The table of
+    contents is listed with pg_restore to find the data members of tables
+    """
+    rules = {_table_name(target): columns for target, columns in rules.items()}
+
+    # Rules that match no table, such as model labels that weren't resolved, would
+    # dump the data unscrubbed
+    tables = _tables(database)
+    unknown = [
+        target
+        for target in rules
+        if not any(target in (f"{schema}.{table}", table) for schema, table in tables)
+    ]
+    if unknown:
+        raise exceptions.ValueError(
+            f'Scrubbed table(s) {", ".join(unknown)} don\'t exist in "{database["NAME"]}".'
+        )
+
+    with tempfile.NamedTemporaryFile(dir=settings.spool_dir(), suffix=".tar") as toc_f:
+        with tarfile.open(fileobj=toc_f, mode="w", format=tarfile.GNU_FORMAT) as toc_tar:
+            toc_tar.addfile(toc_member, io.BytesIO(toc))
+        toc_f.flush()
+
+        toc_lines = subprocess.run(
+            ["pg_restore", "-l", toc_f.name], capture_output=True, text=True, check=True
+        ).stdout.splitlines()
+
+    members = {}
+    for line in toc_lines:
+        if " TABLE DATA " not in line or line.startswith(";"):
+            continue
+
+        dump_id = line.split(";", 1)[0]
+        schema, table = line.split(" TABLE DATA ", 1)[1].split()[:2]
+        columns = rules.get(f"{schema}.{table}") or rules.get(table)
+        if not columns:
+            continue
+
+        table_columns = _columns(database, schema=schema, table=table)
+        unknown = set(columns) - set(table_columns)
+        if unknown:
+            raise exceptions.ValueError(
+                f'Scrubbed table "{schema}.{table}" has no column(s) {", ".join(sorted(unknown))}.'
+            )
+
+        members[f"{dump_id}.dat"] = {
+            table_columns.index(column): transformer for column, transformer in columns.items()
+        }
+        logging.success_msg(f'Scrubbing {", ".join(columns)} of "{schema}.{table}"')
+
+    return members
+
+
+def rewrite(in_stream, out_stream, *, rules, database):
+    """
+    Rewrite a tar-format archive from pg_dump, scrubbing the data of tables.
+
+    Args:
+        in_stream: The binary stream of the archive.
+        out_stream: The binary stream the scrubbed archive is written to.
+        rules: A dictionary of tables or model labels to dictionaries of their
+            columns and transformers.
+        database: The configuration of the dumped database.
+    """
+    workers = settings.scrub_workers()
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    members = {}
+    try:
+        in_tar = tarfile.open(fileobj=in_stream, mode="r|")
+        out_tar = tarfile.open(fileobj=out_stream, mode="w|", format=tarfile.GNU_FORMAT)
+        with in_tar, out_tar:
+            for member in in_tar:
+                member_f = in_tar.extractfile(member)
+                if member.name == "toc.dat":
+                    # pg_dump writes the table of contents before the data of tables
+                    toc = member_f.read()
+                    members = _scrubbed_members(toc, member, rules=rules, database=database)
+                    out_tar.addfile(member, io.BytesIO(toc))
+                elif member.name in members:
+                    # The size of the member is only known once it's transformed
+                    with tempfile.TemporaryFile(dir=settings.spool_dir()) as spool_f:
+                        _transform(
+                            member_f,
+                            spool_f,
+                            transformers=members[member.name],
+                            executor=executor,
+                            workers=workers,
+                        )
+                        member.size = spool_f.tell()
+                        spool_f.seek(0)
+                        out_tar.addfile(member, spool_f)
+                else:
+                    out_tar.addfile(member, member_f)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+
+def pump(*, rules, database):
+    """Return a pump for `run.pipe` that scrubs the tar-format archive output by pg_dump"""
+    return functools.partial(rewrite, rules=rules, database=database)
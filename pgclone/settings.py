@@ -34,6 +34,62 @@ def reversible():
     return getattr(settings, "PGCLONE_REVERSIBLE", False)
 
 
+def analyze():
+    return getattr(settings, "PGCLONE_ANALYZE", False)
+
+
+def prewarm():
+    return getattr(settings, "PGCLONE_PREWARM", [])
+
+
+def prewarm_timeout():
+    return getattr(settings, "PGCLONE_PREWARM_TIMEOUT", 60)
+
+
+def backfill():
+    return getattr(settings, "PGCLONE_BACKFILL", [])
+
+
+def download_chunk_size():
+    return getattr(settings, "PGCLONE_DOWNLOAD_CHUNK_SIZE", None)
+
+
+def download_workers():
+    return getattr(settings, "PGCLONE_DOWNLOAD_WORKERS", 4)
+
+
+def download_retries():
+    return getattr(settings, "PGCLONE_DOWNLOAD_RETRIES", 5)
+
+
+def dump_from():
+    return getattr(settings, "PGCLONE_DUMP_FROM", None)
+
+
+def dump_max_lag():
+    return getattr(settings, "PGCLONE_DUMP_MAX_LAG", 60)
+
+
+def dump_lag_timeout():
+    return getattr(settings, "PGCLONE_DUMP_LAG_TIMEOUT", 0)
+
+
+def dump_rate_limit():
+    return getattr(settings, "PGCLONE_DUMP_RATE_LIMIT", None)
+
+
+def dump_nice():
+    return getattr(settings, "PGCLONE_DUMP_NICE", None)
+
+
+def dump_health_query():
+    return getattr(settings, "PGCLONE_DUMP_HEALTH_QUERY", None)
+
+
+def dump_health_threshold():
+    return getattr(settings, "PGCLONE_DUMP_HEALTH_THRESHOLD", None)
+
+
 def allow_restore():
     return getattr(settings, "PGCLONE_ALLOW_RESTORE", True)
 
@@ -46,6 +102,14 @@ def allow_copy():
     return getattr(settings, "PGCLONE_ALLOW_COPY", True)
 
 
+def copy_strategy():
+    return getattr(settings, "PGCLONE_COPY_STRATEGY", "template")
+
+
+def copy_template_max_size():
+    return getattr(settings, "PGCLONE_COPY_TEMPLATE_MAX_SIZE", 1024**3)
+
+
 def configs():
     return getattr(settings, "PGCLONE_CONFIGS", {})
 
@@ -74,6 +138,82 @@ def exclude():
     return getattr(settings, "PGCLONE_EXCLUDE", [])
 
 
+def exclude_larger_than():
+    return getattr(settings, "PGCLONE_EXCLUDE_LARGER_THAN", None)
+
+
+def keep_partitions():
+    return getattr(settings, "PGCLONE_KEEP_PARTITIONS", None)
+
+
+def schemas():
+    return getattr(settings, "PGCLONE_SCHEMAS", [])
+
+
+def exclude_schemas():
+    return getattr(settings, "PGCLONE_EXCLUDE_SCHEMAS", [])
+
+
+def scrub():
+    return getattr(settings, "PGCLONE_SCRUB", {})
+
+
+def scrub_workers():
+    return getattr(settings, "PGCLONE_SCRUB_WORKERS", 4)
+
+
+def jobs():
+    return getattr(settings, "PGCLONE_JOBS", 1)
+
+
+def hook_workers():
+    return getattr(settings, "PGCLONE_HOOK_WORKERS", 1)
+
+
+def job_workers():
+    return getattr(settings, "PGCLONE_JOB_WORKERS", 1)
+
+
+def job_cache():
+    return getattr(settings, "PGCLONE_JOB_CACHE", "pgclone")
+
+
+def test_dump_key():
+    return getattr(settings, "PGCLONE_TEST_DUMP_KEY", None)
+
+
+def test_worker():
+    return getattr(settings, "PGCLONE_TEST_WORKER", "main")
+
+
+def stats_file():
+    return getattr(settings, "PGCLONE_STATS_FILE", None)
+
+
+def dump_engine():
+    return getattr(settings, "PGCLONE_DUMP_ENGINE", "logical")
+
+
+def physical_dir():
+    return getattr(settings, "PGCLONE_PHYSICAL_DIR", None)
+
+
+def physical_temp_port():
+    return getattr(settings, "PGCLONE_PHYSICAL_TEMP_PORT", None)
+
+
+def spool_dir():
+    return getattr(settings, "PGCLONE_SPOOL_DIR", None)
+
+
+def opentelemetry():
+    return getattr(settings, "PGCLONE_OPENTELEMETRY", False)
+
+
+def prometheus_textfile_dir():
+    return getattr(settings, "PGCLONE_PROMETHEUS_TEXTFILE_DIR", None)
+
+
 @functools.lru_cache()
 def conn_db():
     conn_db = getattr(settings, "PGCLONE_CONN_DB", None)
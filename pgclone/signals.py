@@ -0,0 +1,13 @@
+"""
+Signals sent while dumping, restoring, copying and cloning databases.
+"""
+
+import django.dispatch
+
+# Sent when a phase of an operation, such as "pg_restore", finishes. Receivers
+# get the finished `pgclone.spans.Span` as the `span` argument
+span_finished = django.dispatch.Signal()
+
+# Sent when a dump, restore, copy or clone finishes, successfully or not.
+# Receivers get the `pgclone.spans.Operation` as the `operation` argument
+operation_finished = django.dispatch.Signal()
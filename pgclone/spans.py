@@ -0,0 +1,251 @@
+"""
+Per-phase timings of dumps, restores, copies and clones.
+
+Every phase of an operation, such as "create" or "pg_restore", is recorded as a
+span with its duration and attributes, such as the number of bytes and rows.
+Spans are sent with the `pgclone.signals.span_finished` signal as they finish
+and are available on the `Result` returned by the operation.
+
+Finished operations are also exported to OpenTelemetry when
+`settings.PGCLONE_OPENTELEMETRY` is set and to a Prometheus textfile collector
+directory when `settings.PGCLONE_PROMETHEUS_TEXTFILE_DIR` is set.
+"""
+
+import contextlib
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Union
+
+from pgclone import logging, settings, signals
+
+_current = threading.local()
+
+
+class Span:
+    """A timed phase of an operation"""
+
+    def __init__(self, name: str, *, operation: Union[str, None] = None, **attributes):
+        self.name = name
+        self.operation = operation
+        self.attributes = attributes
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self) -> float:
+        """The duration of the span in seconds"""
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attributes) -> None:
+        """Set attributes of the span, such as the number of "bytes" and "rows"."""
+        self.attributes.update(attributes)
+
+    def __repr__(self):
+        return f"<Span {self.name} {self.duration:.3f}s {self.attributes}>"
+
+
+class Operation:
+    """A dump, restore, copy or clone and the spans of its phases"""
+
+    def __init__(self, name: str, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.spans: List[Span] = []
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self) -> float:
+        """The duration of the operation in seconds"""
+        return (self.end or time.time()) - self.start
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        """The total seconds spent in every phase, in the order the phases started"""
+        timings = {}
+        for span in self.spans:
+            timings[span.name] = timings.get(span.name, 0) + span.duration
+
+        return timings
+
+
+class Result(str):
+    """
+    The dump key returned by an operation. Results are strings so that they can be
+    used as dump keys, and carry the timings of the operation.
+    """
+
+    def __new__(cls, value: str = "", operation: Union[Operation, None] = None):
+        result = super().__new__(cls, value)
+        result.operation = operation
+        return result
+
+    @property
+    def spans(self) -> List[Span]:
+        return self.operation.spans if self.operation else []
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        return self.operation.timings if self.operation else {}
+
+    @property
+    def duration(self) -> Union[float, None]:
+        return self.operation.duration if self.operation else None
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Record a phase of the current operation. Yields the `Span` so that attributes
+    can be set once they are known
+    """
+    operation = getattr(_current, "operation", None)
+    current_span = Span(name, operation=operation.name if operation else None, **attributes)
+    try:
+        yield current_span
+    except BaseException as exc:
+        current_span.error = str(exc) or type(exc).__name__
+        raise
+    finally:
+        current_span.end = time.time()
+        if operation:
+            operation.spans.append(current_span)
+
+        signals.span_finished.send(sender=Span, span=current_span)
+
+
+@contextlib.contextmanager
+def operation(name, **attributes):
+    """Record the spans of an operation and export them once it finishes"""
+    previous = getattr(_current, "operation", None)
+    current_operation = Operation(name, **attributes)
+    _current.operation = current_operation
+    try:
+        yield current_operation
+    except BaseException as exc:
+        current_operation.error = str(exc) or type(exc).__name__
+        raise
+    finally:
+        _current.operation = previous
+        current_operation.end = time.time()
+        signals.operation_finished.send(sender=Operation, operation=current_operation)
+        _export(current_operation)
+
+
+@contextlib.contextmanager
+def resume(operation):
+    """
+    Record spans of an operation that was started elsewhere, such as in another thread.
+    The operation is still finished by the context that started it
+    """
+    previous = getattr(_current, "operation", None)
+    _current.operation = operation
+    try:
+        yield operation
+    finally:
+        _current.operation = previous
+
+
+def _export(operation):
+    # Exporting is best effort and never fails the operation
+    try:
+        if settings.opentelemetry():
+            _export_opentelemetry(operation)
+
+        if settings.prometheus_textfile_dir():
+            _export_prometheus(operation, textfile_dir=settings.prometheus_textfile_dir())
+    except Exception as exc:  # pragma: no cover
+        logging.success_msg(f"Could not export timings: {exc}")
+
+
+def _otel_attributes(attributes):
+    return {
+        f"pgclone.{key}": value
+        for key, value in attributes.items()
+        if isinstance(value, (str, bool, int, float))
+    }
+
+
+def _export_opentelemetry(operation):  # pragma: no cover
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logging.success_msg("Skipping OpenTelemetry export. opentelemetry-api is not installed")
+        return
+
+    tracer = trace.get_tracer("pgclone")
+    root = tracer.start_span(
+        f"pgclone.{operation.name}",
+        start_time=int(operation.start * 1e9),
+        attributes=_otel_attributes(operation.attributes),
+    )
+    if operation.error:
+        root.set_status(trace.Status(trace.StatusCode.ERROR, operation.error))
+
+    context = trace.set_span_in_context(root)
+    for finished_span in operation.spans:
+        otel_span = tracer.start_span(
+            finished_span.name,
+            context=context,
+            start_time=int(finished_span.start * 1e9),
+            attributes=_otel_attributes(finished_span.attributes),
+        )
+        if finished_span.error:
+            otel_span.set_status(trace.Status(trace.StatusCode.ERROR, finished_span.error))
+        otel_span.end(end_time=int(finished_span.end * 1e9))
+
+    root.end(end_time=int(operation.end * 1e9))
+
+
+def _prometheus_labels(**labels):
+    escaped = {
+        key: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for key, value in labels.items()
+    }
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+
+def _export_prometheus(operation, *, textfile_dir):
+    """
+    Write the metrics of the last run of an operation on a database to a file read
+    by the textfile collector of the Prometheus node exporter
+    """
+    database = operation.attributes.get("database") or ""
+    labels = {"operation": operation.name, "database": database}
+    phase_bytes = {}
+    phase_rows = {}
+    for finished_span in operation.spans:
+        if finished_span.attributes.get("bytes") is not None:
+            phase_bytes[finished_span.name] = finished_span.attributes["bytes"]
+        if finished_span.attributes.get("rows") is not None:
+            phase_rows[finished_span.name] = finished_span.attributes["rows"]
+
+    metrics = [
+        ("pgclone_duration_seconds", "Duration of the last operation.", {"": operation.duration}),
+        ("pgclone_success", "1 if the last operation succeeded.", {"": int(not operation.error)}),
+        ("pgclone_timestamp_seconds", "When the last operation finished.", {"": operation.end}),
+        ("pgclone_phase_duration_seconds", "Duration of phases.", operation.timings),
+        ("pgclone_phase_bytes", "Bytes processed by phases.", phase_bytes),
+        ("pgclone_phase_rows", "Rows processed by phases.", phase_rows),
+    ]
+    lines = []
+    for metric, description, values in metrics:
+        if not values:
+            continue
+
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} gauge"]
+        for phase, value in values.items():
+            metric_labels = dict(labels, phase=phase) if phase else labels
+            lines.append(f"{metric}{_prometheus_labels(**metric_labels)} {value}")
+
+    file_name = re.sub(r"[^a-zA-Z0-9_-]", "_", f"pgclone_{operation.name}_{database}")
+    file_path = os.path.join(textfile_dir, f"{file_name}.prom")
+    # Write atomically since the collector reads files at any time
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, file_path)
@@ -0,0 +1,62 @@
+"""
+Records the throughput of dumps and restores in `settings.PGCLONE_STATS_FILE`
+so that future dumps and restores can be estimated.
+"""
+
+import json
+import os
+
+from pgclone import logging, settings
+
+# The weight of the latest sample in the moving averages
+_ALPHA = 0.5
+
+
+def load():
+    """Load recorded statistics, returning an empty dictionary if there are none"""
+    if not settings.stats_file():  # pragma: no cover
+        return {}
+
+    try:
+        with open(settings.stats_file()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _average(previous, value):
+    return value if previous is None else _ALPHA * value + (1 - _ALPHA) * previous
+
+
+def record(operation, *, db_bytes, archive_bytes, seconds):
+    """
+    Record the throughput of a dump or restore.
+
+    Args:
+        operation: Either "dump" or "restore".
+        db_bytes: The size of the dumped data or of the restored database.
+        archive_bytes: The size of the dump archive or None if it is unknown.
+        seconds: How long the operation took.
+    """
+    if not settings.stats_file() or not db_bytes or seconds <= 0:  # pragma: no cover
+        return
+
+    all_stats = load()
+    op_stats = all_stats.setdefault(operation, {})
+    op_stats["bytes_per_second"] = _average(op_stats.get("bytes_per_second"), db_bytes / seconds)
+    if archive_bytes:
+        op_stats["compression_ratio"] = _average(
+            op_stats.get("compression_ratio"), archive_bytes / db_bytes
+        )
+    op_stats["samples"] = op_stats.get("samples", 0) + 1
+
+    # Write atomically so that concurrent commands never read a partial file.
+    # Recording is best effort and never fails a finished dump or restore
+    tmp_path = f"{settings.stats_file()}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(all_stats, f, indent=2)
+        os.replace(tmp_path, settings.stats_file())
+    except OSError as exc:
+        msg = f'Could not record statistics in "{settings.stats_file()}": {exc}'
+        logging.success_msg(msg)
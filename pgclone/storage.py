@@ -1,8 +1,9 @@
 import os
 import pathlib
+import shlex
 import subprocess
 
-from pgclone import exceptions, settings
+from pgclone import exceptions, settings, throttle
 
 
 def validate_s3_support():  # pragma: no cover
@@ -19,6 +20,10 @@ def validate_s3_support():  # pragma: no cover
 
 
 class Storage:
+    # True if `iter_keys` yields dump keys in reverse lexicographic order,
+    # allowing listings to stop early when looking for the latest keys
+    reverse_sorted = False
+
     def __init__(self, storage_location):
         # Ensure the storage location always has a slash appended
         self.storage_location = os.path.join(storage_location, "")
@@ -34,8 +39,34 @@ class Storage:
         prefix_len = len(self.storage_location)
         return path[prefix_len:]
 
-    def pg_dump(self, file_path):
-        """Given a file path, generates the CLI fragment to append to pg_dump"""
+    def iter_keys(self, prefix=None):
+        """Lazily yield every dump key under the storage location matching the prefix"""
+        pass
+
+    def ls(self, prefix=None):
+        return list(self.iter_keys(prefix=prefix) or [])
+
+    def size(self, file_path):
+        """Given a file path, return its size in bytes or None if it can't be determined"""
+        pass
+
+    def read(self, file_path):
+        """Given a file path, return its contents or None if it doesn't exist"""
+        pass
+
+    def write(self, file_path, contents):
+        """Given a file path, write bytes to it"""
+        pass
+
+    def download_range(self, file_path, start, end, dest_path):
+        """Given a file path, download the bytes from start to end (inclusive) to dest_path"""
+        pass
+
+    def pg_dump(self, file_path, nice=None):
+        """
+        Given a file path, generates the CLI fragment to append to pg_dump. Uploaders
+        run with the niceness, if any
+        """
         pass
 
     def pg_restore(self, file_path):
@@ -54,45 +85,132 @@ class S3(Storage):
         )
         super().__init__(*args, **kwargs)
 
-    def ls(self, prefix=None):  # pragma: no cover
+    def iter_keys(self, prefix=None):  # pragma: no cover
         s3_path = os.path.join(self.storage_location, prefix or "")
         s3_bucket = "s3://" + s3_path[5:].split("/", 1)[0]
         cmd = f"aws s3 ls {s3_path}{self.s3_endpoint_url} --recursive | cut -c32-"
-        process = subprocess.run(
-            cmd, shell=True, stdout=subprocess.PIPE, check=True, env=dict(os.environ, **self.env)
+
+        # Stream the listing so that callers can stop early without
+        # holding every key of the bucket in memory
+        process = subprocess.Popen(
+            cmd, shell=True, stdout=subprocess.PIPE, env=dict(os.environ, **self.env)
         )
-        abs_paths = [
-            os.path.join(s3_bucket, path)
-            for path in process.stdout.decode("utf-8").split("\n")
-            if path
-        ]
-        return [self.dump_key(path) for path in abs_paths]
+        try:
+            for line in process.stdout:
+                path = line.decode("utf-8").rstrip("\n")
+                if path:
+                    yield self.dump_key(os.path.join(s3_bucket, path))
+        except GeneratorExit:
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            process.wait()
+
+        if process.returncode:
+            raise exceptions.RuntimeError("Error listing S3 dump keys.")
 
     def get_env(self):
         return settings.s3_config()
 
-    def pg_dump(self, file_path):
-        return f"| aws s3 cp - {file_path}{self.s3_endpoint_url}"
+    def size(self, file_path):  # pragma: no cover
+        cmd = f"aws s3 ls {file_path}{self.s3_endpoint_url}"
+        process = subprocess.run(
+            cmd, shell=True, stdout=subprocess.PIPE, env=dict(os.environ, **self.env)
+        )
+        # Output is in the format of "<date> <time> <size> <key>"
+        parts = process.stdout.decode("utf-8").split()
+        return int(parts[2]) if process.returncode == 0 and len(parts) >= 4 else None
+
+    def read(self, file_path):  # pragma: no cover
+        cmd = f"aws s3 cp {file_path} -{self.s3_endpoint_url}"
+        process = subprocess.run(
+            cmd, shell=True, stdout=subprocess.PIPE, env=dict(os.environ, **self.env)
+        )
+        return process.stdout if process.returncode == 0 else None
+
+    def write(self, file_path, contents):  # pragma: no cover
+        cmd = f"aws s3 cp - {file_path}{self.s3_endpoint_url}"
+        process = subprocess.run(cmd, shell=True, input=contents, env=dict(os.environ, **self.env))
+        if process.returncode:
+            raise exceptions.RuntimeError(f'Error writing "{file_path}" to S3.')
+
+    def download_range(self, file_path, start, end, dest_path):  # pragma: no cover
+        bucket, key = file_path[5:].split("/", 1)
+        cmd = (
+            f"aws s3api get-object --bucket {shlex.quote(bucket)} --key {shlex.quote(key)}"
+            f" --range bytes={start}-{end} {shlex.quote(dest_path)}{self.s3_endpoint_url}"
+        )
+        process = subprocess.run(
+            cmd, shell=True, stdout=subprocess.DEVNULL, env=dict(os.environ, **self.env)
+        )
+        if process.returncode:
+            raise exceptions.RuntimeError(f'Error downloading "{file_path}" from S3.')
+
+    def pg_dump(self, file_path, nice=None):
+        return "| " + throttle.niced(f"aws s3 cp - {file_path}{self.s3_endpoint_url}", nice)
 
     def pg_restore(self, file_path):
         return f"aws s3 cp {file_path} -{self.s3_endpoint_url} |"
 
 
 class Local(Storage):
-    def ls(self, prefix=None):
-        abs_paths = [
-            os.path.join(dirpath, file_name)
-            for dirpath, _, file_names in os.walk(self.storage_location)
-            for file_name in file_names
-        ]
-        dump_keys = [self.dump_key(path) for path in abs_paths]
-
-        if prefix:
-            dump_keys = [dump_key for dump_key in dump_keys if dump_key.startswith(prefix)]
+    reverse_sorted = True
+
+    def _walk(self, path):
+        """Yield files under a path in reverse lexicographic order of their dump keys"""
+        try:
+            with os.scandir(path) as it:
+                # Directories are sorted by their name with a trailing separator so
+                # that the ordering matches that of the full dump keys
+                entries = sorted(
+                    it,
+                    key=lambda entry: entry.name + "/" if entry.is_dir() else entry.name,
+                    reverse=True,
+                )
+        except FileNotFoundError:
+            return
+
+        for entry in entries:
+            if entry.is_dir():
+                yield from self._walk(entry.path)
+            else:
+                yield entry.path
+
+    def iter_keys(self, prefix=None):
+        prefix = prefix or ""
+
+        # Only walk the deepest directory that is fully specified by the prefix
+        # instead of the entire storage location
+        root = os.path.join(self.storage_location, os.path.dirname(prefix))
+        for path in self._walk(root):
+            dump_key = self.dump_key(path)
+            if dump_key.startswith(prefix):
+                yield dump_key
+
+    def size(self, file_path):
+        try:
+            return os.path.getsize(file_path)
+        except OSError:
+            return None
+
+    def read(self, file_path):
+        try:
+            return pathlib.Path(file_path).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def write(self, file_path, contents):
+        pathlib.Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        pathlib.Path(file_path).write_bytes(contents)
 
-        return dump_keys
+    def download_range(self, file_path, start, end, dest_path):
+        with open(file_path, "rb") as src, open(dest_path, "wb") as dest:
+            src.seek(start)
+            dest.write(src.read(end - start + 1))
 
-    def pg_dump(self, file_path):
+    def pg_dump(self, file_path, nice=None):
+        # Files are written by the shell, so there is no uploader to nice
         pathlib.Path(file_path).parent.mkdir(parents=True, exist_ok=True)
         return f"> {file_path}"
 
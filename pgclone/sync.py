@@ -0,0 +1,365 @@
+"""
+Continuously synced clones with logical replication.
+
+Synced clones start with a snapshot-consistent dump of the source database that
+is restored like any other dump, including pre-swap hooks. Changes made to the
+source after the snapshot are then streamed to the clone by a subscription to a
+publication of every table of the source.
+
+The replication slot of the subscription is created by pgclone before dumping
+the source. Creating the slot exports a snapshot of the source, and the source
+is dumped with that snapshot. The subscription then streams every change made
+after the dump without copying any data itself.
+
+Publications, slots and subscriptions are named after the clone and the
+subscription is commented with its source so that syncing can be stopped
+without knowing the source.
+"""
+
+import contextlib
+import json
+import re
+import time
+from typing import List, Union
+
+from django.db.utils import load_backend
+
+from pgclone import db, dump_cmd, exceptions, hooks, logging, options, restore_cmd, spans
+
+_PREFIX = "pgclone-sync:"
+
+# Seconds to wait for the source to release the slot of a disabled subscription
+_SLOT_RELEASE_TIMEOUT = 10
+
+
+def _name(target_db):
+    """The name of the publication, slot and subscription of a clone"""
+    return "pgclone_" + re.sub(r"[^a-z0-9_]", "_", target_db["NAME"].lower())[:55]
+
+
+def _conninfo(source_db):
+    """Return the libpq connection string the subscriber uses to connect to the source"""
+    params = {
+        "host": source_db["HOST"],
+        "port": source_db["PORT"],
+        "dbname": source_db["NAME"],
+        "user": source_db["USER"],
+        "password": source_db["PASSWORD"],
+    }
+    # Values are quoted with backslash escapes, as libpq expects
+    return " ".join(
+        f"{key}='" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+        for key, value in params.items()
+        if value not in ("", None)
+    )
+
+
+@contextlib.contextmanager
+def _exported_snapshot(source_db, *, slot):
+    """
+    Create the replication slot of a clone over a replication connection and yield
+    the snapshot it exports. The snapshot is usable until the connection closes
+    """
+    replication_db = dict(source_db, OPTIONS=dict(source_db["OPTIONS"], replication="database"))
+    connection = load_backend(replication_db["ENGINE"]).DatabaseWrapper(replication_db, "pgclone")
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE_REPLICATION_SLOT "{slot}" LOGICAL pgoutput EXPORT_SNAPSHOT')
+            yield cursor.fetchone()[2]
+    finally:
+        connection.close()
+
+
+def _subscription(target_db, *, using):
+    """Return the source alias and enabled state of the subscription of a clone"""
+    rows = db.query(
+        "SELECT shobj_description(oid, 'pg_subscription'), subenabled"
+        " FROM pg_subscription WHERE subname = %s",
+        [_name(target_db)],
+        database=target_db,
+    )
+    if not rows or not (rows[0][0] or "").startswith(_PREFIX):
+        raise exceptions.RuntimeError(f'Database "{using}" is not synced by pgclone.')
+
+    return json.loads(rows[0][0][len(_PREFIX) :])["source"], rows[0][1]
+
+
+def _server_db(db_config):
+    """The host, port and name that identify a database across aliases"""
+    return db_config["HOST"], str(db_config["PORT"] or 5432), db_config["NAME"]
+
+
+def is_synced(database, *, using):
+    """True if a database has the subscription of a clone, even when it's paused"""
+    return bool(
+        db.query(
+            "SELECT 1 FROM pg_subscription s JOIN pg_database d ON d.oid = s.subdbid"
+            " WHERE d.datname = %s AND s.subname = %s"
+            " AND shobj_description(s.oid, 'pg_subscription') LIKE %s",
+            [database["NAME"], _name(database), _PREFIX + "%"],
+            database=db.conn(using=using),
+        )
+    )
+
+
+def _drop_source(source_db, *, name):
+    """Drop the slot and publication of a clone on the source"""
+    deadline = time.time() + _SLOT_RELEASE_TIMEOUT
+    while db.query(
+        "SELECT 1 FROM pg_replication_slots WHERE slot_name = %s AND active",
+        [name],
+        database=source_db,
+    ):
+        if time.time() >= deadline:
+            raise exceptions.RuntimeError(f'Replication slot "{name}" is still in use.')
+
+        time.sleep(1)
+
+    db.execute(
+        "SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots"
+        " WHERE slot_name = %s",
+        [name],
+        database=source_db,
+    )
+    db.execute(f'DROP PUBLICATION IF EXISTS "{name}"', database=source_db)
+
+
+def _start(*, source, instance, database, storage_location, pre_swap_hooks, num_jobs):
+    """Sync implementation"""
+    source_db = db.conf(using=source)
+    target_db = db.conf(using=database)
+    if _server_db(source_db) == _server_db(target_db):
+        raise exceptions.RuntimeError("Sync source cannot be the same as the database.")
+
+    name = _name(target_db)
+    logging.success_msg(f'Publishing every table of "{source}" as "{name}"')
+    with spans.span("publish"):
+        db.execute(f'CREATE PUBLICATION "{name}" FOR ALL TABLES', database=source_db)
+
+    try:
+        # The snapshot of the dump is exported by the slot so that the subscription
+        # streams exactly the changes that aren't in the dump
+        with _exported_snapshot(source_db, slot=name) as snapshot:
+            with spans.span("dump"):
+                dump_key = dump_cmd._dump(
+                    exclude=[],
+                    config="none",
+                    pre_dump_hooks=[],
+                    instance=instance,
+                    database=source,
+                    storage_location=storage_location,
+                    snapshot=snapshot,
+                )
+
+        with spans.span("restore"):
+            restore_cmd._restore(
+                dump_key=dump_key,
+                pre_swap_hooks=pre_swap_hooks,
+                config="none",
+                reversible=False,
+                database=database,
+                storage_location=storage_location,
+                num_jobs=num_jobs,
+            )
+
+        logging.success_msg(f'Subscribing "{database}" to "{source}"')
+        with spans.span("subscribe"):
+            db.execute(
+                f'CREATE SUBSCRIPTION "{name}" CONNECTION %s PUBLICATION "{name}"'
+                f" WITH (create_slot = false, slot_name = '{name}', copy_data = false)",
+                [_conninfo(source_db)],
+                database=target_db,
+            )
+            db.execute(
+                f'COMMENT ON SUBSCRIPTION "{name}" IS %s',
+                [_PREFIX + json.dumps({"source": source})],
+                database=target_db,
+            )
+    except BaseException:
+        _drop_source(source_db, name=name)
+        raise
+
+    logging.success_msg(f'Database "{database}" is synced with "{source}"')
+    return dump_key
+
+
+def start(
+    source: str,
+    *,
+    instance: Union[str, None] = None,
+    database: Union[str, None] = None,
+    storage_location: Union[str, None] = None,
+    pre_swap_hooks: Union[List[str], None] = None,
+    jobs: Union[int, None] = None,
+    config: Union[str, None] = None,
+) -> spans.Result:
+    """
+    Start syncing a database with a source database.
+
+    The source is dumped to the storage location and restored to the database,
+    running pre-swap hooks before it's swapped in. Changes made to the source
+    after the dump are streamed until syncing is stopped.
+
+    Syncing requires `wal_level = logical` on the source and a source user that
+    can create publications of every table and replication slots. The database
+    user must be able to create subscriptions.
+
+    Args:
+        source: The database alias to sync from.
+        instance: The instance name of the initial dump.
+        database: The database alias to sync to.
+        storage_location: The storage location of the initial dump.
+        pre_swap_hooks: Hooks to run on the initial copy before it's swapped in.
+        jobs: The number of parallel jobs used to restore the initial copy.
+        config: The configuration name from `settings.PGCLONE_CONFIGS`.
+
+    Returns:
+        The dump key of the initial copy. The result is a string that also has the
+        `timings` and `spans` of every phase of the sync.
+    """
+    opts = options.get(
+        config=config,
+        instance=instance,
+        database=database,
+        storage_location=storage_location,
+        pre_swap_hooks=pre_swap_hooks,
+        jobs=jobs,
+    )
+
+    with spans.operation("sync", database=opts.database) as operation:
+        dump_key = _start(
+            source=source,
+            instance=opts.instance,
+            database=opts.database,
+            storage_location=opts.storage_location,
+            pre_swap_hooks=opts.pre_swap_hooks,
+            num_jobs=opts.jobs,
+        )
+
+    return spans.Result(dump_key, operation)
+
+
+def status(*, database: Union[str, None] = None) -> dict:
+    """
+    Get the status of a synced database.
+
+    Args:
+        database: The synced database.
+
+    Returns:
+        The "source" alias, whether syncing is "enabled", the "lag_seconds" since
+        the source last confirmed the position of the subscription and the
+        "lag_bytes" of WAL on the source that isn't applied yet. Lags are None
+        when they're unknown, such as when syncing is paused.
+    """
+    database = options.get(database=database).database
+    target_db = db.conf(using=database)
+    source, enabled = _subscription(target_db, using=database)
+    name = _name(target_db)
+
+    lag_seconds = db.query(
+        "SELECT EXTRACT(EPOCH FROM now() - latest_end_time) FROM pg_stat_subscription"
+        " WHERE subname = %s AND relid IS NULL",
+        [name],
+        database=target_db,
+    )
+    lag_bytes = db.query(
+        "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), confirmed_flush_lsn)"
+        " FROM pg_replication_slots WHERE slot_name = %s",
+        [name],
+        database=db.conf(using=source),
+    )
+    return {
+        "source": source,
+        "enabled": enabled,
+        "lag_seconds": (
+            float(lag_seconds[0][0]) if lag_seconds and lag_seconds[0][0] is not None else None
+        ),
+        "lag_bytes": int(lag_bytes[0][0]) if lag_bytes and lag_bytes[0][0] is not None else None,
+    }
+
+
+def pause(*, database: Union[str, None] = None) -> None:
+    """
+    Pause syncing a database. Changes made to the source are kept on the source
+    until syncing is resumed.
+
+    Args:
+        database: The synced database.
+    """
+    database = options.get(database=database).database
+    target_db = db.conf(using=database)
+    _subscription(target_db, using=database)
+    db.execute(f'ALTER SUBSCRIPTION "{_name(target_db)}" DISABLE', database=target_db)
+    logging.success_msg(f'Paused syncing "{database}"')
+
+
+def resume(*, database: Union[str, None] = None) -> None:
+    """
+    Resume syncing a paused database.
+
+    Args:
+        database: The synced database.
+    """
+    database = options.get(database=database).database
+    target_db = db.conf(using=database)
+    _subscription(target_db, using=database)
+    db.execute(f'ALTER SUBSCRIPTION "{_name(target_db)}" ENABLE', database=target_db)
+    logging.success_msg(f'Resumed syncing "{database}"')
+
+
+def run_hooks(
+    pre_swap_hooks: Union[List[str], None] = None,
+    *,
+    database: Union[str, None] = None,
+    config: Union[str, None] = None,
+) -> None:
+    """
+    Run pre-swap hooks on a synced database, such as ones that scrub data. Syncing
+    is paused while the hooks run.
+
+    Rows streamed from the source aren't scrubbed until hooks run again, so run
+    them periodically when syncing sensitive data.
+
+    Args:
+        pre_swap_hooks: The hooks to run. Defaults to the pre-swap hooks of the
+            configuration or settings.
+        database: The synced database.
+        config: The configuration name from `settings.PGCLONE_CONFIGS`.
+    """
+    opts = options.get(config=config, database=database, pre_swap_hooks=pre_swap_hooks)
+    target_db = db.conf(using=opts.database)
+    _, enabled = _subscription(target_db, using=opts.database)
+
+    if enabled:
+        pause(database=opts.database)
+
+    try:
+        hooks.execute(
+            opts.pre_swap_hooks, kind="pre_swap", database=target_db, using=opts.database
+        )
+    finally:
+        if enabled:
+            resume(database=opts.database)
+
+
+def stop(*, database: Union[str, None] = None) -> None:
+    """
+    Stop syncing a database. The subscription is dropped from the database and
+    the replication slot and publication are dropped from the source. The
+    database keeps its data.
+
+    Args:
+        database: The synced database.
+    """
+    database = options.get(database=database).database
+    target_db = db.conf(using=database)
+    source, _ = _subscription(target_db, using=database)
+    name = _name(target_db)
+
+    # Detach the slot so that dropping the subscription doesn't connect to the source
+    db.execute(f'ALTER SUBSCRIPTION "{name}" DISABLE', database=target_db)
+    db.execute(f'ALTER SUBSCRIPTION "{name}" SET (slot_name = NONE)', database=target_db)
+    db.execute(f'DROP SUBSCRIPTION "{name}"', database=target_db)
+    _drop_source(db.conf(using=source), name=name)
+    logging.success_msg(f'Stopped syncing "{database}" with "{source}"')
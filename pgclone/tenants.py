@@ -0,0 +1,158 @@
+"""
+Schema-scoped dumps and restores for deployments with a schema per tenant.
+
+Schema patterns match schema names with `*` and `?` wildcards. Dumps only
+include the matching schemas by passing them to `pg_dump`, and restores only
+restore the matching schemas by filtering the table of contents of the archive
+with `pg_restore -L`.
+
+Dumps can also be split into one archive per schema. Every schema is dumped in
+parallel as of a single snapshot, so the archives are consistent with each other
+and restoring one tenant only downloads the archive of that tenant.
+"""
+
+import contextlib
+import os
+import re
+import shlex
+import subprocess
+
+from django.db.utils import load_backend
+
+from pgclone import db, exceptions
+
+# "<id>; <oid> <oid> <DESC> <namespace> <tag> <owner>" lines of `pg_restore -l`.
+# Descriptions are upper-case words, such as "TABLE DATA"
+_TOC_LINE_RE = re.compile(r"^\d+; \d+ \d+ (?P<desc>(?:[A-Z]+ )+)(?P<namespace>\S+) (?P<tag>.*)$")
+
+
+def _regex(pattern):
+    return "".join(
+        ".*" if char == "*" else "." if char == "?" else re.escape(char) for char in pattern
+    )
+
+
+def matches(schema, *, schemas=(), exclude_schemas=()):
+    """True if a schema matches the schema patterns and none of the excluded patterns"""
+    return (not schemas or any(re.fullmatch(_regex(p), schema) for p in schemas)) and not any(
+        re.fullmatch(_regex(p), schema) for p in exclude_schemas
+    )
+
+
+def _pg_pattern(pattern):
+    """
+    Convert a schema pattern to a pg_dump pattern. Literal parts are quoted so
+    that they aren't case-folded or treated as regular expressions
+    """
+    return "".join(
+        part if part in ("*", "?") else '"' + part.replace('"', '""') + '"'
+        for part in re.split(r"([*?])", pattern)
+        if part
+    )
+
+
+def pg_dump_args(schemas=(), exclude_schemas=()):
+    """Return pg_dump arguments that only dump the matching schemas"""
+    return " ".join(
+        [f"-n {shlex.quote(_pg_pattern(pattern))}" for pattern in schemas]
+        + [f"-N {shlex.quote(_pg_pattern(pattern))}" for pattern in exclude_schemas]
+    )
+
+
+def resolve(schemas=(), exclude_schemas=(), *, database):
+    """Return the names of the schemas of a database that match the patterns"""
+    rows = db.query(
+        "SELECT nspname FROM pg_namespace"
+        " WHERE nspname NOT IN ('pg_catalog', 'information_schema')"
+        " AND nspname !~ '^pg_(toast|temp_)' ORDER BY nspname",
+        database=database,
+    )
+    return [
+        name for (name,) in rows if matches(name, schemas=schemas, exclude_schemas=exclude_schemas)
+    ]
+
+
+def size(schemas=(), exclude_schemas=(), *, database):
+    """Return the total size of the relations in the matching schemas"""
+    rows = db.query(
+        "SELECT n.nspname, SUM(pg_total_relation_size(c.oid)) FROM pg_class c"
+        " JOIN pg_namespace n ON n.oid = c.relnamespace"
+        " WHERE c.relkind IN ('r', 'm') GROUP BY n.nspname",
+        database=database,
+    )
+    return sum(
+        int(num_bytes or 0)
+        for name, num_bytes in rows
+        if matches(name, schemas=schemas, exclude_schemas=exclude_schemas)
+    )
+
+
+def _toc_schema(toc_line):
+    """
+    Return the schema of an entry of `pg_restore -l`, or None for entries that
+    don't belong to a schema, such as extensions. Schemas themselves, and their
+    comments and privileges, belong to the schema they create
+    """
+    match = _TOC_LINE_RE.match(toc_line)
+    if not match:
+        return None
+
+    desc = match.group("desc").strip()
+    if match.group("namespace") != "-":
+        return match.group("namespace")
+    elif desc == "SCHEMA":
+        return match.group("tag").split()[0]
+    elif desc in ("COMMENT", "ACL") and match.group("tag").startswith("SCHEMA "):
+        return match.group("tag").split()[1]
+
+    return None
+
+
+def filter_toc(toc, *, schemas=(), exclude_schemas=()):
+    """Filter the lines of `pg_restore -l` to the entries of the matching schemas"""
+    return [
+        line
+        for line in toc
+        if line.startswith(";")
+        or _toc_schema(line) is None
+        or matches(_toc_schema(line), schemas=schemas, exclude_schemas=exclude_schemas)
+    ]
+
+
+def toc(*, file_path, storage_client):
+    """
+    Return the lines of `pg_restore -l` of an archive. Only the table of contents
+    at the start of the archive is read
+    """
+    # pg_restore exits once it has read the table of contents, so the exit status
+    # of the storage command that streams the rest is ignored
+    try:
+        return subprocess.run(
+            f"{storage_client.pg_restore(file_path)} pg_restore -l",
+            shell=True,
+            capture_output=True,
+            text=True,
+            check=True,
+            env=dict(os.environ, **storage_client.env),
+        ).stdout.splitlines()
+    except subprocess.CalledProcessError as exc:
+        raise exceptions.RuntimeError(
+            f'Could not read the table of contents of "{file_path}": {exc.stderr.strip()}'
+        ) from exc
+
+
+@contextlib.contextmanager
+def exported_snapshot(source_db):
+    """
+    Yield a snapshot of a database that pg_dump can dump with `--snapshot`. The
+    snapshot is usable until the transaction that exported it finishes
+    """
+    connection = load_backend(source_db["ENGINE"]).DatabaseWrapper(dict(source_db), "pgclone")
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            cursor.execute("SELECT pg_export_snapshot()")
+            yield cursor.fetchone()[0]
+            cursor.execute("COMMIT")
+    finally:
+        connection.close()
@@ -0,0 +1,184 @@
+"""
+Test databases cloned from a restored dump.
+
+A dump is restored once into a template database, which is reused by every test
+session as long as the dump key doesn't change. Every test worker gets its own
+database that is created from the template with `CREATE DATABASE ... TEMPLATE`.
+When a session ends, worker databases are re-created from the template so that the
+next session can use them right away.
+"""
+
+from typing import List, Union
+
+from django.conf import settings as django_settings
+from django.db import connections
+from django.test import runner
+
+from pgclone import db, exceptions, hooks, logging, options, restore_cmd, settings
+
+# Comments on the template and worker databases store which dump key they have
+_TEMPLATE_PREFIX = "pgclone-template:"
+_POOL_PREFIX = "pgclone-pool:"
+
+
+def _template_db(database):
+    return db.make(db.conf(using=database)["NAME"] + "__template", using=database)
+
+
+def _worker_db(database, worker):
+    return db.make(db.conf(using=database)["NAME"] + f"__pool_{worker}", using=database)
+
+
+def _resolve_dump_key(dump_key, *, storage_location):
+    if dump_key.startswith(":"):
+        return dump_key
+    else:
+        return restore_cmd._resolve_dump_key(dump_key, storage_location=storage_location)
+
+
+def _create_template(dump_key, *, database, storage_location, pre_swap_hooks):
+    """Restore a dump into the template database if it isn't already restored"""
+    template_db = _template_db(database)
+    comment = _TEMPLATE_PREFIX + dump_key
+
+    # Serialize workers so that only the first one restores the template
+    with db.lock(template_db, using=database):
+        if db.comment(template_db, using=database) == comment:
+            return template_db
+
+        logging.success_msg(f'Restoring "{dump_key}" to the test template database')
+        if dump_key.startswith(":"):
+            _, _, _, pre_db, post_db = restore_cmd._restore_dbs(database)
+            restore_cmd._local_restore(
+                dump_key, temp_db=template_db, post_db=post_db, pre_db=pre_db, using=database
+            )
+        else:
+            restore_cmd._remote_restore(
+                dump_key,
+                temp_db=template_db,
+                using=database,
+                storage_location=storage_location,
+            )
+
+        hooks.execute(pre_swap_hooks, kind="pre_swap", database=template_db, using=database)
+
+        db.set_comment(template_db, comment, using=database)
+
+    return template_db
+
+
+def _create_worker_db(worker_db, *, template_db, dump_key, database):
+    db.drop(worker_db, using=database)
+    create_sql = f'CREATE DATABASE "{worker_db["NAME"]}" WITH TEMPLATE "{template_db["NAME"]}"'
+    db.psql(create_sql, using=database)
+    db.set_comment(worker_db, _POOL_PREFIX + dump_key, using=database)
+
+
+def _use_db(worker_db, *, database):
+    """Point the database alias at another database for the rest of the process"""
+    django_settings.DATABASES[database]["NAME"] = worker_db["NAME"]
+    connections[database].close()
+    connections[database].settings_dict["NAME"] = worker_db["NAME"]
+
+
+def setup(
+    dump_key: Union[str, None] = None,
+    *,
+    worker: str = "main",
+    database: Union[str, None] = None,
+    storage_location: Union[str, None] = None,
+    pre_swap_hooks: Union[List[str], None] = None,
+    config: Union[str, None] = None,
+) -> str:
+    """
+    Set up a test database for a worker from a restored dump.
+
+    Once set up, the database alias is pointed at the worker's database for the
+    rest of the process.
+
+    Args:
+        dump_key: The dump key or prefix to restore into the template database.
+            Local dump keys, such as ones made with `pgclone copy`, are also supported.
+        worker: A unique name of the test worker, such as the pytest-xdist worker ID.
+        database: The database alias to set up.
+        storage_location: The storage location of the dump.
+        pre_swap_hooks: The management commands to run on the template after restoring it.
+        config: The configuration name from `settings.PGCLONE_CONFIGS`.
+
+    Returns:
+        The name of the worker's database.
+    """
+    opts = options.get(
+        dump_key=dump_key,
+        pre_swap_hooks=pre_swap_hooks,
+        database=database,
+        storage_location=storage_location,
+        config=config,
+    )
+    if not opts.dump_key:
+        raise exceptions.ValueError("Must provide a dump key or prefix for test databases.")
+
+    dump_key = _resolve_dump_key(opts.dump_key, storage_location=opts.storage_location)
+    template_db = _create_template(
+        dump_key,
+        database=opts.database,
+        storage_location=opts.storage_location,
+        pre_swap_hooks=opts.pre_swap_hooks,
+    )
+    worker_db = _worker_db(opts.database, worker)
+
+    # Use a warm database from the previous session if it is from the same dump
+    if db.comment(worker_db, using=opts.database) != _POOL_PREFIX + dump_key:
+        _create_worker_db(
+            worker_db, template_db=template_db, dump_key=dump_key, database=opts.database
+        )
+
+    # Mark the database as used so that it is never reused without being recycled
+    db.set_comment(worker_db, _POOL_PREFIX + "in-use", using=opts.database)
+    _use_db(worker_db, database=opts.database)
+
+    return worker_db["NAME"]
+
+
+def teardown(*, database: Union[str, None] = None, recycle: bool = True) -> None:
+    """
+    Tear down the test database of a worker that was set up with `setup`.
+
+    Args:
+        database: The database alias used in `setup`.
+        recycle: Re-create the worker database from the template so that the next
+            session can use it right away. Otherwise it is dropped.
+    """
+    database = options.get(database=database).database
+    connections[database].close()
+
+    # The alias points to the worker database, so derive the template from it
+    worker_db = db.conf(using=database)
+    template_db = db.make(worker_db["NAME"].rsplit("__pool_", 1)[0] + "__template", using=database)
+    template_comment = db.comment(template_db, using=database) or ""
+
+    # Never drop a database that isn't a worker database, such as when the alias
+    # wasn't set up
+    if "__pool_" not in worker_db["NAME"] or not template_comment.startswith(_TEMPLATE_PREFIX):
+        raise exceptions.RuntimeError(
+            f'Database "{worker_db["NAME"]}" is not a test database set up by pgclone.'
+        )
+
+    if recycle:
+        dump_key = template_comment[len(_TEMPLATE_PREFIX) :]
+        _create_worker_db(worker_db, template_db=template_db, dump_key=dump_key, database=database)
+    else:
+        db.drop(worker_db, using=database)
+
+
+class DiscoverRunner(runner.DiscoverRunner):
+    """
+    A Django test runner that uses a database cloned from
+    `settings.PGCLONE_TEST_DUMP_KEY` instead of creating an empty test database.
+    """
+
+    def setup_databases(self, **kwargs):
+        setup(settings.test_dump_key(), worker=settings.test_worker())
+
+    def teardown_databases(self, old_config, **kwargs):
+        teardown()
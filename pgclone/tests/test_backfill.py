@@ -0,0 +1,133 @@
+import subprocess
+
+import pytest
+
+from pgclone import backfill, hooks, provenance, run, storage
+
+TOC = """;
+; Archive created at 2020-07-01 00:00:00 UTC
+;
+215; 1259 16390 TABLE public events postgres
+3245; 0 16390 TABLE DATA public events postgres
+3246; 0 16391 TABLE DATA public users postgres
+3247; 0 16392 TABLE DATA audit log postgres
+3248; 0 16393 TABLE DATA my schema my table postgres
+3500; 2606 16395 FK CONSTRAINT public users users_event_fk postgres
+3501; 2606 16396 FK CONSTRAINT public users users_group_fk postgres
+"""
+
+FK_SQL = """--
+-- Name: users users_event_fk; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.users
+    ADD CONSTRAINT users_event_fk FOREIGN KEY (event_id) REFERENCES public.events(id);
+
+
+--
+-- Name: users users_group_fk; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.users
+    ADD CONSTRAINT users_group_fk FOREIGN KEY ("group id") REFERENCES public."group"(id);
+"""
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("events", (None, "events")),
+        ("audit.log", ("audit", "log")),
+        ('"my schema"."my ""table"""', ("my schema", 'my "table"')),
+    ],
+)
+def test_parse_name(name, expected):
+    assert backfill._parse_name(name) == expected
+
+
+def test_deferred_table():
+    tables = [(None, "events"), ("audit", "log"), ("my schema", "my table")]
+    lines = TOC.splitlines()
+
+    assert [backfill._deferred_table(line, tables) for line in lines[3:]] == [
+        None,
+        ("public", "events"),
+        None,
+        ("audit", "log"),
+        ("my schema", "my table"),
+        None,
+        None,
+    ]
+
+
+def test_prepare_and_run(tmpdir, settings, mocker):
+    settings.PGCLONE_SPOOL_DIR = tmpdir.strpath
+    restore_db = {"NAME": "db", "USER": "user", "PASSWORD": "", "HOST": "host", "PORT": 5432}
+    patched_shell = mocker.patch.object(run, "shell", autospec=True)
+    mocker.patch.object(backfill.db, "lock", autospec=True)
+    record_backfill = mocker.patch.object(provenance, "record_backfill", autospec=True)
+    execute_hooks = mocker.patch.object(hooks, "execute", autospec=True)
+    mocker.patch.object(
+        subprocess,
+        "run",
+        autospec=True,
+        side_effect=[
+            subprocess.CompletedProcess([], 0, stdout=TOC),
+            subprocess.CompletedProcess([], 0, stdout=FK_SQL),
+        ],
+    )
+
+    archive_path, restore_list_path = backfill.prepare(
+        "dev/default/none/2020-07-01-00-00-00-000000.dump",
+        file_path="path.dump",
+        storage_client=storage.Local(tmpdir.strpath),
+        tables=["events", "audit.log"],
+        restore_db=restore_db,
+        pre_swap_hooks=["scrub"],
+    )
+    assert archive_path == tmpdir.join("pgclone-backfill-db", "archive.dump").strpath
+    restore_list = open(restore_list_path).read()
+    assert "TABLE DATA public users" in restore_list
+    assert "TABLE DATA public events" not in restore_list
+    assert "users_event_fk" not in restore_list
+    assert "users_group_fk" in restore_list
+
+    state_dir = tmpdir.join("pgclone-backfill-db")
+    assert state_dir.join("state.json").check()
+    assert backfill.is_pending(
+        restore_db, dump_key="dev/default/none/2020-07-01-00-00-00-000000.dump"
+    )
+    assert not backfill.is_pending(restore_db, dump_key="dev/default/none/other.dump")
+    assert "users_event_fk" in state_dir.join("constraints.list").read()
+
+    # An interrupted backfill keeps the state of the finished tables
+    patched_shell.side_effect = [None, RuntimeError]
+    with pytest.raises(RuntimeError):
+        backfill._run(restore_db, using="default")
+    # Pre-swap hooks run again after every backfilled table
+    execute_hooks.assert_called_once_with(
+        ["scrub"], kind="pre_swap", database=restore_db, using="default"
+    )
+
+    mocker.patch.object(backfill.db, "conf", autospec=True, return_value=restore_db)
+    assert backfill.status() == {
+        "dump_key": "dev/default/none/2020-07-01-00-00-00-000000.dump",
+        "pending": ["audit.log"],
+        "done": ["public.events"],
+    }
+
+    # Foreign keys are re-created after the last table
+    patched_shell.side_effect = None
+    patched_shell.reset_mock()
+    backfill.start(restore_db, using="default").join()
+    assert [call.args[0].split(" -L ")[1].split()[0] for call in patched_shell.call_args_list] == [
+        state_dir.join("backfill-1.list").strpath,
+        state_dir.join("constraints.list").strpath,
+    ]
+    assert not state_dir.check()
+    assert execute_hooks.call_count == 2
+    record_backfill.assert_called_once_with(
+        restore_db, dump_key="dev/default/none/2020-07-01-00-00-00-000000.dump", using="default"
+    )
+    assert backfill.status() is None
+    assert backfill._run(restore_db, using="default") is None
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from pgclone import clone_cmd, db, exceptions, restore_cmd, sync
+
+
+def test_source_url(settings):
+    settings.DATABASES = {
+        **settings.DATABASES,
+        "other": {"NAME": "other", "USER": "user", "HOST": "host", "PORT": 5432},
+    }
+
+    assert clone_cmd._source_url("other", database="default") == (
+        "postgresql://user:@host:5432/other"
+    )
+    assert clone_cmd._source_url("postgres://u:p@h/db", database="default") == (
+        "postgres://u:p@h/db"
+    )
+
+    with pytest.raises(exceptions.RuntimeError, match="cannot be the same"):
+        clone_cmd._source_url("other", database="other")
+
+    with pytest.raises(exceptions.ValueError, match="must be a database"):
+        clone_cmd._source_url("invalid", database="default")
+
+
+def test_clone(mocker, settings):
+    settings.DATABASES = {
+        **settings.DATABASES,
+        "other": {"NAME": "other", "USER": "user", "HOST": "host", "PORT": 5432},
+    }
+    is_synced = mocker.patch.object(sync, "is_synced", autospec=True, return_value=False)
+    mocker.patch.object(db, "lock", autospec=True)
+    mocker.patch.object(db, "drop", autospec=True)
+    mocker.patch.object(db, "size", autospec=True, return_value=10)
+    mocker.patch.object(db, "rows", autospec=True, return_value=1)
+    mocker.patch.object(restore_cmd, "_set_search_path", autospec=True)
+    psql = mocker.patch.object(db, "psql", autospec=True)
+    set_comment = mocker.patch.object(db, "set_comment", autospec=True)
+    transfer = mocker.patch.object(db, "transfer", autospec=True)
+
+    result = clone_cmd.clone("other", pre_swap_hooks=[])
+    assert result == "other"
+    assert list(result.timings) == ["drop", "create", "transfer", "hooks", "swap", "cleanup"]
+
+    temp_db = restore_cmd._restore_dbs("default")[1]
+    assert transfer.call_args.args == ("postgresql://user:@host:5432/other", temp_db)
+    assert psql.call_args_list[0].args[0] == f'CREATE DATABASE "{temp_db["NAME"]}"'
+
+    # Every phase is recorded so that an interrupted clone can be resumed
+    assert [
+        json.loads(call.args[1][len(restore_cmd._STATE_PREFIX) :])
+        for call in set_comment.call_args_list
+    ] == [
+        {"dump_key": ":clone", "phase": phase}
+        for phase in ("created", "restored", "post-snapshot", "hooks-done", "swapped")
+    ]
+
+    # Synced databases aren't swapped out by clones either
+    is_synced.return_value = True
+    transfer.reset_mock()
+    with pytest.raises(exceptions.RuntimeError, match="synced by pgclone"):
+        clone_cmd.clone("other")
+    assert not transfer.called
@@ -0,0 +1,90 @@
+import pytest
+from django import db as django_db
+
+from pgclone import copy_cmd, db, exceptions
+
+
+@pytest.mark.parametrize(
+    "size, server_version, expected_strategy",
+    [
+        (1, 140000, "template"),
+        (1, 150000, "wal_log"),
+        (1024**3 + 1, 170000, "dump"),
+        (1024**3 + 1, 180000, "clone"),
+    ],
+)
+def test_auto_strategy(mocker, size, server_version, expected_strategy):
+    mocker.patch("pgclone.db.size", autospec=True, return_value=size)
+    mocker.patch("pgclone.db.server_version", autospec=True, return_value=server_version)
+
+    assert copy_cmd._auto_strategy({"NAME": "db"}, using="default") == expected_strategy
+
+
+def test_invalid_strategy():
+    with pytest.raises(exceptions.ValueError, match="not a valid copy strategy"):
+        copy_cmd.copy(":target", strategy="invalid")
+
+
+@pytest.mark.parametrize(
+    "strategy, fallback_strategy",
+    [
+        ("clone", "file_copy"),
+        ("auto", "dump"),
+    ],
+)
+def test_clone_fallback(mocker, strategy, fallback_strategy):
+    mocker.patch.object(db, "size", autospec=True, return_value=1024**3 + 1)
+    mocker.patch.object(db, "rows", autospec=True, return_value=0)
+    mocker.patch.object(db, "server_version", autospec=True, return_value=180000)
+    mocker.patch.object(db, "drop", autospec=True)
+    psql = mocker.patch.object(db, "psql", autospec=True)
+    execute = mocker.patch.object(
+        db,
+        "execute",
+        autospec=True,
+        side_effect=django_db.OperationalError(
+            'could not clone file "base/1/1259" to "base/2/1259": Operation not supported'
+        ),
+    )
+    dump_copy = mocker.patch.object(copy_cmd, "_dump_copy", autospec=True)
+
+    copy_cmd.copy(":target", strategy=strategy)
+
+    assert (
+        "-c file_copy_method=clone" in execute.call_args.kwargs["database"]["OPTIONS"]["options"]
+    )
+    if fallback_strategy == "dump":
+        dump_copy.assert_called_once()
+        assert len(psql.call_args_list) == 1
+    else:
+        dump_copy.assert_not_called()
+        assert psql.call_args_list[1].args[0].endswith("STRATEGY FILE_COPY")
+
+
+def test_clone_error(mocker):
+    mocker.patch.object(db, "server_version", autospec=True, return_value=180000)
+    patched_drop = mocker.patch.object(db, "drop", autospec=True)
+    mocker.patch.object(db, "psql", autospec=True)
+    mocker.patch.object(
+        db,
+        "execute",
+        autospec=True,
+        side_effect=django_db.OperationalError(
+            'could not clone file "base/1/1259" to "base/2/1259": No space left on device'
+        ),
+    )
+    dump_copy = mocker.patch.object(copy_cmd, "_dump_copy", autospec=True)
+
+    with pytest.raises(django_db.OperationalError, match="No space left"):
+        copy_cmd.copy(":target", strategy="clone")
+
+    dump_copy.assert_not_called()
+    assert patched_drop.call_count == 1
+
+
+def test_clone_requires_postgres_18(mocker):
+    mocker.patch.object(db, "drop", autospec=True)
+    mocker.patch.object(db, "server_version", autospec=True, return_value=170000)
+
+    with pytest.raises(exceptions.RuntimeError, match="requires Postgres 18"):
+        copy_cmd.copy(":target", strategy="clone")
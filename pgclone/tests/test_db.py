@@ -1,6 +1,6 @@
 import pytest
 
-from pgclone import db
+from pgclone import db, exceptions
 
 
 @pytest.mark.parametrize(
@@ -23,3 +23,23 @@ def test_fmt_psql_sql(settings, lock_timeout, statement_timeout, sql, expected_s
     settings.PGCLONE_STATEMENT_TIMEOUT = statement_timeout
     settings.PGCLONE_LOCK_TIMEOUT = lock_timeout
     assert db._fmt_psql_sql(sql) == expected_sql
+
+
+def _fake_bin(tmpdir, name, script):
+    path = tmpdir.join(name)
+    path.write(f"#!/bin/sh\n{script}\n")
+    path.chmod(0o755)
+
+
+def test_transfer_failed_dump(mocker, tmpdir, monkeypatch):
+    """A failing pg_dump is raised while errors of pg_restore are ignored"""
+    mocker.patch.object(db, "url", autospec=True, return_value="postgresql://target")
+    monkeypatch.setenv("PATH", f"{tmpdir.strpath}:/usr/bin:/bin")
+    _fake_bin(tmpdir, "pg_restore", "cat > /dev/null; exit 1")
+
+    _fake_bin(tmpdir, "pg_dump", "echo data")
+    db.transfer("postgresql://source", {"NAME": "target"})
+
+    _fake_bin(tmpdir, "pg_dump", "exit 1")
+    with pytest.raises(exceptions.RuntimeError):
+        db.transfer("postgresql://source", {"NAME": "target"})
@@ -0,0 +1,83 @@
+import io
+import os
+
+import pytest
+
+from pgclone import download, exceptions, storage
+
+
+class FaultyStorage(storage.Local):
+    """A local storage stand-in that fails range requests of some chunks"""
+
+    def __init__(self, *args, faults, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The number of times downloading each start offset fails
+        self.faults = faults
+        self.requests = []
+
+    def download_range(self, file_path, start, end, dest_path):
+        self.requests.append(start)
+        if self.faults.get(start):
+            self.faults[start] -= 1
+            # Leave a partial chunk behind, as would a dropped connection
+            with open(dest_path, "wb") as f:
+                f.write(b"x")
+            raise exceptions.RuntimeError("Connection dropped")
+
+        super().download_range(file_path, start, end, dest_path)
+
+
+@pytest.fixture
+def dump_path(tmpdir, settings, mocker):
+    mocker.patch("time.sleep", autospec=True)
+    settings.PGCLONE_SPOOL_DIR = tmpdir.mkdir("spool").strpath
+    settings.PGCLONE_DOWNLOAD_CHUNK_SIZE = 10
+    settings.PGCLONE_DOWNLOAD_WORKERS = 2
+    settings.PGCLONE_DOWNLOAD_RETRIES = 1
+
+    path = tmpdir.join("storage", "dump.dump")
+    path.write_binary(bytes(range(35)), ensure=True)
+    return path.strpath
+
+
+def test_stream_retries(dump_path):
+    storage_client = FaultyStorage(os.path.dirname(dump_path), faults={10: 1})
+    out = io.BytesIO()
+
+    download.stream(storage_client, dump_path, out)
+    assert out.getvalue() == bytes(range(35))
+    assert sorted(storage_client.requests) == [0, 10, 10, 20, 30]
+    # The spool is removed once the download finishes
+    assert not os.path.exists(download._spool_dir(dump_path))
+
+
+def test_stream_resume(dump_path):
+    storage_client = FaultyStorage(os.path.dirname(dump_path), faults={20: 2})
+
+    with pytest.raises(exceptions.RuntimeError, match="bytes 20-29"):
+        download.stream(storage_client, dump_path, io.BytesIO())
+
+    # A rerun only downloads chunks that weren't finished
+    storage_client.requests.clear()
+    out = io.BytesIO()
+    download.stream(storage_client, dump_path, out)
+    assert out.getvalue() == bytes(range(35))
+    assert 0 not in storage_client.requests
+    assert 10 not in storage_client.requests
+
+
+def test_stream_changed_file(dump_path):
+    storage_client = FaultyStorage(os.path.dirname(dump_path), faults={20: 2})
+
+    with pytest.raises(exceptions.RuntimeError):
+        download.stream(storage_client, dump_path, io.BytesIO())
+
+    # Chunks of a file that changed are discarded
+    with open(dump_path, "ab") as f:
+        f.write(b"more")
+
+    storage_client.requests.clear()
+    out = io.BytesIO()
+    download.stream(storage_client, dump_path, out)
+    assert out.getvalue() == bytes(range(35)) + b"more"
+    assert 0 in storage_client.requests
@@ -0,0 +1,361 @@
+import pytest
+
+from pgclone import (
+    db,
+    dump_cmd,
+    exceptions,
+    exclusions,
+    fingerprint,
+    hooks,
+    ls_cmd,
+    manifest,
+    run,
+    storage,
+    tenants,
+)
+
+
+def test_wait_for_replica(mocker):
+    replica_lag = mocker.patch.object(dump_cmd, "_replica_lag", autospec=True)
+    sleep = mocker.patch("time.sleep", autospec=True)
+    source_db = {"NAME": "replica"}
+
+    replica_lag.side_effect = [1.0]
+    assert dump_cmd._wait_for_replica(source_db, max_lag=5, timeout=0) == 1.0
+    assert not sleep.called
+
+    # Lagging replicas are waited on until they catch up
+    replica_lag.side_effect = [10.0, 2.0]
+    assert dump_cmd._wait_for_replica(source_db, max_lag=5, timeout=60) == 2.0
+    assert sleep.call_count == 1
+
+    replica_lag.side_effect = [10.0]
+    with pytest.raises(exceptions.RuntimeError, match="10.0 seconds behind"):
+        dump_cmd._wait_for_replica(source_db, max_lag=5, timeout=0)
+
+
+def test_wait_for_replay(mocker):
+    query = mocker.patch.object(db, "query", autospec=True, side_effect=[[(False,)], [(True,)]])
+    sleep = mocker.patch("time.sleep", autospec=True)
+    source_db = {"NAME": "replica"}
+
+    dump_cmd._wait_for_replay(source_db, lsn="0/3000060", timeout=60)
+    assert sleep.call_count == 1
+    assert query.call_args.args[1] == ["0/3000060"]
+
+    query.side_effect = [[(False,)]]
+    with pytest.raises(exceptions.RuntimeError, match="did not replay"):
+        dump_cmd._wait_for_replay(source_db, lsn="0/3000060", timeout=0)
+
+
+def test_dump_from_replica(mocker, tmpdir):
+    """Replicas are dumped once they replay the changes of pre-dump hooks"""
+    mocker.patch.object(
+        db, "conf", autospec=True, side_effect=lambda using: {"NAME": using, "HOST": using}
+    )
+    calls = []
+    mocker.patch.object(
+        hooks, "execute", autospec=True, side_effect=lambda *args, **kwargs: calls.append("hooks")
+    )
+    mocker.patch.object(
+        fingerprint,
+        "_lsn",
+        autospec=True,
+        side_effect=lambda database: calls.append(("lsn", database["NAME"])) or "0/1",
+    )
+    wait_for_replay = mocker.patch.object(
+        dump_cmd,
+        "_wait_for_replay",
+        autospec=True,
+        side_effect=lambda source_db, **kwargs: calls.append(("replay", source_db["NAME"])),
+    )
+    mocker.patch.object(exclusions, "resolve", autospec=True, return_value=[])
+    mocker.patch.object(manifest, "collect", autospec=True, return_value={})
+    mocker.patch.object(manifest, "write", autospec=True)
+    mocker.patch.object(fingerprint, "collect", autospec=True, return_value={})
+    mocker.patch.object(dump_cmd, "_dumped_bytes", autospec=True, return_value=0)
+    mocker.patch.object(db, "rows", autospec=True, return_value=0)
+    mocker.patch.object(db, "url", autospec=True, side_effect=lambda database: database["NAME"])
+    shell = mocker.patch.object(run, "shell", autospec=True)
+
+    dump_cmd._dump(
+        exclude=[],
+        config="none",
+        pre_dump_hooks=["scrub"],
+        instance="dev",
+        database="default",
+        storage_location=tmpdir.strpath + "/",
+        dump_from="replica",
+    )
+    assert calls == ["hooks", ("lsn", "default"), ("replay", "replica")]
+    assert wait_for_replay.call_args.kwargs == {"lsn": "0/1", "timeout": 60}
+    assert " replica " in shell.call_args.args[0]
+
+    # Exported snapshots are only exported once the replica caught up
+    calls.clear()
+    dump_cmd._dump(
+        exclude=[],
+        config="none",
+        pre_dump_hooks=[],
+        instance="dev",
+        database="default",
+        storage_location=tmpdir.strpath + "/",
+        dump_from="replica",
+        snapshot="snapshot-1",
+    )
+    assert calls == ["hooks"]
+
+
+def test_dump_schemas_from_replica(mocker):
+    """The snapshot of the schemas is exported once the replica replays the hooks"""
+    mocker.patch.object(
+        db, "conf", autospec=True, side_effect=lambda using: {"NAME": using, "HOST": using}
+    )
+    calls = []
+    mocker.patch.object(
+        hooks, "execute", autospec=True, side_effect=lambda *args, **kwargs: calls.append("hooks")
+    )
+    mocker.patch.object(tenants, "resolve", autospec=True, return_value=["tenant_a"])
+    mocker.patch.object(fingerprint, "_lsn", autospec=True, return_value="0/1")
+    mocker.patch.object(
+        dump_cmd,
+        "_wait_for_replay",
+        autospec=True,
+        side_effect=lambda source_db, **kwargs: calls.append(("replay", source_db["NAME"])),
+    )
+    mocker.patch.object(
+        dump_cmd,
+        "_wait_for_replica",
+        autospec=True,
+        side_effect=lambda source_db, **kwargs: calls.append(("lag", source_db["NAME"])) or 0.0,
+    )
+    exported_snapshot = mocker.patch.object(tenants, "exported_snapshot", autospec=True)
+    exported_snapshot.return_value.__enter__.side_effect = lambda: calls.append("snapshot")
+    mocker.patch.object(exclusions, "resolve", autospec=True, return_value=[])
+    mocker.patch.object(manifest, "collect_schemas", autospec=True, return_value={"tenant_a": {}})
+    mocker.patch.object(
+        fingerprint, "collect_schemas", autospec=True, return_value={"tenant_a": {}}
+    )
+    dump = mocker.patch.object(
+        dump_cmd, "_dump", autospec=True, side_effect=lambda **kwargs: calls.append("dump")
+    )
+
+    dump_cmd.dump_schemas(["tenant_*"], pre_dump_hooks=["scrub"], dump_from="replica")
+    assert calls == ["hooks", ("replay", "replica"), ("lag", "replica"), "snapshot", "dump"]
+    assert exported_snapshot.call_args.args[0]["NAME"] == "replica"
+    assert dump.call_args.kwargs["dump_from"] == "replica"
+
+
+def test_unchanged_dump_key(mocker):
+    storage_client = mocker.Mock(storage_location=".pgclone/")
+    ls = mocker.patch.object(ls_cmd, "ls", autospec=True, return_value=[])
+    read = mocker.patch.object(manifest, "read", autospec=True, return_value={})
+    collect = mocker.patch.object(
+        fingerprint, "collect", autospec=True, return_value={"tuples": {}, "schema": "hash"}
+    )
+    dump_options = dump_cmd._dump_options(exclude=("auth.User",), scrub={})
+    assert dump_options == {"exclude": ["auth.User"], "scrub": {}}
+
+    def unchanged_dump_key(**kwargs):
+        return dump_cmd._unchanged_dump_key(
+            {},
+            prefix="instance/default/none/",
+            storage_client=storage_client,
+            dump_options=kwargs.pop("dump_options", dump_options),
+            **kwargs,
+        )
+
+    # Databases that were never dumped have changed
+    assert not unchanged_dump_key()
+    ls.assert_called_once_with(
+        dump_key="instance/default/none/", storage_location=".pgclone/", limit=1
+    )
+
+    # Dumps without a fingerprint are always redone
+    ls.return_value = ["instance/default/none/2024.dump"]
+    assert not unchanged_dump_key()
+
+    read.return_value = {
+        "options": dump_options,
+        "fingerprint": {"tuples": {}, "schema": "hash"},
+    }
+    assert unchanged_dump_key() == "instance/default/none/2024.dump"
+
+    # Dumps with other options, such as other exclusions, are redone
+    assert not unchanged_dump_key(dump_options=dump_cmd._dump_options(exclude=[], scrub={}))
+
+    collect.return_value = {"tuples": {}, "schema": "other"}
+    assert not unchanged_dump_key()
+
+    # Provided fingerprints, such as those of schemas, aren't collected again
+    collect.reset_mock()
+    assert unchanged_dump_key(current={"tuples": {}, "schema": "hash"})
+    collect.assert_not_called()
+
+
+def test_dump_prefix():
+    assert (
+        dump_cmd._dump_prefix(instance="my.host", database="default", config="none")
+        == "my_host/default/none/"
+    )
+
+
+def test_dump_physical_options():
+    with pytest.raises(exceptions.ValueError, match="Physical dumps"):
+        dump_cmd.dump(engine="physical", exclude=["auth.User"])
+
+    with pytest.raises(exceptions.ValueError, match="not a valid dump engine"):
+        dump_cmd.dump(engine="other")
+
+
+def test_dump_snapshot(mocker, tmpdir):
+    mocker.patch.object(
+        db,
+        "conf",
+        autospec=True,
+        return_value={"NAME": "db", "USER": "user", "PASSWORD": "", "HOST": "host", "PORT": 5432},
+    )
+    mocker.patch.object(exclusions, "resolve", autospec=True, return_value=[])
+    mocker.patch.object(manifest, "collect", autospec=True, return_value={})
+    mocker.patch.object(manifest, "write", autospec=True)
+    mocker.patch.object(fingerprint, "collect", autospec=True, return_value={})
+    mocker.patch.object(dump_cmd, "_dumped_bytes", autospec=True, return_value=0)
+    mocker.patch.object(db, "rows", autospec=True, return_value=0)
+    shell = mocker.patch.object(run, "shell", autospec=True)
+
+    dump_cmd._dump(
+        exclude=[],
+        config="none",
+        pre_dump_hooks=[],
+        instance="dev",
+        database="default",
+        storage_location=tmpdir.strpath + "/",
+        snapshot="00000003-00000002-1",
+    )
+    assert "--snapshot=00000003-00000002-1" in shell.call_args.args[0]
+
+    dump_cmd._dump(
+        exclude=[],
+        config="none",
+        pre_dump_hooks=[],
+        instance="dev",
+        database="default",
+        storage_location=tmpdir.strpath + "/",
+        schemas=["tenant_*"],
+        exclude_schemas=["tenant_test"],
+    )
+    assert "-n '\"tenant_\"*' -N '\"tenant_test\"'" in shell.call_args.args[0]
+    assert manifest.write.call_args.args[2]["schemas"] == ["tenant_*"]
+
+
+def test_dump_nice_s3(mocker):
+    """pg_dump and the S3 uploader are both niced"""
+    mocker.patch("shutil.which", autospec=True, return_value=None)
+    mocker.patch.object(storage, "validate_s3_support", autospec=True)
+    mocker.patch.object(storage.S3, "size", autospec=True, return_value=0)
+    mocker.patch.object(db, "conf", autospec=True, return_value={"NAME": "db"})
+    mocker.patch.object(db, "url", autospec=True, return_value="<URL>")
+    mocker.patch.object(exclusions, "resolve", autospec=True, return_value=[])
+    mocker.patch.object(manifest, "collect", autospec=True, return_value={})
+    mocker.patch.object(manifest, "write", autospec=True)
+    mocker.patch.object(fingerprint, "collect", autospec=True, return_value={})
+    mocker.patch.object(dump_cmd, "_dumped_bytes", autospec=True, return_value=0)
+    mocker.patch.object(dump_cmd, "_dump_key", autospec=True, return_value="dev/db/none/1.dump")
+    mocker.patch.object(db, "rows", autospec=True, return_value=0)
+    shell = mocker.patch.object(run, "shell", autospec=True)
+
+    dump_cmd._dump(
+        exclude=[],
+        config="none",
+        pre_dump_hooks=[],
+        instance="dev",
+        database="default",
+        storage_location="s3://bucket/",
+        nice=10,
+    )
+    assert shell.call_args.args[0] == (
+        "nice -n 10 pg_dump -Fc --no-acl --no-owner <URL> "
+        " | nice -n 10 aws s3 cp - s3://bucket/dev/db/none/1.dump"
+    )
+
+
+def test_dump_schemas(mocker):
+    mocker.patch.object(db, "conf", autospec=True, return_value={"NAME": "db"})
+    execute_hooks = mocker.patch.object(hooks, "execute", autospec=True)
+    resolve = mocker.patch.object(
+        tenants, "resolve", autospec=True, return_value=["tenant_a", "tenant_b"]
+    )
+    exported_snapshot = mocker.patch.object(tenants, "exported_snapshot", autospec=True)
+    exported_snapshot.return_value.__enter__.return_value = "snapshot-1"
+    resolve_exclusions = mocker.patch.object(
+        exclusions,
+        "resolve",
+        autospec=True,
+        return_value=[
+            {"schema": "tenant_a", "table": "events", "bytes": 1, "rule": "table:events"},
+            {"schema": "tenant_b", "table": "events", "bytes": 1, "rule": "table:events"},
+        ],
+    )
+    collect_manifests = mocker.patch.object(
+        manifest,
+        "collect_schemas",
+        autospec=True,
+        side_effect=lambda database, schemas, excluded_tables: {
+            schema: {"largest_tables": [schema]} for schema in schemas
+        },
+    )
+    mocker.patch.object(
+        fingerprint,
+        "collect_schemas",
+        autospec=True,
+        side_effect=lambda database, schemas: {schema: {"schema": schema} for schema in schemas},
+    )
+    dump = mocker.patch.object(
+        dump_cmd,
+        "_dump",
+        autospec=True,
+        side_effect=lambda **kwargs: f"dev/default/{kwargs['config']}/1.dump",
+    )
+
+    dump_keys = dump_cmd.dump_schemas(["tenant_*"], pre_dump_hooks=["hook"], jobs=2)
+    assert dump_keys == {
+        "tenant_a": "dev/default/none__tenant_a/1.dump",
+        "tenant_b": "dev/default/none__tenant_b/1.dump",
+    }
+    assert dump_keys["tenant_a"].operation.attributes["schema"] == "tenant_a"
+    assert resolve.call_args.args == (["tenant_*"], [])
+
+    # Hooks run once and every schema is dumped as of the same snapshot
+    assert execute_hooks.call_count == 1
+    assert sorted(call.kwargs["schemas"] for call in dump.call_args_list) == [
+        ["tenant_a"],
+        ["tenant_b"],
+    ]
+    assert {call.kwargs["snapshot"] for call in dump.call_args_list} == {"snapshot-1"}
+    assert {tuple(call.kwargs["pre_dump_hooks"]) for call in dump.call_args_list} == {()}
+
+    # The catalog is read once and every dump gets the part of its schema
+    assert resolve_exclusions.call_count == 1
+    assert collect_manifests.call_count == 1
+    tenant_b_call = next(
+        call for call in dump.call_args_list if call.kwargs["schemas"] == ["tenant_b"]
+    )
+    assert [entry["schema"] for entry in tenant_b_call.kwargs["excluded_tables"]] == ["tenant_b"]
+    assert tenant_b_call.kwargs["dump_manifest"] == {
+        "largest_tables": ["tenant_b"],
+        "fingerprint": {"schema": "tenant_b"},
+    }
+    assert tenant_b_call.kwargs["pre_hook_fingerprint"] is None
+
+    dump_cmd.dump_schemas(["tenant_*"], if_changed=True)
+    assert {
+        call.kwargs["pre_hook_fingerprint"]["schema"] for call in dump.call_args_list[-2:]
+    } == {"tenant_a", "tenant_b"}
+
+    dump.side_effect = exceptions.RuntimeError("failed")
+    with pytest.raises(exceptions.RuntimeError, match="tenant_a, tenant_b failed"):
+        dump_cmd.dump_schemas(["tenant_*"])
+
+    resolve.return_value = []
+    with pytest.raises(exceptions.RuntimeError, match="No schemas"):
+        dump_cmd.dump_schemas(["missing_*"])
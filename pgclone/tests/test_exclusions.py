@@ -0,0 +1,129 @@
+import datetime as dt
+
+import pytest
+
+from pgclone import exceptions, exclusions
+
+TABLES = [
+    ("audit", "log", 300, False),
+    ("public", "auth_group", 10, True),
+    ("public", "auth_user", 20, True),
+    ("public", "events_2024", 5000, True),
+    ("public", "legacy_import", 900, True),
+    ("tenant", "auth_user", 20, False),
+]
+
+
+@pytest.fixture(autouse=True)
+def tables(mocker):
+    mocker.patch.object(exclusions, "_tables", autospec=True, return_value=TABLES)
+
+
+def _excluded(rules, **kwargs):
+    return [
+        (entry["schema"], entry["table"], entry["rule"])
+        for entry in exclusions.resolve(rules, database={}, **kwargs)
+    ]
+
+
+def test_resolve():
+    assert _excluded([]) == []
+    # Models only match tables on the search path, like pg_dump
+    assert _excluded(["auth.User"]) == [("public", "auth_user", "auth.User")]
+    assert _excluded(["auth"]) == [
+        ("public", "auth_group", "auth"),
+        ("public", "auth_user", "auth"),
+    ]
+    assert _excluded(["table:events_*", "regex:audit\\.l.g"]) == [
+        ("audit", "log", "regex:audit\\.l.g"),
+        ("public", "events_2024", "table:events_*"),
+    ]
+    assert _excluded(["table:*.auth_user"]) == [
+        ("public", "auth_user", "table:*.auth_user"),
+        ("tenant", "auth_user", "table:*.auth_user"),
+    ]
+    assert _excluded(["auth.User"], larger_than=800) == [
+        ("public", "auth_user", "auth.User"),
+        ("public", "events_2024", "larger_than:800"),
+        ("public", "legacy_import", "larger_than:800"),
+    ]
+
+    with pytest.raises(exceptions.ValueError, match="not a model or app label"):
+        _excluded(["missing"])
+
+
+def test_pg_dump_args():
+    assert exclusions.pg_dump_args([]) == ""
+    excluded = [{"schema": "public", "table": "auth_user"}, {"schema": "a", "table": 'we"ird'}]
+    assert exclusions.pg_dump_args(excluded) == " ".join(
+        [
+            '--exclude-table-data=\'"public"."auth_user"\'',
+            '--exclude-table-data=\'"a"."we""ird"\'',
+        ]
+    )
+
+
+def _range(start, end):
+    return f"FOR VALUES FROM ({start}) TO ({end})"
+
+
+PARTITIONS = [
+    ("public", "events", 1, _range("'2024-01-01'", "'2024-02-01'"), "public", "events_2024_01", 1),
+    ("public", "events", 2, _range("'2024-02-01'", "'2024-03-01'"), "public", "events_2024_02", 2),
+    ("public", "events", 3, _range("'2024-03-01'", "'2024-04-01'"), "archive", "events_03_a", 3),
+    ("public", "events", 3, _range("'2024-03-01'", "'2024-04-01'"), "archive", "events_03_b", 3),
+    ("public", "events", 4, "DEFAULT", "public", "events_default", 4),
+    ("public", "metrics", 5, _range("MINVALUE", "100"), "public", "metrics_low", 5),
+    ("public", "metrics", 6, _range("100", "20000"), "public", "metrics_high", 6),
+    ("public", "metrics", 7, _range("20000", "MAXVALUE"), "public", "metrics_max", 7),
+]
+
+
+def test_resolve_keep_partitions(mocker):
+    mocker.patch.object(exclusions, "_partitions", autospec=True, return_value=PARTITIONS)
+    exclusions._tables.return_value = TABLES + [("public", "events_2024_01", 1, True)]
+
+    assert _excluded([], keep_partitions=2) == [
+        ("public", "events_2024_01", "keep_partitions:2"),
+        ("public", "metrics_low", "keep_partitions:2"),
+    ]
+    # Default partitions are always kept, and sub-partitioned partitions exclude their leaves
+    assert _excluded(["table:events_2024_01"], keep_partitions={"events": 0}) == [
+        ("public", "events_2024_01", "table:events_2024_01"),
+        ("public", "events_2024_02", "keep_partitions:0"),
+        ("archive", "events_03_a", "keep_partitions:0"),
+        ("archive", "events_03_b", "keep_partitions:0"),
+    ]
+    assert _excluded([], keep_partitions={"public.events": "2024-02-15"}) == [
+        ("public", "events_2024_01", "keep_partitions:2024-02-15"),
+    ]
+
+    # Dates for every table skip tables that aren't partitioned by time
+    success_msg = mocker.patch.object(exclusions.logging, "success_msg", autospec=True)
+    assert _excluded([], keep_partitions="2024-02-15") == [
+        ("public", "events_2024_01", "keep_partitions:2024-02-15"),
+    ]
+    assert '"public.metrics"' in success_msg.call_args.args[0]
+
+    with pytest.raises(exceptions.ValueError, match="can't be kept since"):
+        _excluded([], keep_partitions={"metrics": "2024-02-15"})
+
+    # Rules of unknown models or tables aren't ignored
+    with pytest.raises(exceptions.ValueError, match='"app.Event" is not a partitioned table'):
+        _excluded([], keep_partitions={"app.Event": 1})
+
+    for rule in (-1, True, "last month"):
+        with pytest.raises(exceptions.ValueError, match="not a number of partitions or a date"):
+            _excluded([], keep_partitions=rule)
+
+
+def test_upper_bound():
+    assert exclusions._upper_bound("DEFAULT") is None
+    assert exclusions._upper_bound("FOR VALUES FROM (MINVALUE, 'a') TO (10, 'it''s')") == (
+        (1, 10.0),
+        (1, "it's"),
+    )
+    assert exclusions._upper_bound(
+        "FOR VALUES FROM ('2024-01-01 00:00:00+00') TO ('2024-02-01 00:00:00+00')"
+    ) == ((1, dt.datetime(2024, 2, 1)),)
+    assert exclusions._upper_bound("FOR VALUES FROM (0) TO (MAXVALUE)") == ((2, 0),)
@@ -0,0 +1,51 @@
+from pgclone import db, fingerprint
+
+
+def test_collect(mocker):
+    mocker.patch.object(
+        db,
+        "query",
+        autospec=True,
+        side_effect=[
+            [("0/16B3748",)],
+            [(10, 2, 1)],
+            [("public", "auth_user", "r", 16384, "id integer")],
+            [("public", "auth_user_id_seq", 10)],
+        ],
+    )
+
+    collected = fingerprint.collect({"NAME": "default"})
+    assert collected["lsn"] == "0/16B3748"
+    assert collected["tuples"] == {"inserted": 10, "updated": 2, "deleted": 1}
+    assert len(collected["schema"]) == 64
+
+
+def test_collect_schemas(mocker):
+    query = mocker.patch.object(
+        db,
+        "query",
+        autospec=True,
+        side_effect=[
+            [("0/16B3748",)],
+            [("tenant_a", 10, 2, 1)],
+            [("tenant_a", "orders", "r", 16384, "id integer")],
+            [("tenant_b", "orders_id_seq", 10)],
+        ],
+    )
+
+    collected = fingerprint.collect_schemas({"NAME": "default"}, ["tenant_a", "tenant_b"])
+    assert query.call_count == 4
+    assert collected["tenant_a"]["tuples"] == {"inserted": 10, "updated": 2, "deleted": 1}
+    assert collected["tenant_b"]["tuples"] == {"inserted": 0, "updated": 0, "deleted": 0}
+    assert collected["tenant_a"]["schema"] != collected["tenant_b"]["schema"]
+
+
+def test_changed():
+    previous = {"lsn": "0/1", "tuples": {"inserted": 1}, "schema": "hash"}
+
+    assert fingerprint.changed(None, previous)
+    assert fingerprint.changed({}, previous)
+    # The WAL location is shared by every database of the server, so it's ignored
+    assert not fingerprint.changed(previous, {**previous, "lsn": "0/2"})
+    assert fingerprint.changed(previous, {**previous, "tuples": {"inserted": 2}})
+    assert fingerprint.changed(previous, {**previous, "schema": "other"})
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from pgclone import exceptions, hooks, run
+
+
+def test_ordered():
+    parsed = hooks._parse(
+        [
+            {"hook": "scrub_users", "after": ["migrate"]},
+            "migrate",
+            {"hook": "sql:scrub.sql", "after": ["scrub_users", "migrate"]},
+        ]
+    )
+    assert [hook["hook"] for hook in hooks._ordered(parsed)] == [
+        "migrate",
+        "scrub_users",
+        "sql:scrub.sql",
+    ]
+
+    with pytest.raises(exceptions.ValueError, match="circular"):
+        hooks._ordered(
+            hooks._parse([{"hook": "a", "after": ["b"]}, {"hook": "b", "after": ["a"]}])
+        )
+
+    with pytest.raises(exceptions.ValueError, match="unknown hook"):
+        hooks._parse([{"hook": "a", "after": ["b"]}])
+
+    with pytest.raises(exceptions.ValueError, match="unique"):
+        hooks._parse(["a", "a"])
+
+    with pytest.raises(exceptions.ValueError, match='"hook" key'):
+        hooks._parse([{"after": ["a"]}])
+
+
+def test_execute_in_process(mocker):
+    mocker.patch("pgclone.db.route", autospec=True)
+    management = mocker.patch.object(run, "management", autospec=True)
+    run_sql = mocker.patch.object(hooks, "_run_sql", autospec=True)
+
+    hooks.execute(
+        [{"hook": "sql:scrub.sql", "after": ["migrate"]}, "migrate"],
+        kind="pre_swap",
+        database={"NAME": "temp"},
+        using="default",
+    )
+    management.assert_called_once_with("migrate")
+    run_sql.assert_called_once_with("sql:scrub.sql", database={"NAME": "temp"})
+
+
+def test_execute_parallel(settings, mocker):
+    settings.PGCLONE_HOOK_WORKERS = 2
+    started = []
+    scrub_started = threading.Barrier(2, timeout=5)
+
+    def run_subprocess(hook, *, database, using):
+        started.append(hook)
+        if hook.startswith("scrub"):
+            # Both scrubbing hooks must run at the same time
+            scrub_started.wait()
+        elif hook == "fail":
+            raise exceptions.RuntimeError("Hook failed")
+
+    mocker.patch.object(hooks, "_run_subprocess", autospec=True, side_effect=run_subprocess)
+
+    hooks.execute(
+        [
+            "migrate",
+            {"hook": "scrub_users", "after": ["migrate"]},
+            {"hook": "scrub_orders", "after": ["migrate"]},
+        ],
+        kind="pre_swap",
+        database={"NAME": "temp"},
+        using="default",
+    )
+    assert started[0] == "migrate"
+    assert set(started[1:]) == {"scrub_users", "scrub_orders"}
+
+    # Hooks that depend on failed hooks never run
+    started.clear()
+    with pytest.raises(exceptions.RuntimeError, match="Hook failed"):
+        hooks.execute(
+            ["fail", {"hook": "after_fail", "after": ["fail"]}],
+            kind="pre_swap",
+            database={"NAME": "temp"},
+            using="default",
+        )
+    assert started == ["fail"]
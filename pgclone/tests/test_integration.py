@@ -5,6 +5,8 @@ from django.contrib.auth.models import User
 from django.core.management import call_command
 from django.db import connection
 
+from pgclone import scrub
+
 
 @pytest.fixture(autouse=True)
 def patch_gethostname(mocker):
@@ -187,3 +189,29 @@ def test_reversible_dump_ls_restore(tmpdir, capsys, settings):
     call_command("pgclone", "restore", ":post")
     connection.connect()
     assert User.objects.count() == 1
+
+
+@freezegun.freeze_time("2020-07-01")
+@pytest.mark.django_db(transaction=True)
+def test_scrubbed_dump_restore(tmpdir, settings):
+    """Scrubbed columns are transformed in the dump and restored that way"""
+    settings.PGCLONE_STORAGE_LOCATION = tmpdir.strpath
+    settings.PGCLONE_SCRUB = {
+        "auth.User": {"email": "email", "first_name": "hash", "last_name": "empty"}
+    }
+    ddf.G("auth.User", username="jane", email="jane@example.com", first_name="Jane", last_name="D")
+    ddf.G("auth.User", username="john", email="", first_name="John", last_name="D")
+
+    call_command("pgclone", "dump")
+    User.objects.update(email="changed@example.com")
+
+    call_command("pgclone", "restore", "dev/default/none/")
+    connection.connect()
+    assert list(
+        User.objects.order_by("username").values_list(
+            "username", "email", "first_name", "last_name"
+        )
+    ) == [
+        ("jane", scrub._BUILTINS["email"]("jane@example.com"), scrub._hash("Jane"), ""),
+        ("john", scrub._BUILTINS["email"](""), scrub._hash("John"), ""),
+    ]
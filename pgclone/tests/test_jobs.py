@@ -0,0 +1,91 @@
+import pytest
+
+from pgclone import exceptions, jobs, spans
+
+
+@pytest.fixture(autouse=True)
+def job_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "pgclone": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+    yield
+    if jobs._executor:
+        jobs._executor.shutdown(wait=True)
+        jobs._executor = None
+
+
+def _wait():
+    jobs._executor.shutdown(wait=True)
+    jobs._executor = None
+
+
+def test_submit(mocker):
+    operation = spans.Operation("restore")
+    operation.spans.append(spans.Span("pg_restore"))
+    restore = mocker.patch(
+        "pgclone.restore_cmd.restore",
+        autospec=True,
+        return_value=spans.Result("key", operation),
+    )
+
+    job_id = jobs.submit("prefix", database="default")
+    _wait()
+
+    restore.assert_called_once_with(dump_key="prefix", database="default")
+    job = jobs.get(job_id)
+    assert job["status"] == "succeeded"
+    assert job["dump_key"] == "key"
+    assert list(job["timings"]) == ["pg_restore"]
+    assert [job["id"] for job in jobs.ls()] == [job_id]
+
+    with pytest.raises(exceptions.KeyError):
+        jobs.get("missing")
+
+
+def test_cancel(mocker):
+    def restore(**kwargs):
+        jobs.cancel(jobs._current.job_id)
+        jobs.checkpoint("swapping")
+
+    mocker.patch("pgclone.restore_cmd.restore", autospec=True, side_effect=restore)
+
+    job_id = jobs.submit("prefix")
+    _wait()
+
+    job = jobs.get(job_id)
+    assert job["status"] == "cancelled"
+    assert job["phase"] == "swapping"
+
+    # Checkpoints are a no-op outside of jobs
+    jobs.checkpoint("restoring")
+
+    # Queued jobs that are cancelled never run
+    mocker.stopall()
+    restore = mocker.patch("pgclone.restore_cmd.restore", autospec=True)
+    jobs._update("queued", status="queued")
+    jobs.cancel("queued")
+    jobs._run("queued", {})
+    assert jobs.get("queued")["status"] == "cancelled"
+    assert not restore.called
+
+
+def test_failed(mocker):
+    mocker.patch("pgclone.restore_cmd.restore", autospec=True, side_effect=RuntimeError("err"))
+
+    job_id = jobs.submit("prefix")
+    _wait()
+
+    assert jobs.get(job_id)["status"] == "failed"
+    assert jobs.get(job_id)["error"] == "err"
+
+
+def test_ls(mocker):
+    mocker.patch("pgclone.restore_cmd.restore", autospec=True)
+    mocker.patch.object(jobs, "_MAX_JOBS", 2)
+
+    job_ids = [jobs.submit("prefix") for _ in range(3)]
+    _wait()
+
+    # Only the most recent jobs are listed, and no job ID is lost to another submission
+    assert [job["id"] for job in jobs.ls()] == job_ids[:0:-1]
@@ -0,0 +1,19 @@
+import datetime as dt
+
+from pgclone import keys
+
+
+def test_parse():
+    dump_key = keys.parse("dev/default/none/2020-07-01-10-20-30-000040.dump")
+    assert dump_key.is_valid
+    assert str(dump_key) == "dev/default/none/2020-07-01-10-20-30-000040.dump"
+    assert dump_key.group == ("dev", "default", "none")
+    assert dump_key.timestamp == dt.datetime(2020, 7, 1, 10, 20, 30, 40)
+
+    invalid_key = keys.parse("dev/invalid.dump")
+    assert not invalid_key.is_valid
+    assert invalid_key.instance is None
+    assert repr(invalid_key) == "DumpKey('dev/invalid.dump')"
+    assert dump_key < invalid_key
+    assert invalid_key == keys.parse("dev/invalid.dump")
+    assert len({invalid_key, keys.parse("dev/invalid.dump")}) == 1
@@ -0,0 +1,71 @@
+import datetime as dt
+
+import pytest
+
+from pgclone import exceptions, ls_cmd
+
+
+@pytest.fixture
+def storage_location(tmpdir, settings):
+    for path in [
+        "dev/default/none/2020-07-01-00-00-00-000000.dump",
+        "dev/default/none/2020-07-03-00-00-00-000000.dump",
+        "dev/default/other/2020-07-02-00-00-00-000000.dump",
+        "prod/default/none/2020-07-04-00-00-00-000000.dump",
+        "prod/default/none/2020-07-04-00-00-00-000000.json",
+        "prod/invalid.dump",
+    ]:
+        tmpdir.join(path).ensure()
+
+    settings.PGCLONE_STORAGE_LOCATION = tmpdir.strpath
+    return tmpdir.strpath
+
+
+def test_ls_query(storage_location, settings):
+    assert ls_cmd.ls() == [
+        "prod/default/none/2020-07-04-00-00-00-000000.dump",
+        "dev/default/other/2020-07-02-00-00-00-000000.dump",
+        "dev/default/none/2020-07-03-00-00-00-000000.dump",
+        "dev/default/none/2020-07-01-00-00-00-000000.dump",
+    ]
+    assert ls_cmd.ls("dev", limit=1) == ["dev/default/other/2020-07-02-00-00-00-000000.dump"]
+    assert ls_cmd.ls(since=dt.datetime(2020, 7, 2), until=dt.datetime(2020, 7, 3)) == [
+        "dev/default/other/2020-07-02-00-00-00-000000.dump",
+        "dev/default/none/2020-07-03-00-00-00-000000.dump",
+    ]
+    # Times with a time zone are compared in UTC
+    assert ls_cmd.ls(
+        since=dt.datetime.fromisoformat("2020-07-03T02:00:00+02:00"),
+        until=dt.datetime.fromisoformat("2020-07-02T20:00:00-04:00"),
+    ) == ["dev/default/none/2020-07-03-00-00-00-000000.dump"]
+    assert ls_cmd.ls(latest_per_group=True) == [
+        "prod/default/none/2020-07-04-00-00-00-000000.dump",
+        "dev/default/other/2020-07-02-00-00-00-000000.dump",
+        "dev/default/none/2020-07-03-00-00-00-000000.dump",
+    ]
+    assert ls_cmd.ls(instances=True) == ["dev", "prod"]
+    assert ls_cmd.ls(configs=True, limit=1) == ["none"]
+
+    settings.PGCLONE_VALIDATE_DUMP_KEYS = False
+    assert ls_cmd.ls("prod") == [
+        "prod/invalid.dump",
+        "prod/default/none/2020-07-04-00-00-00-000000.dump",
+    ]
+
+    with pytest.raises(exceptions.ValueError, match="non-negative"):
+        ls_cmd.ls(limit=-1)
+
+
+def test_ls_query_unsorted_storage(storage_location, mocker):
+    """Verify queries on storage backends that don't list keys in order"""
+    mocker.patch("pgclone.storage.Local.reverse_sorted", False)
+
+    assert ls_cmd.ls("dev", limit=2) == [
+        "dev/default/other/2020-07-02-00-00-00-000000.dump",
+        "dev/default/none/2020-07-03-00-00-00-000000.dump",
+    ]
+    assert ls_cmd.ls(latest_per_group=True) == [
+        "prod/default/none/2020-07-04-00-00-00-000000.dump",
+        "dev/default/other/2020-07-02-00-00-00-000000.dump",
+        "dev/default/none/2020-07-03-00-00-00-000000.dump",
+    ]
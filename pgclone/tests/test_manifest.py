@@ -0,0 +1,50 @@
+from pgclone import db, manifest, storage
+
+
+def test_key():
+    assert manifest.key("dev/default/none/2020-07-01.dump") == "dev/default/none/2020-07-01.json"
+    assert manifest.is_manifest_key("dev/default/none/2020-07-01.json")
+    assert not manifest.is_manifest_key("dev/default/none/2020-07-01.dump")
+
+
+def test_read_write(tmpdir):
+    storage_client = storage.Local(tmpdir.strpath)
+    dump_key = "dev/default/none/2020-07-01.dump"
+
+    assert manifest.read(storage_client, dump_key) == {}
+
+    manifest.write(storage_client, dump_key, {"largest_tables": [{"name": "public.table"}]})
+    assert tmpdir.join("dev/default/none/2020-07-01.json").check()
+    assert manifest.read(storage_client, dump_key) == {
+        "largest_tables": [{"name": "public.table"}]
+    }
+
+
+def test_collect_schemas(mocker):
+    mocker.patch.object(
+        db,
+        "query",
+        autospec=True,
+        return_value=[
+            ("tenant_a", "tenant_a.orders", 100, 1),
+            ("tenant_a", "tenant_a.events", 10, 50),
+            ("tenant_b", "tenant_b.orders", 20, 0),
+        ],
+    )
+    excluded_tables = [{"schema": "tenant_b", "table": "logs", "bytes": 5, "rule": "table:logs"}]
+
+    manifests = manifest.collect_schemas(
+        {"NAME": "default"}, ["tenant_a", "tenant_b"], excluded_tables=excluded_tables
+    )
+    assert [table["name"] for table in manifests["tenant_a"]["largest_tables"]] == [
+        "tenant_a.orders",
+        "tenant_a.events",
+    ]
+    assert [table["name"] for table in manifests["tenant_a"]["most_read_tables"]] == [
+        "tenant_a.events",
+        "tenant_a.orders",
+    ]
+    assert manifests["tenant_a"]["excluded_tables"] == []
+    assert manifests["tenant_b"]["excluded_tables"] == [
+        {"name": "tenant_b.logs", "bytes": 5, "rule": "table:logs"}
+    ]
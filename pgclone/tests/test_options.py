@@ -14,6 +14,13 @@ def test_defaults():
     assert opts.pre_dump_hooks == []
     assert opts.pre_swap_hooks == ["migrate"]
     assert opts.exclude == []
+    assert opts.keep_partitions is None
+    assert opts.schemas == [] and opts.exclude_schemas == []
+    assert opts.scrub == {}
+    assert opts.jobs == 1
+    assert opts.source is None
+    assert opts.copy_strategy == "template"
+    assert opts.analyze is False
     assert opts.config == "none"
 
 
@@ -0,0 +1,217 @@
+import io
+import os
+import shutil
+import socket
+import subprocess
+import tarfile
+
+import psycopg2
+import pytest
+
+from pgclone import db, exceptions, hooks, physical, run, storage
+
+
+def _write_backup(path, version):
+    with tarfile.open(path, mode="w:gz") as tar:
+        for name, contents in [("PG_VERSION", b"16\n"), ("backup_label", version)]:
+            member = tarfile.TarInfo(name)
+            member.size = len(contents)
+            tar.addfile(member, io.BytesIO(contents))
+
+
+def test_backup(mocker):
+    patched_shell = mocker.patch.object(run, "shell", autospec=True)
+    source_db = {"NAME": "app", "USER": "user", "PASSWORD": "", "HOST": "host", "PORT": 5432}
+
+    physical.backup(
+        source_db, storage_client=storage.client("/backups/"), file_path="/backups/a.dump"
+    )
+    assert patched_shell.call_args.args[0] == (
+        "pg_basebackup -d postgresql://user:@host:5432/app -D - -Ft -z -X fetch -c fast"
+        " > /backups/a.dump"
+    )
+
+
+def test_restore(mocker, settings, tmpdir):
+    settings.PGCLONE_PHYSICAL_DIR = tmpdir.join("clusters").strpath
+    mocker.patch.object(
+        db, "conf", autospec=True, return_value={"NAME": "app", "HOST": "localhost", "PORT": 6543}
+    )
+    start = mocker.patch.object(physical, "_start", autospec=True)
+    mocker.patch.object(physical, "_stop", autospec=True)
+    execute = mocker.patch.object(hooks, "execute", autospec=True)
+    storage_client = storage.client(tmpdir.strpath)
+    data_dir = tmpdir.join("clusters", "app")
+
+    _write_backup(tmpdir.join("first.dump").strpath, b"first")
+    physical.restore(
+        "first.dump",
+        database="default",
+        storage_client=storage_client,
+        file_path=tmpdir.join("first.dump").strpath,
+        pre_swap_hooks=["migrate"],
+        reversible=True,
+    )
+    assert data_dir.join("backup_label").read() == "first"
+    assert "port = 6543" in data_dir.join("postgresql.auto.conf").read()
+    assert "unix_socket_directories = '.'" in data_dir.join("postgresql.auto.conf").read()
+    assert data_dir.join("pg_hba.conf").exists()
+    assert [call.kwargs for call in start.call_args_list] == [{"port": 6544}, {}]
+    assert execute.call_args.kwargs["database"]["PORT"] == 6544
+    assert not tmpdir.join("clusters", "app__temp").exists()
+
+    # Reversible restores keep the previous cluster
+    settings.PGCLONE_PHYSICAL_TEMP_PORT = 7000
+    _write_backup(tmpdir.join("second.dump").strpath, b"second")
+    physical.restore(
+        "second.dump",
+        database="default",
+        storage_client=storage_client,
+        file_path=tmpdir.join("second.dump").strpath,
+        pre_swap_hooks=[],
+        reversible=True,
+    )
+    assert data_dir.join("backup_label").read() == "second"
+    assert tmpdir.join("clusters", "app__pre", "backup_label").read() == "first"
+    assert start.call_args_list[-2].kwargs == {"port": 7000}
+
+    physical.restore(
+        "first.dump",
+        database="default",
+        storage_client=storage_client,
+        file_path=tmpdir.join("first.dump").strpath,
+        pre_swap_hooks=[],
+        reversible=False,
+    )
+    assert data_dir.join("backup_label").read() == "first"
+    assert not tmpdir.join("clusters", "app__pre").exists()
+    assert not tmpdir.join("clusters", "app__swap").exists()
+
+
+def test_restore_pre(mocker, settings, tmpdir):
+    settings.PGCLONE_PHYSICAL_DIR = tmpdir.join("clusters").strpath
+    mocker.patch.object(
+        db, "conf", autospec=True, return_value={"NAME": "app", "HOST": "localhost", "PORT": 6543}
+    )
+    start = mocker.patch.object(physical, "_start", autospec=True)
+    mocker.patch.object(physical, "_stop", autospec=True)
+    execute = mocker.patch.object(hooks, "execute", autospec=True)
+    data_dir = tmpdir.join("clusters", "app")
+
+    assert not physical.has_pre("default")
+    with pytest.raises(exceptions.RuntimeError, match="No previous cluster"):
+        physical.restore_pre(database="default", pre_swap_hooks=[])
+
+    data_dir.ensure("backup_label").write("second")
+    tmpdir.join("clusters", "app__pre").ensure("backup_label").write("first")
+    assert physical.has_pre("default")
+
+    assert physical.restore_pre(database="default", pre_swap_hooks=["migrate"]) == ":pre"
+    assert data_dir.join("backup_label").read() == "first"
+    assert [call.kwargs for call in start.call_args_list] == [{"port": 6544}, {}]
+    assert execute.call_args.kwargs["database"]["PORT"] == 6544
+    # The previous cluster is kept so that it can be restored again
+    assert tmpdir.join("clusters", "app__pre", "backup_label").read() == "first"
+    assert not tmpdir.join("clusters", "app__swap").exists()
+
+
+def test_restore_without_physical_dir():
+    with pytest.raises(exceptions.RuntimeError, match="PGCLONE_PHYSICAL_DIR"):
+        physical._data_dirs("default")
+
+
+def test_start_stop(mocker, tmpdir):
+    patched_shell = mocker.patch.object(run, "shell", autospec=True)
+    data_dir = tmpdir.join("app")
+    data_dir.ensure(dir=True)
+
+    physical._start(data_dir.strpath, port=6544)
+    assert patched_shell.call_args.args[0] == (
+        f"pg_ctl -D {data_dir} -l {data_dir.join('pgclone.log')} -o '-p 6544' -w start"
+    )
+
+    # Stopped clusters aren't stopped again
+    patched_shell.reset_mock()
+    physical._stop(data_dir.strpath)
+    assert not patched_shell.called
+
+    data_dir.join("postmaster.pid").write("")
+    physical._stop(data_dir.strpath)
+    assert patched_shell.call_args.args[0] == f"pg_ctl -D {data_dir} -m fast -w stop"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.skipif(
+    not all(shutil.which(binary) for binary in ("initdb", "pg_ctl", "pg_basebackup"))
+    or os.geteuid() == 0,
+    reason="Requires the Postgres server binaries and a user other than root.",
+)
+def test_backup_and_restore_cluster(mocker, settings, tmpdir):
+    """Backs up a real cluster and restores it to the cluster of another alias"""
+    source_dir = tmpdir.join("source").strpath
+    source_db = {
+        "NAME": "postgres",
+        "USER": "postgres",
+        "PASSWORD": "",
+        "HOST": "localhost",
+        "PORT": _free_port(),
+    }
+    restore_db = dict(source_db, PORT=_free_port())
+    settings.PGCLONE_PHYSICAL_DIR = tmpdir.join("clusters").strpath
+    settings.PGCLONE_PHYSICAL_TEMP_PORT = _free_port()
+    mocker.patch.object(db, "conf", autospec=True, return_value=restore_db)
+    storage_client = storage.client(tmpdir.strpath)
+    file_path = tmpdir.join("cluster.dump").strpath
+
+    def query(sql, database):
+        connection = psycopg2.connect(
+            dbname=database["NAME"],
+            user=database["USER"],
+            host=database["HOST"],
+            port=database["PORT"],
+        )
+        connection.autocommit = True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+                return cursor.fetchall() if cursor.description else None
+        finally:
+            connection.close()
+
+    subprocess.run(
+        ["initdb", "-D", source_dir, "-U", "postgres", "--auth=trust"],
+        check=True,
+        capture_output=True,
+    )
+    with open(os.path.join(source_dir, "postgresql.auto.conf"), "a") as conf_f:
+        conf_f.write(f"unix_socket_directories = '{source_dir}'\n")
+
+    physical._start(source_dir, port=source_db["PORT"])
+    data_dir = tmpdir.join("clusters", "postgres").strpath
+    try:
+        query("CREATE TABLE restored (id integer); INSERT INTO restored VALUES (1)", source_db)
+        physical.backup(source_db, storage_client=storage_client, file_path=file_path)
+
+        for _ in range(2):
+            physical.restore(
+                "cluster.dump",
+                database="default",
+                storage_client=storage_client,
+                file_path=file_path,
+                pre_swap_hooks=[],
+                reversible=True,
+            )
+            assert query("SELECT id FROM restored", restore_db) == [(1,)]
+
+        query("INSERT INTO restored VALUES (2)", restore_db)
+        physical.restore_pre(database="default", pre_swap_hooks=[])
+        assert query("SELECT id FROM restored", restore_db) == [(1,)]
+    finally:
+        physical._stop(data_dir)
+        physical._stop(data_dir + "__temp")
+        physical._stop(source_dir)
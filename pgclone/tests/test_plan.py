@@ -0,0 +1,41 @@
+import pytest
+
+from pgclone import exceptions, plan
+
+
+@pytest.fixture
+def restore_stats(tmpdir, settings, mocker):
+    settings.PGCLONE_STORAGE_LOCATION = tmpdir.join("storage").strpath
+    settings.PGCLONE_STATS_FILE = tmpdir.join("stats.json").strpath
+    tmpdir.join("storage/dev/default/none/2020-07-01-00-00-00-000000.dump").write(
+        "x" * 100, ensure=True
+    )
+    mocker.patch("pgclone.plan._free_disk_bytes", autospec=True, return_value=1000)
+
+
+def test_restore_plan(restore_stats):
+    assert plan.restore("dev") == {
+        "dump_key": "dev/default/none/2020-07-01-00-00-00-000000.dump",
+        "archive_bytes": 100,
+        "restored_bytes": None,
+        "required_disk_bytes": None,
+        "free_disk_bytes": 1000,
+        "enough_disk": None,
+        "seconds": None,
+    }
+
+    with pytest.raises(exceptions.ValueError, match="Must provide a dump key"):
+        plan.restore()
+
+
+def test_restore_plan_with_history(restore_stats):
+    plan.stats.record("restore", db_bytes=500, archive_bytes=100, seconds=5)
+
+    results = plan.restore("dev", reversible=True)
+    assert results["restored_bytes"] == 500
+    assert results["required_disk_bytes"] == 1000
+    assert results["enough_disk"] is True
+    assert results["seconds"] == 5
+
+    plan.stats.record("restore", db_bytes=600, archive_bytes=100, seconds=5)
+    assert plan.restore("dev", reversible=True)["enough_disk"] is False
@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+from pgclone import exceptions, prewarm
+
+
+def test_tables(mocker):
+    dump_manifest = {
+        "largest_tables": [{"name": "public.a"}, {"name": "public.b"}],
+        "most_read_tables": [{"name": "public.b"}, {"name": "public.c"}],
+    }
+    largest_tables = mocker.patch.object(
+        prewarm, "_largest_tables", autospec=True, return_value=["public.d"]
+    )
+
+    assert prewarm.tables(
+        ["auth.User", "other", "largest:1", "most_read:2"], manifest=dump_manifest, database={}
+    ) == ["auth_user", "other", "public.a", "public.b", "public.c"]
+    assert not largest_tables.called
+
+    # Without a manifest, the largest tables are read from the restored database
+    assert prewarm.tables(["largest:1", "most_read:1"], manifest={}, database={}) == ["public.d"]
+
+    with pytest.raises(exceptions.ValueError, match="Invalid prewarm"):
+        prewarm.tables(["largest:many"], manifest={}, database={})
+
+
+def test_prewarm_table_out_of_time():
+    assert prewarm._prewarm_table("table", database={}, deadline=time.time() - 1) == "out of time"
+
+
+def test_run_without_extension(mocker):
+    mocker.patch.object(prewarm, "tables", autospec=True, return_value=["public.a"])
+    patched_query = mocker.patch("pgclone.db.query", autospec=True, return_value=[])
+    patched_prewarm_table = mocker.patch.object(prewarm, "_prewarm_table", autospec=True)
+
+    prewarm.run(["public.a"], manifest={}, database={}, num_jobs=1, timeout=10)
+
+    assert "CREATE EXTENSION" not in str(patched_query.call_args_list)
+    assert not patched_prewarm_table.called
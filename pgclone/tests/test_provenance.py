@@ -0,0 +1,112 @@
+import json
+
+from django.core.management import call_command
+
+from pgclone import db, logging, ls_cmd, provenance
+
+
+def test_hooks_hash(tmpdir):
+    sql_hook = tmpdir.join("hook.sql")
+    sql_hook.write("UPDATE users SET email = NULL")
+
+    assert provenance.hooks_hash([]) == provenance.hooks_hash([])
+    assert provenance.hooks_hash(["migrate"]) != provenance.hooks_hash([])
+
+    # Changing the contents of SQL hooks changes the hash
+    hooks_hash = provenance.hooks_hash([f"sql:{sql_hook}"])
+    sql_hook.write("UPDATE users SET email = ''")
+    assert provenance.hooks_hash([f"sql:{sql_hook}"]) != hooks_hash
+
+
+def test_stamp_and_read(mocker):
+    comments = {}
+    mocker.patch.object(
+        db,
+        "comment",
+        autospec=True,
+        side_effect=lambda database, using: comments.get(database["NAME"]),
+    )
+    mocker.patch.object(
+        db,
+        "set_comment",
+        autospec=True,
+        side_effect=lambda database, comment, using: comments.update({database["NAME"]: comment}),
+    )
+    restore_db = {"NAME": "restore"}
+
+    assert provenance.read(restore_db, using="default") is None
+    assert not provenance.is_current(
+        restore_db, dump_key="key.dump", pre_swap_hooks=[], using="default"
+    )
+
+    stamped = provenance.stamp(
+        restore_db, dump_key="key.dump", pre_swap_hooks=["migrate"], using="default"
+    )
+    assert provenance.read(restore_db, using="default") == stamped
+    assert stamped["dump_key"] == "key.dump"
+    assert provenance.is_current(
+        restore_db, dump_key="key.dump", pre_swap_hooks=["migrate"], using="default"
+    )
+    assert not provenance.is_current(
+        restore_db, dump_key="other.dump", pre_swap_hooks=["migrate"], using="default"
+    )
+    assert not provenance.is_current(
+        restore_db, dump_key="key.dump", pre_swap_hooks=[], using="default"
+    )
+
+    # Other comments aren't provenance
+    comments["restore"] = "pgclone-template:key.dump"
+    assert provenance.read(restore_db, using="default") is None
+    comments["restore"] = "pgclone-provenance:invalid"
+    assert provenance.read(restore_db, using="default") is None
+
+
+def test_stamp_backfill(mocker):
+    comments = {"restore": "Managed by ops"}
+    mocker.patch.object(
+        db,
+        "comment",
+        autospec=True,
+        side_effect=lambda database, using: comments.get(database["NAME"]),
+    )
+    mocker.patch.object(
+        db,
+        "set_comment",
+        autospec=True,
+        side_effect=lambda database, comment, using: comments.update({database["NAME"]: comment}),
+    )
+    success_msg = mocker.patch.object(logging, "success_msg", autospec=True)
+    restore_db = {"NAME": "restore"}
+
+    # Comments that pgclone didn't set are logged when they are replaced
+    provenance.stamp(
+        restore_db, dump_key="key.dump", pre_swap_hooks=[], using="default", backfilled=False
+    )
+    assert "Managed by ops" in success_msg.call_args.args[0]
+    assert provenance.read(restore_db, using="default")["backfilled"] is False
+
+    # Backfills of other dump keys don't change the provenance
+    provenance.record_backfill(restore_db, dump_key="other.dump", using="default")
+    assert provenance.read(restore_db, using="default")["backfilled"] is False
+
+    success_msg.reset_mock()
+    provenance.record_backfill(restore_db, dump_key="key.dump", using="default")
+    assert provenance.read(restore_db, using="default")["backfilled"] is True
+    assert not success_msg.called
+
+
+def test_ls_local(mocker, capsys):
+    mocker.patch.object(ls_cmd, "ls", autospec=True, return_value=[":restore", ":other"])
+    restored = {"dump_key": "key.dump", "restored_at": "2024-01-01T00:00:00", "hooks": ""}
+    mocker.patch.object(
+        db,
+        "query",
+        autospec=True,
+        return_value=[
+            ("restore", "pgclone-provenance:" + json.dumps(restored)),
+            ("other", None),
+        ],
+    )
+
+    call_command("pgclone", "ls", "--local")
+    assert capsys.readouterr().out == (":restore\tkey.dump\t2024-01-01T00:00:00\n:other\n")
@@ -0,0 +1,421 @@
+import pytest
+from django.core.management import call_command
+
+from pgclone import (
+    backfill,
+    db,
+    exceptions,
+    manifest,
+    options,
+    physical,
+    provenance,
+    restore_cmd,
+    run,
+    sync,
+    tenants,
+)
+
+SUFFIXES = ("", "__temp", "__swap", "__pre", "__post")
+
+
+def test_analyze(mocker):
+    temp_db = {"NAME": "temp", "USER": "user", "PASSWORD": "", "HOST": "host", "PORT": 5432}
+    patched_shell = mocker.patch.object(run, "shell", autospec=True)
+
+    # Statistics restored from the dump are used as-is
+    table_statistics = mocker.patch.object(
+        restore_cmd,
+        "_table_statistics",
+        autospec=True,
+        return_value=[("public.a", True), ("public.b", True)],
+    )
+    restore_cmd._analyze(temp_db, num_jobs=4)
+    assert not patched_shell.called
+
+    table_statistics.return_value = [("public.a", False), ("public.b", False)]
+    restore_cmd._analyze(temp_db, num_jobs=4)
+    patched_shell.assert_called_once_with(
+        "vacuumdb --analyze-in-stages --jobs=4 --dbname=postgresql://user:@host:5432/temp"
+    )
+
+    # Only tables without statistics are analyzed, such as when autovacuum analyzed
+    # some tables during the restore
+    table_statistics.return_value = [("public.a", True), ('public."B"', False)]
+    restore_cmd._analyze(temp_db, num_jobs=4)
+    assert patched_shell.call_args.args[0] == (
+        "vacuumdb --analyze-in-stages --jobs=4 --dbname=postgresql://user:@host:5432/temp"
+        " -t 'public.\"B\"'"
+    )
+
+    # The whole database is analyzed instead of too many tables by name
+    mocker.patch.object(restore_cmd, "_MAX_ANALYZED_TABLES", 1)
+    table_statistics.return_value = [("public.a", True), ("public.b", False), ("public.c", False)]
+    restore_cmd._analyze(temp_db, num_jobs=4)
+    assert patched_shell.call_args.args[0] == (
+        "vacuumdb --analyze-in-stages --jobs=4 --dbname=postgresql://user:@host:5432/temp"
+    )
+
+
+def test_restore_many(mocker):
+    mocker.patch.object(db, "conf", autospec=True, side_effect=lambda using: {"NAME": using})
+    is_synced = mocker.patch.object(sync, "is_synced", autospec=True, return_value=False)
+    mocker.patch.object(db, "lock", autospec=True)
+    mocker.patch.object(db, "drop", autospec=True)
+    mocker.patch.object(
+        restore_cmd,
+        "_restore_dbs",
+        autospec=True,
+        side_effect=lambda database: [{"NAME": f"{database}{suffix}"} for suffix in SUFFIXES],
+    )
+    populate = mocker.patch.object(
+        restore_cmd,
+        "_populate",
+        autospec=True,
+        side_effect=lambda dump_key, **kwargs: (f"{dump_key}.dump", {}),
+    )
+    pre_swap = mocker.patch.object(restore_cmd, "_pre_swap", autospec=True)
+    rename = mocker.patch.object(restore_cmd, "_rename", autospec=True)
+    unrename = mocker.patch.object(restore_cmd, "_unrename", autospec=True)
+    post_swap = mocker.patch.object(restore_cmd, "_post_swap", autospec=True)
+    stamp = mocker.patch.object(provenance, "stamp", autospec=True)
+
+    results = restore_cmd.restore_many({"default": "prod/default/", "other": "prod/other/"})
+    assert results == {"default": "prod/default/.dump", "other": "prod/other/.dump"}
+    assert "swap" not in results["default"].timings
+    assert pre_swap.call_count == 2
+    assert [call.args for call in rename.call_args_list] == [("default",), ("other",)]
+    assert post_swap.call_count == 2
+    assert [call.args[0] for call in stamp.call_args_list] == [
+        {"NAME": "default"},
+        {"NAME": "other"},
+    ]
+    assert not unrename.called
+
+    # No database is swapped if any restore fails
+    rename.reset_mock()
+    post_swap.reset_mock()
+    populate.side_effect = [("prod/default/.dump", {}), exceptions.RuntimeError("failed")]
+    with pytest.raises(exceptions.RuntimeError, match="No databases were swapped"):
+        restore_cmd.restore_many({"default": "prod/default/", "other": "prod/other/"})
+    assert not rename.called
+    assert not post_swap.called
+
+    # Databases are swapped back if a swap fails
+    populate.side_effect = lambda dump_key, **kwargs: (f"{dump_key}.dump", {})
+    rename.side_effect = [None, exceptions.RuntimeError("failed")]
+    with pytest.raises(exceptions.RuntimeError, match='Swapping "other" failed'):
+        restore_cmd.restore_many({"default": "prod/default/", "other": "prod/other/"})
+    unrename.assert_called_once_with("default")
+    assert not post_swap.called
+
+    with pytest.raises(exceptions.ValueError, match="dump key"):
+        restore_cmd.restore_many({"default": None})
+
+    with pytest.raises(exceptions.ValueError, match="Backfills"):
+        restore_cmd._restore_many([options.get(dump_key="key", backfill=["auth.User"])])
+
+    # The guards of single restores apply to every database before any is locked
+    populate.reset_mock()
+    mocker.patch.object(physical, "has_pre", autospec=True, side_effect=lambda db: db == "other")
+    with pytest.raises(exceptions.ValueError, match='previous cluster of "other"'):
+        restore_cmd.restore_many({"default": ":pre", "other": ":pre"})
+
+    is_synced.side_effect = lambda database, using: using == "other"
+    with pytest.raises(exceptions.RuntimeError, match='"other" is synced'):
+        restore_cmd.restore_many({"default": "prod/default/", "other": "prod/other/"})
+    assert not populate.called
+
+
+def test_unrename(mocker):
+    mocker.patch.object(
+        restore_cmd,
+        "_restore_dbs",
+        autospec=True,
+        side_effect=lambda database: [{"NAME": f"{database}{suffix}"} for suffix in SUFFIXES],
+    )
+    psql = mocker.patch.object(db, "psql", autospec=True)
+
+    restore_cmd._unrename("default")
+    assert [call.args[0] for call in psql.call_args_list] == [
+        'ALTER DATABASE "default" RENAME TO "default__temp"',
+        'ALTER DATABASE "default__swap" RENAME TO "default"',
+    ]
+
+
+def test_rename_failure(mocker):
+    """A failed rename of the temp_db puts the restore_db back in place"""
+    mocker.patch.object(
+        restore_cmd,
+        "_restore_dbs",
+        autospec=True,
+        side_effect=lambda database: [{"NAME": f"{database}{suffix}"} for suffix in SUFFIXES],
+    )
+    mocker.patch.object(db, "drop", autospec=True)
+    psql = mocker.patch.object(
+        db, "psql", autospec=True, side_effect=[None, exceptions.RuntimeError("failed"), None]
+    )
+
+    with pytest.raises(exceptions.RuntimeError, match="failed"):
+        restore_cmd._rename("default")
+
+    assert [call.args[0] for call in psql.call_args_list] == [
+        'ALTER DATABASE "default" RENAME TO "default__swap"',
+        'ALTER DATABASE "default__temp" RENAME TO "default"',
+        'ALTER DATABASE "default__swap" RENAME TO "default"',
+    ]
+
+
+def test_restore_many_command(mocker):
+    restore_many = mocker.patch.object(restore_cmd, "restore_many", autospec=True)
+
+    call_command("pgclone", "restore", "default=prod/default/", "other=prod/other/")
+    assert restore_many.call_args.args == ({"default": "prod/default/", "other": "prod/other/"},)
+
+    with pytest.raises(SystemExit):
+        call_command("pgclone", "restore", "default=prod/default/", "prod/other/")
+
+    with pytest.raises(SystemExit):
+        call_command("pgclone", "restore", "default=prod/default/", "--plan")
+
+    with pytest.raises(SystemExit):
+        call_command("pgclone", "restore", "prod/default/", "prod/other/")
+
+
+def test_restore_if_changed(mocker):
+    mocker.patch.object(db, "conf", autospec=True, return_value={"NAME": "default"})
+    mocker.patch.object(sync, "is_synced", autospec=True, return_value=False)
+    mocker.patch.object(db, "lock", autospec=True)
+    mocker.patch.object(
+        restore_cmd, "_resolve_dump_key", autospec=True, return_value="prod/default/none/1.dump"
+    )
+    mocker.patch.object(provenance, "is_current", autospec=True, return_value=True)
+    populate = mocker.patch.object(restore_cmd, "_populate", autospec=True)
+
+    result = restore_cmd.restore("prod/default/none/", if_changed=True)
+    assert result == "prod/default/none/1.dump"
+    assert not populate.called
+
+
+def test_restore_physical(mocker):
+    mocker.patch.object(db, "conf", autospec=True, return_value={"NAME": "default"})
+    mocker.patch.object(sync, "is_synced", autospec=True, return_value=False)
+    mocker.patch.object(
+        restore_cmd, "_resolve_dump_key", autospec=True, return_value="prod/default/none/1.dump"
+    )
+    mocker.patch.object(manifest, "read", autospec=True, return_value={"engine": "physical"})
+    physical_restore = mocker.patch.object(
+        physical, "restore", autospec=True, return_value="prod/default/none/1.dump"
+    )
+
+    assert restore_cmd.restore("prod/default/none/") == "prod/default/none/1.dump"
+    assert physical_restore.call_args.kwargs["database"] == "default"
+
+    with pytest.raises(exceptions.ValueError, match="Physical backups cannot"):
+        restore_cmd.restore("prod/default/none/", analyze=True)
+
+    # Physical backups can't be restored into a database
+    with pytest.raises(exceptions.ValueError, match="physical backup"):
+        restore_cmd._remote_restore(
+            "prod/default/none/",
+            temp_db={"NAME": "default__temp"},
+            using="default",
+            storage_location=".pgclone/",
+        )
+
+    # The previous cluster of a physical restore is restored instead of a database
+    mocker.patch.object(physical, "has_pre", autospec=True, return_value=True)
+    restore_pre = mocker.patch.object(physical, "restore_pre", autospec=True, return_value=":pre")
+    local_restore = mocker.patch.object(restore_cmd, "_local_restore", autospec=True)
+    assert restore_cmd.restore(":pre") == ":pre"
+    assert restore_pre.call_args.kwargs["database"] == "default"
+    assert not local_restore.called
+
+
+def test_remote_restore_schemas(mocker, tmpdir, settings):
+    settings.PGCLONE_SPOOL_DIR = tmpdir.strpath
+    mocker.patch.object(db, "conf", autospec=True, return_value={"NAME": "default"})
+    mocker.patch.object(db, "url", autospec=True, return_value="<DB_URL>")
+    mocker.patch.object(db, "size", autospec=True, return_value=0)
+    mocker.patch.object(db, "rows", autospec=True, return_value=0)
+    mocker.patch.object(manifest, "read", autospec=True, return_value={})
+    mocker.patch.object(restore_cmd, "_create_temp_db", autospec=True)
+    mocker.patch.object(
+        restore_cmd, "_resolve_dump_key", autospec=True, return_value="prod/default/none/1.dump"
+    )
+    mocker.patch.object(
+        tenants,
+        "toc",
+        autospec=True,
+        return_value=[
+            "5; 2615 16390 SCHEMA - tenant_a owner",
+            "6; 2615 16391 SCHEMA - tenant_b owner",
+        ],
+    )
+    restore_lists = []
+    shell = mocker.patch.object(
+        run,
+        "shell",
+        autospec=True,
+        side_effect=lambda cmd, **kwargs: restore_lists.append(
+            open(cmd.split(" -L ")[1].split()[0]).read()
+        ),
+    )
+
+    restore_cmd._remote_restore(
+        "prod/default/none/",
+        temp_db={"NAME": "default__temp"},
+        using="default",
+        storage_location=".pgclone/",
+        schemas=["tenant_a"],
+    )
+    assert shell.call_args.args[0].startswith("cat .pgclone/prod/default/none/1.dump |")
+    assert restore_lists == ["5; 2615 16390 SCHEMA - tenant_a owner\n"]
+    # Restore lists are removed once restored
+    assert tmpdir.listdir() == []
+
+
+def _state(dump_key, phase):
+    return f'pgclone-restore:{{"dump_key": "{dump_key}", "phase": "{phase}"}}'
+
+
+def test_resume_state(mocker):
+    mocker.patch.object(
+        restore_cmd,
+        "_restore_dbs",
+        autospec=True,
+        return_value=[{"NAME": f"default{suffix}"} for suffix in SUFFIXES],
+    )
+    comment = mocker.patch.object(db, "comment", autospec=True)
+
+    comment.side_effect = [_state("prod/default/none/1.dump", "restored")]
+    assert restore_cmd._resume_state("prod/default/", database="default") == {
+        "dump_key": "prod/default/none/1.dump",
+        "phase": "restored",
+    }
+
+    # The temp_db was renamed when the state is on the restore_db
+    comment.side_effect = [None, _state("prod/default/none/1.dump", "hooks-done")]
+    assert restore_cmd._resume_state(None, database="default")["phase"] == "swapped"
+
+    comment.side_effect = [_state("prod/default/none/1.dump", "restored")]
+    with pytest.raises(exceptions.ValueError, match='not "prod/default/none/2.dump"'):
+        restore_cmd._resume_state("prod/default/none/2.dump", database="default")
+
+    comment.side_effect = [_state(":backup", "restored")]
+    with pytest.raises(exceptions.ValueError, match='not ":back"'):
+        restore_cmd._resume_state(":back", database="default")
+
+    comment.side_effect = [None, 'pgclone-provenance:{"dump_key": "key"}']
+    with pytest.raises(exceptions.RuntimeError, match="no interrupted restore"):
+        restore_cmd._resume_state(None, database="default")
+
+
+def test_resume_clone(mocker):
+    mocker.patch.object(db, "conf", autospec=True, return_value={"NAME": "default"})
+    mocker.patch.object(sync, "is_synced", autospec=True, return_value=False)
+    mocker.patch.object(db, "lock", autospec=True)
+    resume_state = mocker.patch.object(
+        restore_cmd,
+        "_resume_state",
+        autospec=True,
+        return_value={"dump_key": ":clone", "phase": "created"},
+    )
+
+    # The source of a clone isn't recorded, so it can't be transferred again
+    with pytest.raises(exceptions.RuntimeError, match="Clone it again"):
+        restore_cmd.restore(resume=True)
+
+    # Clones are swapped in like remote restores once they're transferred
+    resume_state.return_value = {"dump_key": ":clone", "phase": "restored"}
+    swap = mocker.patch.object(restore_cmd, "_swap", autospec=True)
+    mocker.patch.object(provenance, "stamp", autospec=True)
+    assert restore_cmd.restore(resume=True) == ":clone"
+    assert swap.call_args.kwargs["is_local_restore"] is False
+
+
+def test_resume_backfill(mocker):
+    mocker.patch.object(db, "conf", autospec=True, return_value={"NAME": "default"})
+    mocker.patch.object(sync, "is_synced", autospec=True, return_value=False)
+    mocker.patch.object(db, "lock", autospec=True)
+    mocker.patch.object(
+        restore_cmd,
+        "_resume_state",
+        autospec=True,
+        return_value={"dump_key": "prod/default/none/1.dump", "phase": "hooks-done"},
+    )
+    mocker.patch.object(restore_cmd, "_swap", autospec=True)
+    stamp = mocker.patch.object(provenance, "stamp", autospec=True)
+    is_pending = mocker.patch.object(backfill, "is_pending", autospec=True, return_value=True)
+    start = mocker.patch.object(backfill, "start", autospec=True)
+
+    # The backfill of the interrupted restore starts without --backfill
+    restore_cmd.restore(resume=True)
+    assert is_pending.call_args.kwargs["dump_key"] == "prod/default/none/1.dump"
+    assert stamp.call_args.kwargs["backfilled"] is False
+    start.assert_called_once_with({"NAME": "default"}, using="default")
+
+
+def test_resume_state_under_lock(mocker):
+    mocker.patch.object(db, "conf", autospec=True, return_value={"NAME": "default"})
+    mocker.patch.object(sync, "is_synced", autospec=True, return_value=False)
+    calls = []
+    lock = mocker.patch.object(db, "lock", autospec=True)
+    lock.return_value.__enter__.side_effect = lambda: calls.append("lock")
+    mocker.patch.object(
+        restore_cmd,
+        "_resume_state",
+        autospec=True,
+        side_effect=lambda *args, **kwargs: calls.append("state")
+        or {"dump_key": ":backup", "phase": "swapped"},
+    )
+    mocker.patch.object(restore_cmd, "_swap", autospec=True)
+    mocker.patch.object(provenance, "stamp", autospec=True)
+
+    restore_cmd.restore(resume=True)
+    assert calls == ["lock", "state"]
+
+
+def test_restore_resume(mocker):
+    mocker.patch.object(db, "conf", autospec=True, return_value={"NAME": "default"})
+    mocker.patch.object(sync, "is_synced", autospec=True, return_value=False)
+    mocker.patch.object(db, "lock", autospec=True)
+    mocker.patch.object(
+        restore_cmd,
+        "_restore_dbs",
+        autospec=True,
+        return_value=[{"NAME": f"default{suffix}"} for suffix in SUFFIXES],
+    )
+    comment = mocker.patch.object(
+        db, "comment", autospec=True, return_value=_state("prod/default/none/1.dump", "restored")
+    )
+    set_comment = mocker.patch.object(db, "set_comment", autospec=True)
+    populate = mocker.patch.object(restore_cmd, "_populate", autospec=True)
+    execute_hooks = mocker.patch("pgclone.hooks.execute", autospec=True)
+    rename = mocker.patch.object(restore_cmd, "_rename", autospec=True)
+    mocker.patch.object(restore_cmd, "_post_swap", autospec=True)
+    stamp = mocker.patch.object(provenance, "stamp", autospec=True)
+
+    # Restores are resumed after their last completed phase
+    assert restore_cmd.restore(resume=True) == "prod/default/none/1.dump"
+    assert not populate.called
+    assert execute_hooks.called
+    assert rename.called
+    assert [call.args[1] for call in set_comment.call_args_list] == [
+        _state("prod/default/none/1.dump", "post-snapshot"),
+        _state("prod/default/none/1.dump", "hooks-done"),
+        _state("prod/default/none/1.dump", "swapped"),
+    ]
+    assert stamp.call_args.kwargs["dump_key"] == "prod/default/none/1.dump"
+
+    execute_hooks.reset_mock()
+    rename.reset_mock()
+    comment.return_value = _state("prod/default/none/1.dump", "hooks-done")
+    restore_cmd.restore("prod/default/none/1.dump", resume=True)
+    assert not execute_hooks.called
+    assert rename.called
+
+    with pytest.raises(exceptions.ValueError, match="if_changed"):
+        restore_cmd.restore(resume=True, if_changed=True)
+
+    with pytest.raises(exceptions.ValueError, match="Must provide a dump key"):
+        restore_cmd.restore()
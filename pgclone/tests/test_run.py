@@ -0,0 +1,46 @@
+import pytest
+
+from pgclone import exceptions, run
+
+
+def test_shell_input(tmpdir):
+    path = tmpdir.join("out")
+    run.shell_input(f"cat > {path.strpath}", lambda stdin: stdin.write(b"data"))
+    assert path.read_binary() == b"data"
+
+    with pytest.raises(exceptions.RuntimeError):
+        run.shell_input("cat > /dev/null; exit 1", lambda stdin: stdin.write(b"data"))
+
+    run.shell_input("exit 1", lambda stdin: None, ignore_errors=True)
+
+
+def test_pipe(tmpdir):
+    path = tmpdir.join("out")
+    run.pipe("echo data", f"cat > {path.strpath}")
+    assert path.read() == "data\n"
+
+    # Errors of the producer are raised even when errors of the consumer are ignored
+    with pytest.raises(exceptions.RuntimeError):
+        run.pipe("exit 1", "cat > /dev/null", ignore_consumer_errors=True)
+
+    with pytest.raises(exceptions.RuntimeError):
+        run.pipe("echo data", "cat > /dev/null; exit 1")
+
+    run.pipe("echo data", "cat > /dev/null; exit 1", ignore_consumer_errors=True)
+
+
+def test_pipe_pump(tmpdir):
+    path = tmpdir.join("out")
+    run.pipe(
+        "echo data",
+        f"cat > {path.strpath}",
+        pump=lambda in_f, out_f: out_f.write(in_f.read().upper()),
+    )
+    assert path.read() == "DATA\n"
+
+    def fail(in_f, out_f):
+        raise exceptions.ValueError("failed")
+
+    # Errors of the pump stop both commands
+    with pytest.raises(exceptions.ValueError, match="failed"):
+        run.pipe("cat /dev/zero", "cat > /dev/null", pump=fail)
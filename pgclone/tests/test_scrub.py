@@ -0,0 +1,152 @@
+import concurrent.futures
+import hashlib
+import io
+import subprocess
+import tarfile
+
+import pytest
+
+from pgclone import exceptions, scrub
+
+
+def reverse(value):
+    return value[::-1]
+
+
+def test_transform_lines():
+    lines = [
+        "1\tjane@example.com\tJane\\tDoe\tsecret\n",
+        "2\t\\N\tJohn\\\\\t\\N\n",
+        "\\.\n",
+    ]
+    transformed = scrub._transform_lines(
+        lines,
+        transformers={
+            1: "email",
+            2: "pgclone.tests.test_scrub.reverse",
+            3: "null",
+        },
+    )
+    email = hashlib.sha256(b"jane@example.com").hexdigest()[:16] + "@example.com"
+    assert transformed == [
+        f"1\t{email}\teoD\\tenaJ\t\\N\n",
+        "2\t\\N\t\\\\nhoJ\t\\N\n",
+        "\\.\n",
+    ]
+
+    # The last line of a member may not end with a newline
+    assert scrub._transform_lines(["1\tvalue"], transformers={1: "empty"}) == ["1\t"]
+    # Empty lines are rows of a single empty value, not the end of the data
+    assert scrub._transform_lines(["\n", "\\.\n", "\n"], transformers={0: "null"}) == [
+        "\\N\n",
+        "\\.\n",
+        "\n",
+    ]
+    assert scrub._transform_lines(["1\tvalue\n"], transformers={1: "hash"}) == [
+        f"1\t{hashlib.sha256(b'value').hexdigest()}\n"
+    ]
+
+    with pytest.raises(exceptions.ValueError, match="not a valid transformer"):
+        scrub._transform_lines(["1\tvalue\n"], transformers={1: "invalid.transformer"})
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_transform(mocker, workers):
+    mocker.patch.object(scrub, "_CHUNK_LINES", 2)
+    in_f = io.BytesIO("".join(f"{i}\tvalue{i}\n" for i in range(7)).encode() + b"7\t\n\\.\n\n\n")
+    out_f = io.BytesIO()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        scrub._transform(
+            in_f,
+            out_f,
+            transformers={1: "pgclone.tests.test_scrub.reverse"},
+            executor=executor if workers > 1 else None,
+            workers=workers,
+        )
+
+    assert out_f.getvalue().decode() == (
+        "".join(f"{i}\t{i}eulav\n" for i in range(7)) + "7\t\n\\.\n\n\n"
+    )
+
+
+def _tar(members):
+    tar_f = io.BytesIO()
+    with tarfile.open(fileobj=tar_f, mode="w", format=tarfile.USTAR_FORMAT) as tar:
+        for name, data in members.items():
+            member = tarfile.TarInfo(name)
+            member.size = len(data)
+            tar.addfile(member, io.BytesIO(data))
+
+    tar_f.seek(0)
+    return tar_f
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_rewrite(mocker, settings, tmpdir, workers):
+    settings.PGCLONE_SCRUB_WORKERS = workers
+    settings.PGCLONE_SPOOL_DIR = tmpdir.strpath
+    mocker.patch(
+        "subprocess.run",
+        autospec=True,
+        return_value=subprocess.CompletedProcess(
+            args=[],
+            returncode=0,
+            stdout=(
+                ";\n; Archive created at 2024-01-01\n"
+                "215; 1259 16384 TABLE public auth_user postgres\n"
+                "3245; 0 16384 TABLE DATA public auth_user postgres\n"
+                "3246; 0 16390 TABLE DATA public django_session postgres\n"
+            ),
+        ),
+    )
+    mocker.patch.object(scrub, "_columns", autospec=True, return_value=["id", "username", "email"])
+    mocker.patch.object(
+        scrub,
+        "_tables",
+        autospec=True,
+        return_value=[("public", "auth_user"), ("public", "django_session")],
+    )
+    in_f = _tar(
+        {
+            "toc.dat": b"toc",
+            "3245.dat": b"1\tjane\tjane@example.com\n\\.\n\n",
+            "3246.dat": b"key\tdata\n\\.\n\n",
+            "restore.sql": b"sql",
+        }
+    )
+    out_f = io.BytesIO()
+
+    scrub.rewrite(
+        in_f,
+        out_f,
+        rules={"auth.User": {"username": "hash", "email": "null"}},
+        database={"NAME": "default"},
+    )
+
+    out_f.seek(0)
+    with tarfile.open(fileobj=out_f, mode="r") as out_tar:
+        assert out_tar.getnames() == ["toc.dat", "3245.dat", "3246.dat", "restore.sql"]
+        assert out_tar.extractfile("3245.dat").read().decode() == (
+            f"1\t{hashlib.sha256(b'jane').hexdigest()}\t\\N\n\\.\n\n"
+        )
+        assert out_tar.extractfile("3246.dat").read() == b"key\tdata\n\\.\n\n"
+        assert out_tar.extractfile("toc.dat").read() == b"toc"
+
+    # Unknown tables, such as unresolved model labels, are errors
+    with pytest.raises(exceptions.ValueError, match="auth_group, app.Missing don't exist"):
+        scrub.rewrite(
+            _tar({"toc.dat": b"toc"}),
+            io.BytesIO(),
+            rules={"auth.Group": {"name": "hash"}, "app.Missing": {"name": "hash"}},
+            database={"NAME": "default"},
+        )
+
+    # Unknown columns are errors
+    with pytest.raises(exceptions.ValueError, match="no column"):
+        scrub.rewrite(
+            _tar({"toc.dat": b"toc"}),
+            io.BytesIO(),
+            rules={"public.auth_user": {"password": "hash"}},
+            database={"NAME": "default"},
+        )
@@ -0,0 +1,85 @@
+import pickle
+
+import pytest
+
+from pgclone import signals, spans
+
+
+def test_operation(tmpdir, settings):
+    settings.PGCLONE_PROMETHEUS_TEXTFILE_DIR = tmpdir.strpath
+    finished_spans = []
+    finished_operations = []
+
+    def on_span_finished(sender, span, **kwargs):
+        finished_spans.append(span)
+
+    def on_operation_finished(sender, operation, **kwargs):
+        finished_operations.append(operation)
+
+    signals.span_finished.connect(on_span_finished)
+    signals.operation_finished.connect(on_operation_finished)
+    try:
+        with spans.operation("restore", database="default") as operation:
+            with spans.span("drop"):
+                pass
+
+            with spans.span("pg_restore", dump_key="key") as pg_restore_span:
+                pg_restore_span.set(bytes=100, rows=10)
+
+            with spans.span("drop"):
+                pass
+    finally:
+        signals.span_finished.disconnect(on_span_finished)
+        signals.operation_finished.disconnect(on_operation_finished)
+
+    result = spans.Result("key", operation)
+    assert result == "key"
+    assert [span.name for span in result.spans] == ["drop", "pg_restore", "drop"]
+    assert list(result.timings) == ["drop", "pg_restore"]
+    assert result.timings["drop"] == pytest.approx(
+        result.spans[0].duration + result.spans[2].duration
+    )
+    assert result.duration >= sum(result.timings.values())
+    assert result.spans[1].attributes == {"dump_key": "key", "bytes": 100, "rows": 10}
+    assert finished_spans == result.spans
+    assert finished_operations == [operation]
+
+    # Results are strings that survive being pickled, such as when cached
+    assert pickle.loads(pickle.dumps(result)) == "key"
+
+    metrics = tmpdir.join("pgclone_restore_default.prom").read()
+    assert 'pgclone_success{operation="restore",database="default"} 1' in metrics
+    assert (
+        'pgclone_phase_bytes{operation="restore",database="default",phase="pg_restore"} 100'
+        in metrics
+    )
+    assert (
+        'pgclone_phase_duration_seconds{operation="restore",database="default",phase="drop"}'
+        in metrics
+    )
+
+
+def test_operation_error(tmpdir, settings):
+    settings.PGCLONE_PROMETHEUS_TEXTFILE_DIR = tmpdir.strpath
+
+    with pytest.raises(RuntimeError):
+        with spans.operation("dump", database="other") as operation:
+            with spans.span("pg_dump"):
+                raise RuntimeError("failed")
+
+    assert operation.error == "failed"
+    assert operation.spans[0].error == "failed"
+    metrics = tmpdir.join("pgclone_dump_other.prom").read()
+    assert 'pgclone_success{operation="dump",database="other"} 0' in metrics
+    assert "pgclone_phase_bytes" not in metrics
+
+
+def test_span_without_operation():
+    with spans.span("backfill", table="events") as span:
+        pass
+
+    assert span.operation is None
+    assert span.end is not None
+    assert spans.Result("key").timings == {}
+    assert spans.Result("key").spans == []
+    assert spans.Result("key").duration is None
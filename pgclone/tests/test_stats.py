@@ -0,0 +1,27 @@
+import pytest
+
+from pgclone import stats
+
+
+def test_record_unwritable(tmpdir, settings):
+    """Failing to write statistics doesn't fail the recorded operation"""
+    settings.PGCLONE_STATS_FILE = tmpdir.join("missing", "stats.json").strpath
+    stats.record("dump", db_bytes=100, archive_bytes=20, seconds=10)
+    assert stats.load() == {}
+
+
+def test_record(tmpdir, settings):
+    settings.PGCLONE_STATS_FILE = tmpdir.join("stats.json").strpath
+    assert stats.load() == {}
+
+    stats.record("dump", db_bytes=100, archive_bytes=20, seconds=10)
+    assert stats.load() == {
+        "dump": {"bytes_per_second": 10, "compression_ratio": 0.2, "samples": 1}
+    }
+
+    stats.record("dump", db_bytes=300, archive_bytes=None, seconds=10)
+    assert stats.load()["dump"] == {
+        "bytes_per_second": pytest.approx(20),
+        "compression_ratio": 0.2,
+        "samples": 2,
+    }
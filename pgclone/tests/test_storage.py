@@ -31,6 +31,14 @@ def test_s3_pg_dump():
     assert storage.S3("bucket").pg_dump("file_path") == "| aws s3 cp - file_path"
 
 
+def test_s3_pg_dump_nice(mocker):
+    mocker.patch("shutil.which", autospec=True, return_value="/usr/bin/ionice")
+    assert (
+        storage.S3("bucket").pg_dump("file_path", nice=10)
+        == "| nice -n 10 ionice -c 2 -n 7 aws s3 cp - file_path"
+    )
+
+
 def test_s3_pg_restore():
     assert storage.S3("bucket").pg_restore("file_path") == "aws s3 cp file_path - |"
 
@@ -49,3 +57,21 @@ def test_s3_pg_restore_with_endpoint_url(settings):
         storage.S3("bucket").pg_restore("file_path")
         == "aws s3 cp file_path - --endpoint-url https://endpoint.example.com |"
     )
+
+
+def test_local_iter_keys_reverse_sorted(tmpdir):
+    """Local keys are yielded in reverse order and only under the prefix directory"""
+    for path in ["a/b/1.dump", "a/b/2.dump", "a/b.dump", "a/c/1.dump", "b/1.dump"]:
+        tmpdir.join(path).ensure()
+
+    local = storage.Local(tmpdir.strpath)
+    assert list(local.iter_keys()) == [
+        "b/1.dump",
+        "a/c/1.dump",
+        "a/b/2.dump",
+        "a/b/1.dump",
+        "a/b.dump",
+    ]
+    assert local.ls(prefix="a/b") == ["a/b/2.dump", "a/b/1.dump", "a/b.dump"]
+    assert local.ls(prefix="a/b/") == ["a/b/2.dump", "a/b/1.dump"]
+    assert local.ls(prefix="missing/") == []
@@ -0,0 +1,242 @@
+import pytest
+from django.core.management import call_command
+
+from pgclone import db, dump_cmd, exceptions, hooks, restore_cmd, sync
+
+COMMENT = 'pgclone-sync:{"source": "prod"}'
+
+
+@pytest.fixture
+def dbs(mocker):
+    """Mock the "prod" source and "default" target databases"""
+    confs = {
+        "prod": {
+            "NAME": "app",
+            "HOST": "prod.example.com",
+            "PORT": 5432,
+            "USER": "user",
+            "PASSWORD": "it's",
+            "ENGINE": "django.db.backends.postgresql",
+            "OPTIONS": {"sslmode": "require"},
+        },
+        "default": {"NAME": "App-Staging", "HOST": "localhost", "PORT": "", "USER": "user"},
+    }
+    mocker.patch.object(db, "conf", autospec=True, side_effect=lambda using: dict(confs[using]))
+    return confs
+
+
+def test_name_and_conninfo(dbs):
+    assert sync._name({"NAME": "App-Staging"}) == "pgclone_app_staging"
+    assert sync._conninfo(dbs["prod"]) == (
+        "host='prod.example.com' port='5432' dbname='app' user='user' password='it\\'s'"
+    )
+
+
+def test_exported_snapshot(mocker, dbs):
+    backend = mocker.patch.object(sync, "load_backend", autospec=True)
+    wrapper = backend.return_value.DatabaseWrapper
+    cursor = wrapper.return_value.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = ("slot", "0/1", "00000003-00000002-1", "pgoutput")
+
+    with sync._exported_snapshot(dbs["prod"], slot="pgclone_app") as snapshot:
+        assert snapshot == "00000003-00000002-1"
+
+    assert wrapper.call_args.args[0]["OPTIONS"] == {
+        "sslmode": "require",
+        "replication": "database",
+    }
+    cursor.execute.assert_called_once_with(
+        'CREATE_REPLICATION_SLOT "pgclone_app" LOGICAL pgoutput EXPORT_SNAPSHOT'
+    )
+    wrapper.return_value.close.assert_called_once_with()
+
+
+def test_start(mocker, dbs):
+    execute = mocker.patch.object(db, "execute", autospec=True)
+    mocker.patch.object(db, "query", autospec=True, return_value=[])
+    exported_snapshot = mocker.patch.object(sync, "_exported_snapshot", autospec=True)
+    exported_snapshot.return_value.__enter__.return_value = "snapshot-1"
+    dump = mocker.patch.object(dump_cmd, "_dump", autospec=True, return_value="dev/prod/none/1")
+    restore = mocker.patch.object(restore_cmd, "_restore", autospec=True)
+
+    result = sync.start("prod", pre_swap_hooks=["scrub"], storage_location="/dumps")
+    assert result == "dev/prod/none/1"
+    assert list(result.timings) == ["publish", "dump", "restore", "subscribe"]
+
+    assert dump.call_args.kwargs["snapshot"] == "snapshot-1"
+    assert dump.call_args.kwargs["database"] == "prod"
+    assert restore.call_args.kwargs["dump_key"] == "dev/prod/none/1"
+    assert restore.call_args.kwargs["database"] == "default"
+    assert restore.call_args.kwargs["pre_swap_hooks"] == ["scrub"]
+
+    sqls = [call.args[0] for call in execute.call_args_list]
+    assert sqls[0] == 'CREATE PUBLICATION "pgclone_app_staging" FOR ALL TABLES'
+    assert sqls[1].startswith('CREATE SUBSCRIPTION "pgclone_app_staging" CONNECTION %s')
+    assert "copy_data = false" in sqls[1]
+    assert execute.call_args_list[1].args[1] == [sync._conninfo(dbs["prod"])]
+    assert execute.call_args_list[2].args[1] == [COMMENT]
+
+    # The slot and publication are dropped when the initial copy fails
+    execute.reset_mock()
+    restore.side_effect = exceptions.RuntimeError("failed")
+    with pytest.raises(exceptions.RuntimeError, match="failed"):
+        sync.start("prod")
+
+    assert [call.args[0] for call in execute.call_args_list[1:]] == [
+        "SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots"
+        " WHERE slot_name = %s",
+        'DROP PUBLICATION IF EXISTS "pgclone_app_staging"',
+    ]
+
+    with pytest.raises(exceptions.RuntimeError, match="cannot be the same"):
+        sync.start("prod", database="prod")
+
+
+def test_start_same_database(mocker, dbs):
+    mocker.patch.object(db, "execute", autospec=True)
+    mocker.patch.object(db, "query", autospec=True, return_value=[])
+    mocker.patch.object(sync, "_exported_snapshot", autospec=True)
+    mocker.patch.object(dump_cmd, "_dump", autospec=True, return_value="dev/prod/none/1")
+    mocker.patch.object(restore_cmd, "_restore", autospec=True)
+
+    # Databases are the same when their host, port and name are, whatever their alias
+    dbs["default"].update(NAME="app", HOST="prod.example.com", PORT="")
+    with pytest.raises(exceptions.RuntimeError, match="cannot be the same"):
+        sync.start("prod")
+
+    # Servers on other ports of the same host are other databases
+    dbs["default"]["PORT"] = 5433
+    assert sync.start("prod") == "dev/prod/none/1"
+
+
+def test_restore_synced(mocker, dbs):
+    query = mocker.patch.object(db, "query", autospec=True, return_value=[(1,)])
+    mocker.patch.object(db, "conn", autospec=True, return_value={"NAME": "postgres"})
+    populate = mocker.patch.object(restore_cmd, "_populate", autospec=True)
+
+    with pytest.raises(exceptions.RuntimeError, match="synced by pgclone"):
+        restore_cmd.restore(":pre")
+
+    assert query.call_args.args[1] == ["App-Staging", "pgclone_app_staging", "pgclone-sync:%"]
+    assert query.call_args.kwargs["database"] == {"NAME": "postgres"}
+    assert not populate.called
+
+
+def test_status(mocker, dbs):
+    query = mocker.patch.object(
+        db, "query", autospec=True, side_effect=[[(COMMENT, True)], [(1.5,)], [(2048,)]]
+    )
+    assert sync.status() == {
+        "source": "prod",
+        "enabled": True,
+        "lag_seconds": 1.5,
+        "lag_bytes": 2048,
+    }
+    assert query.call_args.kwargs["database"] == dbs["prod"]
+
+    query.side_effect = [[(COMMENT, False)], [], [(None,)]]
+    assert sync.status() == {
+        "source": "prod",
+        "enabled": False,
+        "lag_seconds": None,
+        "lag_bytes": None,
+    }
+
+    query.side_effect = [[]]
+    with pytest.raises(exceptions.RuntimeError, match="not synced"):
+        sync.status()
+
+
+def test_pause_resume_and_run_hooks(mocker, dbs):
+    execute = mocker.patch.object(db, "execute", autospec=True)
+    query = mocker.patch.object(db, "query", autospec=True, return_value=[(COMMENT, True)])
+    execute_hooks = mocker.patch.object(hooks, "execute", autospec=True)
+
+    sync.pause()
+    sync.resume()
+    assert [call.args[0] for call in execute.call_args_list] == [
+        'ALTER SUBSCRIPTION "pgclone_app_staging" DISABLE',
+        'ALTER SUBSCRIPTION "pgclone_app_staging" ENABLE',
+    ]
+
+    # Syncing is paused while hooks run
+    execute.reset_mock()
+    execute_hooks.side_effect = lambda *args, **kwargs: execute("hooks", database=None)
+    sync.run_hooks(["scrub"])
+    assert [call.args[0] for call in execute.call_args_list] == [
+        'ALTER SUBSCRIPTION "pgclone_app_staging" DISABLE',
+        "hooks",
+        'ALTER SUBSCRIPTION "pgclone_app_staging" ENABLE',
+    ]
+    assert execute_hooks.call_args.args[0] == ["scrub"]
+
+    # Paused syncs stay paused
+    execute.reset_mock()
+    query.return_value = [(COMMENT, False)]
+    sync.run_hooks(["scrub"])
+    assert [call.args[0] for call in execute.call_args_list] == ["hooks"]
+
+
+def test_stop(mocker, dbs):
+    sleep = mocker.patch("time.sleep", autospec=True)
+    execute = mocker.patch.object(db, "execute", autospec=True)
+    query = mocker.patch.object(
+        db, "query", autospec=True, side_effect=[[(COMMENT, True)], [(1,)], []]
+    )
+
+    sync.stop()
+    sleep.assert_called_once_with(1)
+    assert [(call.args[0], call.kwargs["database"]) for call in execute.call_args_list] == [
+        ('ALTER SUBSCRIPTION "pgclone_app_staging" DISABLE', dbs["default"]),
+        ('ALTER SUBSCRIPTION "pgclone_app_staging" SET (slot_name = NONE)', dbs["default"]),
+        ('DROP SUBSCRIPTION "pgclone_app_staging"', dbs["default"]),
+        (
+            "SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots"
+            " WHERE slot_name = %s",
+            dbs["prod"],
+        ),
+        ('DROP PUBLICATION IF EXISTS "pgclone_app_staging"', dbs["prod"]),
+    ]
+
+    # Slots that stay in use aren't dropped
+    mocker.patch.object(sync, "_SLOT_RELEASE_TIMEOUT", 0)
+    query.side_effect = [[(COMMENT, True)], [(1,)], [(1,)]]
+    with pytest.raises(exceptions.RuntimeError, match="still in use"):
+        sync.stop()
+
+
+def test_sync_command(mocker, capsys):
+    start = mocker.patch.object(sync, "start", autospec=True)
+    status = mocker.patch.object(
+        sync,
+        "status",
+        autospec=True,
+        return_value={"source": "prod", "enabled": True, "lag_seconds": 1.5, "lag_bytes": None},
+    )
+    pause = mocker.patch.object(sync, "pause", autospec=True)
+    resume = mocker.patch.object(sync, "resume", autospec=True)
+    run_hooks = mocker.patch.object(sync, "run_hooks", autospec=True)
+    stop = mocker.patch.object(sync, "stop", autospec=True)
+
+    call_command("pgclone", "sync", "--from", "prod", "--pre-swap-hook", "scrub")
+    assert start.call_args.args == ("prod",)
+    assert start.call_args.kwargs["pre_swap_hooks"] == ["scrub"]
+
+    call_command("pgclone", "sync", "--status")
+    assert status.called
+    assert capsys.readouterr().out.splitlines()[-4:] == [
+        "source: prod",
+        "enabled: True",
+        "lag_seconds: 1.5",
+        "lag_bytes: unknown",
+    ]
+
+    call_command("pgclone", "sync", "--pause")
+    call_command("pgclone", "sync", "--resume")
+    call_command("pgclone", "sync", "--run-hooks", "-d", "default")
+    call_command("pgclone", "sync", "--stop")
+    assert pause.called and resume.called and stop.called
+    assert run_hooks.call_args.kwargs["database"] == "default"
+
+    with pytest.raises(SystemExit):
+        call_command("pgclone", "sync")
@@ -0,0 +1,87 @@
+import pytest
+
+from pgclone import db, exceptions, storage, tenants
+
+TOC = [
+    ";",
+    "; Archive created at 2024-01-01 00:00:00 UTC",
+    "1; 3079 16385 EXTENSION - hstore ",
+    "5; 2615 16390 SCHEMA - tenant_a owner",
+    "3650; 0 0 COMMENT - SCHEMA tenant_a owner",
+    "6; 2615 16391 SCHEMA - tenant_b owner",
+    "3651; 0 0 ACL - SCHEMA tenant_b owner",
+    "210; 1259 16392 TABLE tenant_a orders owner",
+    "211; 1259 16393 TABLE tenant_b orders owner",
+    "212; 1259 16394 TABLE public django_migrations owner",
+    "3640; 0 16392 TABLE DATA tenant_a orders owner",
+    "3641; 0 16393 TABLE DATA tenant_b orders owner",
+    "3500; 2606 16395 FK CONSTRAINT tenant_b orders orders_fk owner",
+]
+
+
+@pytest.mark.parametrize(
+    "schema, schemas, exclude_schemas, expected",
+    [
+        ("tenant_a", [], [], True),
+        ("tenant_a", ["tenant_*"], [], True),
+        ("tenant_a", ["tenant_?"], ["tenant_a"], False),
+        ("tenant.a", ["tenant_a"], [], False),
+        ("public", ["tenant_*"], [], False),
+        ("Tenant_A", ["tenant_*"], [], False),
+    ],
+)
+def test_matches(schema, schemas, exclude_schemas, expected):
+    assert tenants.matches(schema, schemas=schemas, exclude_schemas=exclude_schemas) == expected
+
+
+def test_pg_dump_args():
+    assert tenants.pg_dump_args() == ""
+    assert tenants.pg_dump_args(["tenant_*", "Acme"], ["tenant_?"]) == (
+        "-n '\"tenant_\"*' -n '\"Acme\"' -N '\"tenant_\"?'"
+    )
+
+
+def test_filter_toc():
+    assert tenants.filter_toc(TOC, schemas=["tenant_a"]) == [
+        ";",
+        "; Archive created at 2024-01-01 00:00:00 UTC",
+        "1; 3079 16385 EXTENSION - hstore ",
+        "5; 2615 16390 SCHEMA - tenant_a owner",
+        "3650; 0 0 COMMENT - SCHEMA tenant_a owner",
+        "210; 1259 16392 TABLE tenant_a orders owner",
+        "3640; 0 16392 TABLE DATA tenant_a orders owner",
+    ]
+    assert tenants.filter_toc(TOC, exclude_schemas=["tenant_*"]) == TOC[:3] + [TOC[9]]
+
+
+def test_toc_error(tmpdir):
+    with pytest.raises(exceptions.RuntimeError, match="Could not read the table of contents"):
+        tenants.toc(file_path="missing.dump", storage_client=storage.Local(tmpdir.strpath))
+
+
+def test_resolve_and_size(mocker):
+    query = mocker.patch.object(
+        db, "query", autospec=True, return_value=[("public",), ("tenant_a",), ("tenant_b",)]
+    )
+    assert tenants.resolve(["tenant_*"], ["tenant_b"], database={}) == ["tenant_a"]
+
+    query.return_value = [("public", 10), ("tenant_a", 100), ("tenant_b", None)]
+    assert tenants.size(["tenant_*"], database={}) == 100
+    assert tenants.size(exclude_schemas=["tenant_a"], database={}) == 10
+
+
+def test_exported_snapshot(mocker):
+    backend = mocker.patch.object(tenants, "load_backend", autospec=True)
+    wrapper = backend.return_value.DatabaseWrapper
+    cursor = wrapper.return_value.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = ("00000003-00000002-1",)
+
+    with tenants.exported_snapshot({"ENGINE": "django.db.backends.postgresql"}) as snapshot:
+        assert snapshot == "00000003-00000002-1"
+
+    assert [call.args[0] for call in cursor.execute.call_args_list] == [
+        "BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY",
+        "SELECT pg_export_snapshot()",
+        "COMMIT",
+    ]
+    wrapper.return_value.close.assert_called_once_with()
@@ -0,0 +1,96 @@
+import contextlib
+
+import pytest
+
+from pgclone import exceptions, testing
+
+
+@pytest.fixture
+def mock_db(mocker):
+    comments = {}
+    mocker.patch(
+        "pgclone.db.comment",
+        autospec=True,
+        side_effect=lambda database, using: comments.get(database["NAME"]),
+    )
+    mocker.patch(
+        "pgclone.db.set_comment",
+        autospec=True,
+        side_effect=lambda database, comment, using: comments.update({database["NAME"]: comment}),
+    )
+    mocker.patch("pgclone.db.lock", autospec=True, return_value=contextlib.nullcontext())
+    mocker.patch("pgclone.db.psql", autospec=True)
+    mocker.patch("pgclone.db.drop", autospec=True)
+    mocker.patch("pgclone.testing._use_db", autospec=True)
+    mocker.patch("pgclone.restore_cmd._resolve_dump_key", autospec=True, return_value="key.dump")
+    return comments
+
+
+def test_setup(mock_db, mocker, settings):
+    remote_restore = mocker.patch("pgclone.restore_cmd._remote_restore", autospec=True)
+    db_name = settings.DATABASES["default"]["NAME"]
+
+    assert testing.setup("prefix", worker="gw0", pre_swap_hooks=[]) == f"{db_name}__pool_gw0"
+    assert remote_restore.call_count == 1
+    assert mock_db == {
+        f"{db_name}__template": "pgclone-template:key.dump",
+        f"{db_name}__pool_gw0": "pgclone-pool:in-use",
+    }
+
+    # The template is reused for other workers and sessions
+    testing.setup("prefix", worker="gw1", pre_swap_hooks=[])
+    assert remote_restore.call_count == 1
+
+    # Warm workers are used without copying the template
+    mock_db[f"{db_name}__pool_gw1"] = "pgclone-pool:key.dump"
+    testing.db.psql.reset_mock()
+    testing.setup("prefix", worker="gw1", pre_swap_hooks=[])
+    assert not testing.db.psql.called
+
+    with pytest.raises(exceptions.ValueError, match="Must provide a dump key"):
+        testing.setup()
+
+
+def test_teardown(mock_db, mocker):
+    worker_name = "test__pool_gw0"
+    mocker.patch("pgclone.db.conf", autospec=True, side_effect=lambda using: {"NAME": worker_name})
+    mock_db["test__template"] = "pgclone-template:key.dump"
+
+    # Worker databases are re-created from the template for the next session
+    testing.teardown()
+    testing.db.drop.assert_called_once_with({"NAME": "test__pool_gw0"}, using="default")
+    assert testing.db.psql.call_args.args[0] == (
+        'CREATE DATABASE "test__pool_gw0" WITH TEMPLATE "test__template"'
+    )
+    assert mock_db["test__pool_gw0"] == "pgclone-pool:key.dump"
+
+    testing.db.drop.reset_mock()
+    testing.db.psql.reset_mock()
+    testing.teardown(recycle=False)
+    testing.db.drop.assert_called_once_with({"NAME": "test__pool_gw0"}, using="default")
+    assert not testing.db.psql.called
+
+    # Databases that weren't set up are never dropped
+    testing.db.drop.reset_mock()
+    worker_name = "test"
+    with pytest.raises(exceptions.RuntimeError, match='"test" is not a test database'):
+        testing.teardown()
+
+    worker_name = "other__pool_gw0"
+    with pytest.raises(exceptions.RuntimeError, match="not a test database"):
+        testing.teardown(recycle=False)
+    assert not testing.db.drop.called
+
+
+def test_discover_runner(mocker, settings):
+    settings.PGCLONE_TEST_DUMP_KEY = "prefix"
+    settings.PGCLONE_TEST_WORKER = "gw0"
+    setup = mocker.patch.object(testing, "setup", autospec=True)
+    teardown = mocker.patch.object(testing, "teardown", autospec=True)
+
+    runner = testing.DiscoverRunner()
+    old_config = runner.setup_databases()
+    setup.assert_called_once_with("prefix", worker="gw0")
+
+    runner.teardown_databases(old_config)
+    teardown.assert_called_once_with()
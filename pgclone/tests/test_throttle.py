@@ -0,0 +1,62 @@
+import pytest
+
+from pgclone import exceptions, run, throttle
+
+
+def test_niced(mocker):
+    which = mocker.patch("shutil.which", autospec=True, return_value="/usr/bin/ionice")
+    assert throttle.niced("pg_dump", None) == "pg_dump"
+    assert throttle.niced("pg_dump", 10) == "nice -n 10 ionice -c 2 -n 7 pg_dump"
+
+    which.return_value = None
+    assert throttle.niced("pg_dump", 10) == "nice -n 10 pg_dump"
+
+
+def test_bucket(mocker):
+    sleep = mocker.patch("time.sleep", autospec=True)
+    mocker.patch("time.monotonic", autospec=True, return_value=0)
+
+    bucket = throttle._Bucket(100)
+    bucket.throttle(100)
+    assert not sleep.called
+
+    # Sending more than the rate sleeps until the bytes are allowed
+    bucket.throttle(50)
+    sleep.assert_called_once_with(0.5)
+
+    throttle._Bucket(None).throttle(1000)
+    assert sleep.call_count == 1
+
+
+def test_health(mocker):
+    query = mocker.patch("pgclone.db.query", autospec=True, return_value=[[10]])
+    monotonic = mocker.patch("time.monotonic", autospec=True, return_value=0)
+    bucket = throttle._Bucket(None)
+    health = throttle._Health(bucket, query="SELECT 1", threshold=5, database={})
+
+    # Unhealthy databases halve the measured rate
+    monotonic.return_value = 5
+    health.update(5 * 1024 * 1024)
+    assert bucket.rate == 512 * 1024
+
+    # Healthy databases gradually remove the limit
+    query.return_value = [[1]]
+    monotonic.return_value = 10
+    health.update(5 * 512 * 1024)
+    assert bucket.rate == 768 * 1024
+    monotonic.return_value = 15
+    health.update(5 * 384 * 1024)
+    assert bucket.rate is None
+
+
+def test_pump(tmpdir):
+    path = tmpdir.join("dump")
+    run.pipe(
+        "head -c 200000 /dev/zero",
+        f"cat > {path.strpath}",
+        pump=throttle.pump(rate_limit=1024 * 1024 * 1024),
+    )
+    assert path.size() == 200000
+
+    with pytest.raises(exceptions.RuntimeError):
+        run.pipe("exit 1", f"cat > {path.strpath}", pump=throttle.pump(rate_limit=1024))
@@ -0,0 +1,118 @@
+"""
+Throttles dumps so that they don't affect live traffic on the dumped database.
+
+The output of pg_dump is pumped into the storage uploader at a limited rate.
+Since pg_dump blocks when its output isn't consumed, the database server
+process serving it is throttled as well. When a health query is provided,
+the rate is halved whenever its result is over a threshold and gradually
+restored once it recovers.
+"""
+
+import shutil
+import time
+
+from pgclone import db, logging
+
+# The number of bytes read from pg_dump at a time
+_CHUNK_SIZE = 64 * 1024
+# The minimum rate when backing off, in bytes per second
+_MIN_RATE = 64 * 1024
+# How often the health query runs, in seconds
+_HEALTH_INTERVAL = 5
+
+
+def niced(cmd, nice):
+    """Run a shell command with a lower CPU and IO priority"""
+    if nice is None:
+        return cmd
+
+    # ionice is only available on Linux. Use the lowest best-effort IO priority
+    # instead of the idle class, which can starve the command entirely
+    ionice = "ionice -c 2 -n 7 " if shutil.which("ionice") else ""
+    return f"nice -n {int(nice)} {ionice}{cmd}"
+
+
+class _Bucket:
+    """A token bucket allowing a burst of up to one second of data"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.allowance = rate or 0
+        self.last = time.monotonic()
+
+    def throttle(self, num_bytes):
+        if not self.rate:
+            return
+
+        now = time.monotonic()
+        self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+        self.last = now
+        self.allowance -= num_bytes
+        if self.allowance < 0:
+            time.sleep(-self.allowance / self.rate)
+
+
+class _Health:
+    """Adjusts the rate of a bucket based on the result of a health query"""
+
+    def __init__(self, bucket, *, query, threshold, database):
+        self.bucket = bucket
+        self.max_rate = bucket.rate
+        self.query = query
+        self.threshold = threshold
+        self.database = database
+        self.last_check = time.monotonic()
+        self.num_bytes = 0
+
+    def update(self, num_bytes):
+        self.num_bytes += num_bytes
+        elapsed = time.monotonic() - self.last_check
+        if elapsed < _HEALTH_INTERVAL:
+            return
+
+        value = db.query(self.query, database=self.database)[0][0]
+        measured_rate = self.num_bytes / elapsed
+        if value is not None and value > self.threshold:
+            self.bucket.rate = max(_MIN_RATE, (self.bucket.rate or measured_rate) / 2)
+            logging.success_msg(
+                f"Health query returned {value}. Throttling dump to"
+                f" {int(self.bucket.rate)} bytes per second"
+            )
+        elif self.bucket.rate and self.bucket.rate != self.max_rate:
+            self.bucket.rate *= 1.5
+            if self.max_rate and self.bucket.rate >= self.max_rate:
+                self.bucket.rate = self.max_rate
+            elif not self.max_rate and self.bucket.rate >= 2 * measured_rate:
+                # The dump is no longer limited by the throttle
+                self.bucket.rate = None
+
+        self.last_check = time.monotonic()
+        self.num_bytes = 0
+
+
+def pump(*, rate_limit=None, health_query=None, health_threshold=None, database=None):
+    """
+    Return a pump for `run.pipe` that copies the output of a command at a limited rate.
+
+    Args:
+        rate_limit: The maximum bytes per second or None for no limit.
+        health_query: A query returning a number that is higher when the database
+            is less healthy.
+        health_threshold: The result of the health query over which the rate backs off.
+        database: The database configuration to run the health query on.
+    """
+
+    def _pump(in_stream, out_stream):
+        bucket = _Bucket(rate_limit)
+        health = (
+            _Health(bucket, query=health_query, threshold=health_threshold, database=database)
+            if health_query
+            else None
+        )
+        for chunk in iter(lambda: in_stream.read1(_CHUNK_SIZE), b""):
+            out_stream.write(chunk)
+            bucket.throttle(len(chunk))
+            if health:
+                health.update(len(chunk))
+
+    return _pump